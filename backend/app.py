@@ -1,18 +1,51 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file
 import logging
+import click
 from flask_cors import CORS
 import os
 import sqlite3
 import json
-from typing import Any, Dict, List, Optional, Tuple, cast
+import csv
+import io
+import re
+import time
+import base64
+from urllib.parse import quote
+import hashlib
+import mimetypes
+import shutil
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, cast
 from werkzeug.security import check_password_hash
 from werkzeug.security import generate_password_hash
+from werkzeug.security import safe_join
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import uuid4
 
-load_dotenv(override=True)
+import gzip
+from flask.json.provider import DefaultJSONProvider
+
+import attachments
+import cache
+import metrics
+import previews
+import migrations
+from db_pool import ConnectionPool
+
+try:
+    import orjson  # optional: faster JSON encoding for large listings
+except ImportError:
+    orjson = None
+try:
+    import brotli  # optional: offered to clients that accept br
+except ImportError:
+    brotli = None
+
+# DOTENV_OVERRIDE=0 lets the process environment win over backend/.env (the tests set it)
+load_dotenv(override=os.getenv('DOTENV_OVERRIDE', '1') == '1')
 logging.basicConfig(level=logging.INFO)
 
 DB_TYPE = os.getenv('DB_TYPE', 'sqlite')
@@ -28,10 +61,26 @@ CLOSE_STEPS = [
     {'key': 'lms', 'label': 'LMS Void Approval', 'role': 'LMS Void Approval'},
 ]
 
+# Page size for GET /api/close-contracts when a client passes limit/cursor
+CLOSE_LIST_DEFAULT_LIMIT = int(os.getenv('CLOSE_LIST_DEFAULT_LIMIT', '50'))
+CLOSE_LIST_MAX_LIMIT = int(os.getenv('CLOSE_LIST_MAX_LIMIT', '500'))
+
 def now_iso():
     return datetime.utcnow().isoformat() + 'Z'
 
-def get_sqlite_conn():
+def _to_int(v):
+    try:
+        return int(v) if v not in (None, '') else None
+    except Exception:
+        return None
+
+def _to_float(v):
+    try:
+        return float(v) if v not in (None, '') else None
+    except Exception:
+        return None
+
+def _sqlite_db_path():
     db_path = os.getenv('SQLITE_PATH', 'users.db')
     # If a relative path is provided, resolve it relative to this file (backend folder)
     if not os.path.isabs(db_path):
@@ -43,11 +92,34 @@ def get_sqlite_conn():
             os.makedirs(db_dir, exist_ok=True)
         except Exception:
             pass
-    conn = sqlite3.connect(db_path)
+    return db_path
+
+
+# SQLITE_PROFILE=production: WAL, synchronous=NORMAL, larger cache/mmap and queued writers
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'default').lower()
+if SQLITE_PROFILE not in ('default', 'production'):
+    raise RuntimeError(f'SQLITE_PROFILE must be default or production, not {SQLITE_PROFILE!r}')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', str(64 * 1024)))
+
+
+def _connect_sqlite(db_path):
+    # pooled connections move between request threads, one borrower at a time
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    if SQLITE_PROFILE == 'production':
+        # journal_mode is stored in the database file; the rest is per connection
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KB}')
+        conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
-def get_mysql_conn():
+
+def _connect_mysql():
     import mysql.connector
     host = os.getenv('DB_HOST', '127.0.0.1')
     port = int(os.getenv('DB_PORT', '3308'))
@@ -58,187 +130,130 @@ def get_mysql_conn():
     return conn
 
 
+def _ping_sqlite(conn):
+    conn.execute('SELECT 1').fetchall()
+
+
+def _ping_mysql(conn):
+    # reconnect=False: a dead connection is dropped and replaced by the pool
+    conn.ping(reconnect=False)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(kind: str) -> ConnectionPool:
+    pool = _pools.get(kind)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == 'mysql':
+                factory, ping = _connect_mysql, _ping_mysql
+            else:
+                db_path = _sqlite_db_path()
+                factory, ping = (lambda: _connect_sqlite(db_path)), _ping_sqlite
+            pool = ConnectionPool(
+                kind, factory, ping,
+                size=int(os.getenv('DB_POOL_SIZE', '5')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                max_idle=float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+                ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30')),
+                on_acquire=_observe_acquire if METRICS_ENABLED or SERVER_TIMING else None,
+                on_query=_observe_query if METRICS_ENABLED or SERVER_TIMING else None,
+                writer_lock=kind == 'sqlite' and SQLITE_PROFILE == 'production',
+                on_writer_wait=_observe_writer_wait if METRICS_ENABLED or SERVER_TIMING else None,
+            )
+            _pools[kind] = pool
+    return pool
+
+
+def get_sqlite_conn():
+    """Borrow a pooled SQLite connection; ``conn.close()`` returns it to the pool."""
+    return _get_pool('sqlite').connection()
+
+
+def get_mysql_conn():
+    """Borrow a pooled MySQL connection; ``conn.close()`` returns it to the pool."""
+    return _get_pool('mysql').connection()
+
+
+def get_conn():
+    return get_mysql_conn() if DB_TYPE.lower() == 'mysql' else get_sqlite_conn()
+
+
+def _dialect() -> str:
+    return 'mysql' if DB_TYPE.lower() == 'mysql' else 'sqlite'
+
+
 def ensure_close_contract_tables():
-    """Create tables for close contract approvals if they do not exist."""
-    if DB_TYPE.lower() == 'mysql':
-        import mysql.connector
-        conn = get_mysql_conn()
-        cur = conn.cursor()
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_forms (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            collection_type VARCHAR(255),
-            contract_no VARCHAR(255) NOT NULL,
-            person_in_charge VARCHAR(255),
-            manager_in_charge VARCHAR(255),
-            last_contract_info TEXT,
-            paid_term INT,
-            total_term INT,
-            full_paid_date VARCHAR(64),
-            s_count INT,
-            a_count INT,
-            b_count INT,
-            c_count INT,
-            f_count INT,
-            principal_remaining DECIMAL(18,2),
-            interest_remaining DECIMAL(18,2),
-            penalty_remaining DECIMAL(18,2),
-            others_remaining DECIMAL(18,2),
-            principal_willing DECIMAL(18,2),
-            interest_willing DECIMAL(18,2),
-            interest_months INT,
-            penalty_willing DECIMAL(18,2),
-            others_willing DECIMAL(18,2),
-            remark TEXT,
-            attachment_url TEXT,
-            status VARCHAR(64),
-            current_step VARCHAR(64),
-            created_by_email VARCHAR(255),
-            created_by_id INT,
-            created_at VARCHAR(64),
-            updated_at VARCHAR(64)
-        )
-        ''')
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_actions (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            request_id INT NOT NULL,
-            step_key VARCHAR(64) NOT NULL,
-            step_label VARCHAR(255) NOT NULL,
-            role VARCHAR(255),
-            result VARCHAR(64) NOT NULL,
-            comment TEXT,
-            actor_email VARCHAR(255),
-            actor_id INT,
-            actor_name VARCHAR(255),
-            acted_at VARCHAR(64),
-            attachments TEXT,
-            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
-        )
-        ''')
-        # add attachments column if missing (MySQL)
-        try:
-            cur.execute('ALTER TABLE close_contract_actions ADD COLUMN attachments TEXT')
-        except Exception:
-            pass
-        # comments table for free-form user comments on a request
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_comments (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            request_id INT NOT NULL,
-            user_id INT,
-            user_email VARCHAR(255),
-            user_name VARCHAR(255),
-            text TEXT NOT NULL,
-            created_at VARCHAR(64),
-            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
-        )
-        ''')
-        conn.commit()
-        cur.close()
-        conn.close()
-    else:
-        conn = get_sqlite_conn()
-        cur = conn.cursor()
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_forms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            collection_type TEXT,
-            contract_no TEXT NOT NULL,
-            person_in_charge TEXT,
-            manager_in_charge TEXT,
-            last_contract_info TEXT,
-            paid_term INTEGER,
-            total_term INTEGER,
-            full_paid_date TEXT,
-            s_count INTEGER,
-            a_count INTEGER,
-            b_count INTEGER,
-            c_count INTEGER,
-            f_count INTEGER,
-            principal_remaining REAL,
-            interest_remaining REAL,
-            penalty_remaining REAL,
-            others_remaining REAL,
-            principal_willing REAL,
-            interest_willing REAL,
-            interest_months INTEGER,
-            penalty_willing REAL,
-            others_willing REAL,
-            remark TEXT,
-            attachment_url TEXT,
-            status TEXT,
-            current_step TEXT,
-            created_by_email TEXT,
-            created_by_id INTEGER,
-            created_at TEXT,
-            updated_at TEXT
-        )
-        ''')
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_actions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            request_id INTEGER NOT NULL,
-            step_key TEXT NOT NULL,
-            step_label TEXT NOT NULL,
-            role TEXT,
-            result TEXT NOT NULL,
-            comment TEXT,
-            actor_email TEXT,
-            actor_id INTEGER,
-            actor_name TEXT,
-            acted_at TEXT,
-            attachments TEXT,
-            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
-        )
-        ''')
-        # add attachments column if missing (SQLite)
-        try:
-            cur.execute('ALTER TABLE close_contract_actions ADD COLUMN attachments TEXT')
-        except Exception:
-            pass
-        # comments table for free-form user comments on a request
-        cur.execute('''
-        CREATE TABLE IF NOT EXISTS close_contract_comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            request_id INTEGER NOT NULL,
-            user_id INTEGER,
-            user_email TEXT,
-            user_name TEXT,
-            text TEXT NOT NULL,
-            created_at TEXT,
-            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
-        )
-        ''')
-        conn.commit()
+    """Apply any pending schema migrations (tables and indexes, see migrations.py)."""
+    conn = get_conn()
+    try:
+        applied = migrations.upgrade(conn, _dialect())
+    finally:
         conn.close()
+    if applied:
+        logging.info('Applied schema migrations: %s', applied)
+
+
+# CLOSE_STEPS never changes at runtime; these lookups are built once
+_STEPS_BY_KEY: Dict[str, Dict[str, Any]] = {s['key']: s for s in CLOSE_STEPS}
+_NEXT_STEP_KEY: Dict[str, Optional[str]] = {
+    s['key']: (CLOSE_STEPS[i + 1]['key'] if i + 1 < len(CLOSE_STEPS) else None) for i, s in enumerate(CLOSE_STEPS)
+}
+_STEP_KEY_BY_ROLE: Dict[str, str] = {}
+for _s in CLOSE_STEPS:
+    _STEP_KEY_BY_ROLE.setdefault(_s.get('role', '').lower(), _s['key'])
+del _s
 
 
 def _step_by_key(key: Optional[str]) -> Optional[Dict[str, Any]]:
-    for s in CLOSE_STEPS:
-        if s['key'] == key:
-            return s
-    return None
+    return _STEPS_BY_KEY.get(key) if key is not None else None
 
 
 def _next_step_key(current: Optional[str]) -> Optional[str]:
-    keys = [s['key'] for s in CLOSE_STEPS]
     if current is None:
         return 'submit'
-    if current not in keys:
-        return None
-    idx = keys.index(current)
-    return keys[idx + 1] if idx + 1 < len(keys) else None
+    return _NEXT_STEP_KEY.get(current)
 
 
 def _step_key_for_role(role: str | None):
     if not role:
         return None
-    role_lower = role.lower()
-    for s in CLOSE_STEPS:
-        if s.get('role', '').lower() == role_lower:
-            return s.get('key')
-    return None
+    return _STEP_KEY_BY_ROLE.get(role.lower())
+
+
+ACTION_RESULTS = ('approve', 'reject', 'send_back')
+FINAL_STATUSES = ('approved', 'rejected')
+
+
+def _compute_transition(step_key: Optional[str], result: str) -> Tuple[str, Optional[str]]:
+    """Return ``(new_status, new_step_key)`` after ``result`` is recorded at ``step_key``."""
+    if result == 'approve':
+        nxt = _next_step_key(step_key)
+        if nxt:
+            return 'under_review', nxt
+        return 'approved', step_key
+    if result == 'reject':
+        return 'rejected', step_key
+    if result == 'send_back':
+        return 'sent_back', 'submit'
+    return 'under_review', step_key
+
+
+def _attachments_json(value) -> Optional[str]:
+    attachments = value or []
+    if isinstance(attachments, str):
+        try:
+            parsed = json.loads(attachments)
+            if isinstance(parsed, list):
+                attachments = parsed
+        except Exception:
+            attachments = [a.strip() for a in attachments.split(',') if a.strip()]
+    return json.dumps(attachments) if attachments else None
 
 
 def close_contract_row_to_dict(row):
@@ -263,6 +278,28 @@ def close_contract_row_to_dict(row):
     return d
 
 def query_user(email: str) -> Optional[Dict[str, Any]]:
+    """Full user row (including ``password_hash``) by email, read from the database every time."""
+    # login and token checks use this: a cached row would keep an old password or a deleted
+    # user valid on other workers until it expired, so credentials are never cached
+    return _load_user_by_email(email)
+
+
+def query_all_users() -> List[Dict[str, Any]]:
+    return [dict(r) for r in _user_cache.get_or_load('all', _load_all_users)]
+
+
+def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    # cached rows never include password_hash (see _load_user_by_id)
+    row = _user_cache.get_or_load(f'id:{user_id}', lambda: _load_user_by_id(user_id))
+    return dict(row) if row is not None else None
+
+
+def _users_changed():
+    # a write can change any key (email, id, the full list); user writes are rare, so drop them all
+    _user_cache.clear()
+
+
+def _load_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     if DB_TYPE.lower() == 'mysql':
         conn = get_mysql_conn()
         cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
@@ -281,7 +318,7 @@ def query_user(email: str) -> Optional[Dict[str, Any]]:
         return dict(row) if row is not None else None
 
 
-def query_all_users() -> List[Dict[str, Any]]:
+def _load_all_users() -> List[Dict[str, Any]]:
     select_cols = 'id, email, role, department, staff_no, first_name, last_name, nickname, under_manager, last_login, status'
     if DB_TYPE.lower() == 'mysql':
         conn = get_mysql_conn()
@@ -300,7 +337,7 @@ def query_all_users() -> List[Dict[str, Any]]:
         return [dict(r) for r in rows]
 
 
-def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+def _load_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
     if DB_TYPE.lower() == 'mysql':
         conn = get_mysql_conn()
         cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
@@ -318,35 +355,624 @@ def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
         return dict(row) if row is not None else None
 
 
+class _JSONProvider(DefaultJSONProvider):
+    """Unsorted keys, and orjson for encoding when it is installed."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        # datetimes go through Flask's default so they keep the same format either way
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+
 app = Flask(__name__)
-CORS(app)
-ensure_close_contract_tables()
+app.json = _JSONProvider(app)
+# expose ETag so browser clients can send it back in If-None-Match, and the
+# resumable upload headers
+CORS(app, expose_headers=['ETag', 'Location', 'Upload-Offset', 'Upload-Length'])
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or os.urandom(32)
+if not os.getenv('SECRET_KEY'):
+    logging.warning('SECRET_KEY is not set; login tokens will only be valid in this process')
+
+# Prometheus metrics at GET /metrics; SERVER_TIMING=1 adds a Server-Timing header
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+# when set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+_metrics = metrics.Registry()
+_REQUEST_SECONDS = _metrics.histogram(
+    'http_request_duration_seconds', 'Time to produce a response (a streamed body is not included)', ('method', 'route', 'status'))
+_SPAN_SECONDS = _metrics.histogram(
+    'http_request_span_seconds', 'Time per request spent in the database, acquiring connections and named handler sections', ('route', 'span'))
+_QUERY_SECONDS = _metrics.histogram(
+    'db_query_duration_seconds', 'Statement execute plus fetch time by SQL fingerprint', ('query',),
+    max_series=metrics.QUERY_MAX_SERIES)
+_QUERY_ROWS = _metrics.histogram(
+    'db_query_rows', 'Rows returned per statement by SQL fingerprint', ('query',), buckets=metrics.ROW_BUCKETS,
+    max_series=metrics.QUERY_MAX_SERIES)
+# query label -> normalized SQL, exported as db_query_info so a label can be read back as a statement
+_query_sql: Dict[str, str] = {}
+_metrics.gauge(
+    'db_query_info', 'Normalized SQL behind each query label of the db_query_* histograms (always 1)', ('query', 'sql'),
+    collect=lambda: [({'query': q, 'sql': sql}, 1) for q, sql in list(_query_sql.items())])
+_ACQUIRE_SECONDS = _metrics.histogram(
+    'db_pool_acquire_seconds', 'Time to borrow a connection from the pool', ('pool',))
+_WRITER_WAIT_SECONDS = _metrics.histogram(
+    'db_writer_wait_seconds', 'Time a write transaction queued for the writer lock', ('pool',))
+_CACHE_LOOKUPS = _metrics.counter(
+    'cache_lookups_total', 'Read-through cache lookups by cache and result (hit/miss)', ('cache', 'result'))
+_metrics.gauge(
+    'cache_hit_ratio', 'Share of lookups answered from the cache since the process started', ('cache',),
+    collect=lambda: [({'cache': c.name}, c.stats()['hit_rate']) for c in _caches])
+_metrics.gauge(
+    'db_pool_connections', 'Pooled connections by state', ('pool', 'state'),
+    collect=lambda: [({'pool': st['name'], 'state': state}, st[state])
+                     for st in (p.stats() for p in list(_pools.values())) for state in ('in_use', 'idle')])
+
+
+def _observe_query(sql: str, seconds: float, rows: int):
+    query = metrics.fingerprint(sql)
+    if query not in _query_sql and len(_query_sql) < metrics.QUERY_MAX_SERIES:
+        _query_sql[query] = metrics.normalize(sql)
+    _QUERY_SECONDS.observe(seconds, query=query)
+    _QUERY_ROWS.observe(rows, query=query)
+    timer = metrics.current_timer()
+    if timer is not None:
+        timer.add('db', seconds)
+
+
+def _observe_acquire(pool_name: str, seconds: float):
+    _ACQUIRE_SECONDS.observe(seconds, pool=pool_name)
+    timer = metrics.current_timer()
+    if timer is not None:
+        timer.add('acquire', seconds)
+
+
+def _observe_writer_wait(pool_name: str, seconds: float):
+    _WRITER_WAIT_SECONDS.observe(seconds, pool=pool_name)
+    timer = metrics.current_timer()
+    if timer is not None:
+        timer.add('writer', seconds)
+
+
+def _observe_cache_lookup(name: str, hit: bool):
+    _CACHE_LOOKUPS.inc(cache=name, result='hit' if hit else 'miss')
+
+
+# per-process user row cache (USER_CACHE_TTL=0 disables); CACHE_BACKEND=module:factory for a shared store
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+_cache_backend = cache.load_backend(os.getenv('CACHE_BACKEND', 'memory'), USER_CACHE_MAX_ENTRIES)
+_user_cache = cache.Cache('users', _cache_backend, USER_CACHE_TTL,
+                          on_lookup=_observe_cache_lookup if METRICS_ENABLED else None)
+_caches = [_user_cache]
+
+
+@app.before_request
+def _start_request_timer():
+    if METRICS_ENABLED or SERVER_TIMING:
+        metrics.start_timer()
+
+
+@app.after_request
+def _record_request_metrics(resp):
+    # registered before _compress_response, so it runs after it and includes compression
+    timer = metrics.current_timer()
+    if timer is None:
+        return resp
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if METRICS_ENABLED:
+        _REQUEST_SECONDS.observe(timer.elapsed(), method=request.method, route=route, status=resp.status_code)
+        for name, (seconds, _) in timer.parts.items():
+            _SPAN_SECONDS.observe(seconds, route=route, span=name)
+    if SERVER_TIMING:
+        resp.headers['Server-Timing'] = timer.server_timing()
+    return resp
+
+
+@app.teardown_request
+def _stop_request_timer(exc):
+    metrics.stop_timer()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Not found'}), 404
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return app.response_class(_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# `flask --app app db upgrade` migrates; each worker checks the version once (DB_AUTO_MIGRATE=1 upgrades in place)
+_schema_checked = False
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema_current():
+    global _schema_checked
+    if _schema_checked:
+        return None
+    with _schema_lock:
+        if _schema_checked:
+            return None
+        conn = get_conn()
+        try:
+            version = migrations.current_version(conn, _dialect())
+        finally:
+            conn.close()
+        if version < migrations.LATEST_VERSION:
+            if os.getenv('DB_AUTO_MIGRATE', '1') == '1':
+                ensure_close_contract_tables()
+            else:
+                logging.error('Database schema is at version %s, expected %s; run `flask --app app db upgrade`', version, migrations.LATEST_VERSION)
+                return jsonify({'error': 'Database schema is out of date'}), 503
+        _schema_checked = True
+    return None
+
+
+@app.before_request
+def _check_schema_before_request():
+    return _ensure_schema_current()
+
+
+@app.cli.group('db')
+def db_cli():
+    """Database schema commands."""
+
+
+@db_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Stop at this migration version.')
+def db_upgrade_command(target):
+    """Apply pending schema migrations."""
+    conn = get_conn()
+    try:
+        applied = migrations.upgrade(conn, _dialect(), target)
+        version = migrations.current_version(conn, _dialect())
+    finally:
+        conn.close()
+    click.echo(f'Applied: {applied or "nothing"}; schema version is now {version}')
+
+
+@db_cli.command('version')
+def db_version_command():
+    """Show the applied and latest schema versions."""
+    conn = get_conn()
+    try:
+        version = migrations.current_version(conn, _dialect())
+    finally:
+        conn.close()
+    click.echo(f'Schema version {version} (latest {migrations.LATEST_VERSION})')
+
+
+@app.teardown_request
+def _return_leaked_connections(exc):
+    # a handler that raised before conn.close() must not shrink the pool
+    for pool in list(_pools.values()):
+        if pool.release_current():
+            logging.warning('%s pool: connection was not closed by %s', pool.name, request.path)
+
+
+# responses smaller than this are sent uncompressed (0 disables compression)
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
+_COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml'}
+
+
+@app.after_request
+def _compress_response(resp):
+    """gzip (or brotli when installed) for buffered text/JSON bodies the client accepts."""
+    if COMPRESS_MIN_BYTES <= 0 or request.method == 'HEAD':
+        return resp
+    if resp.direct_passthrough or resp.is_streamed or resp.status_code < 200 or resp.status_code in (204, 206, 304):
+        return resp
+    mimetype = resp.mimetype or ''
+    if not (mimetype.startswith('text/') or mimetype in _COMPRESSIBLE_MIMETYPES) or 'Content-Encoding' in resp.headers:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if not encoding:
+        return resp
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    if encoding == 'br':
+        resp.set_data(brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY))
+    else:
+        resp.set_data(gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL))
+    resp.headers['Content-Encoding'] = encoding
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        # the encoded bytes differ from the identity body, so the validator can only be weak
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+def _parse_fields(value: Optional[str], allowed: List[str], always: Tuple[str, ...] = ('id',)) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Columns named in a ``fields=a,b`` query param plus ``always``; ``(None, None)`` means all."""
+    if not value:
+        return None, None
+    wanted = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        return None, f'Unknown field(s): {", ".join(unknown)}'
+    return [f for f in allowed if f in wanted or f in always], None
+
+
+@app.cli.group('events')
+def events_cli():
+    """Approval event log commands."""
+
+
+@events_cli.command('prune')
+@click.option('--days', type=int, default=30, show_default=True, help='Keep events newer than this.')
+def events_prune_command(days):
+    """Delete old rows from close_contract_events (clients older than this cannot resume)."""
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat() + 'Z'
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'DELETE FROM close_contract_events WHERE created_at < {_ph()}', (cutoff,))
+        deleted = cur.rowcount
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    click.echo(f'Deleted {deleted} event(s) older than {cutoff}')
+
+
+UPLOAD_IMMUTABLE_MAX_AGE = int(os.getenv('UPLOAD_IMMUTABLE_MAX_AGE', str(365 * 24 * 3600)))
+# direct: this process streams the file (sendfile(2) via wsgi.file_wrapper where the server has it)
+# x-sendfile: Apache/lighttpd send it, x-accel-redirect: nginx sends it from UPLOAD_ACCEL_PREFIX
+UPLOAD_SERVE_MODE = os.getenv('UPLOAD_SERVE_MODE', 'direct').lower()
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/_uploads_internal/')
+if UPLOAD_SERVE_MODE not in ('direct', 'x-sendfile', 'x-accel-redirect'):
+    raise RuntimeError(f'UPLOAD_SERVE_MODE must be direct, x-sendfile or x-accel-redirect, not {UPLOAD_SERVE_MODE!r}')
+app.config['USE_X_SENDFILE'] = UPLOAD_SERVE_MODE == 'x-sendfile'
+
+
+def _send_upload(name: str, download_name: str, etag: Optional[str] = None):
+    """Send one file from UPLOAD_DIR; ``etag`` marks a content-addressed (immutable) file."""
+    path = safe_join(UPLOAD_DIR, name)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+    if UPLOAD_SERVE_MODE == 'x-accel-redirect':
+        resp = app.response_class(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+        resp.headers['Content-Disposition'] = f'inline; filename="{secure_filename(download_name) or name}"'
+        if etag:
+            resp.set_etag(etag)
+    else:
+        resp = send_file(path, download_name=download_name, conditional=True, etag=etag or True)
+    if etag:
+        resp.headers['Cache-Control'] = f'public, max-age={UPLOAD_IMMUTABLE_MAX_AGE}, immutable'
+    return resp
+
+
+# thumbnails / first-page previews, rendered in the background after upload
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+THUMBNAIL_QUEUE_MAX = int(os.getenv('THUMBNAIL_QUEUE_MAX', '200'))
+# how long a ?size= request waits for a variant that is still being rendered
+THUMBNAIL_WAIT_SECONDS = float(os.getenv('THUMBNAIL_WAIT_SECONDS', '2'))
+_preview_pool = previews.PreviewPool(workers=THUMBNAIL_WORKERS, max_pending=THUMBNAIL_QUEUE_MAX)
+if not previews.enabled():
+    logging.info('Pillow is not installed; ?size= previews fall back to the original upload')
+
+
+def _send_preview(stored_name: str, display: str, size: str):
+    variant = previews.variant_path(UPLOAD_DIR, stored_name, size)
+    if not os.path.exists(variant) and previews.can_render(stored_name) and os.path.exists(os.path.join(UPLOAD_DIR, stored_name)):
+        future = _preview_pool.schedule(UPLOAD_DIR, stored_name)
+        if future is not None:
+            try:
+                future.result(timeout=THUMBNAIL_WAIT_SECONDS)
+            except Exception:
+                pass
+    if os.path.exists(variant):
+        base = os.path.splitext(display)[0] or stored_name
+        return _send_upload(os.path.relpath(variant, UPLOAD_DIR), f'{base}-{size}.jpg',
+                            etag=f'{stored_name.split(".", 1)[0]}-{size}')
+    # not renderable (or not rendered yet): the original, without the immutable header
+    # so that a client asking again later gets the small version
+    resp = _send_upload(stored_name, display)
+    if isinstance(resp, tuple):
+        return resp
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
 
 
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
-    return send_from_directory(UPLOAD_DIR, filename)
+    if any(part.startswith('.') for part in filename.split('/')):
+        # scratch space, rendered variants and other internal files
+        return jsonify({'error': 'Not found'}), 404
+    size = request.args.get('size')
+    if size is not None and size not in previews.SIZES:
+        return jsonify({'error': f'size must be one of: {", ".join(previews.SIZES)}'}), 400
+    stored_name, _, display = filename.partition('/')
+    if attachments.is_stored_name(stored_name):
+        if size:
+            return _send_preview(stored_name, display or stored_name, size)
+        # the name is the content hash, so it doubles as a strong validator
+        return _send_upload(stored_name, display or stored_name, etag=stored_name.split('.', 1)[0])
+    return _send_upload(filename, os.path.basename(filename))
+
+
+def _attachment_reference_counts(conn) -> Dict[str, int]:
+    """Count references to stored uploads from forms and actions (full scan)."""
+    counts: Dict[str, int] = {}
+    for sql in ('SELECT attachment_url FROM close_contract_forms WHERE attachment_url IS NOT NULL',
+                'SELECT attachments FROM close_contract_actions WHERE attachments IS NOT NULL'):
+        cur = conn.cursor()
+        cur.execute(sql)
+        while True:
+            batch = cur.fetchmany(1000)
+            if not batch:
+                break
+            for r in batch:
+                for url in _attachment_url_list(r[0]):
+                    name = attachments.stored_name_from_url(url)
+                    if name:
+                        counts[name] = counts.get(name, 0) + 1
+        cur.close()
+    return counts
+
+
+def _sync_attachment_refs(conn) -> List[Dict[str, Any]]:
+    """Reset ``attachments.ref_count`` from the actual references; returns the metadata rows."""
+    counts = _attachment_reference_counts(conn)
+    rows = _query_dicts(conn, 'SELECT stored_name, size, ref_count, created_at FROM attachments')
+    fixes = [(counts.get(r['stored_name'], 0), r['stored_name']) for r in rows if int(r['ref_count']) != counts.get(r['stored_name'], 0)]
+    if fixes:
+        ph = _ph()
+        cur = conn.cursor()
+        cur.executemany(f'UPDATE attachments SET ref_count = {ph} WHERE stored_name = {ph}', fixes)
+        conn.commit()
+        cur.close()
+        logging.info('Corrected ref_count of %d attachment(s)', len(fixes))
+    for r in rows:
+        r['ref_count'] = counts.get(r['stored_name'], 0)
+    return rows
+
+
+@app.cli.group('uploads')
+def uploads_cli():
+    """Attachment store commands."""
+
+
+@uploads_cli.command('gc')
+@click.option('--grace-hours', type=float, default=24.0, show_default=True,
+              help='Keep unreferenced files younger than this (uploads whose form is still being saved).')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def uploads_gc_command(grace_hours, dry_run):
+    """Recount references and delete stored files nothing points to."""
+    cutoff = (datetime.utcnow() - timedelta(hours=grace_hours)).isoformat() + 'Z'
+    conn = get_conn()
+    try:
+        rows = _sync_attachment_refs(conn)
+        doomed = [r for r in rows if r['ref_count'] == 0 and (r['created_at'] or '') < cutoff]
+        if doomed and not dry_run:
+            for r in doomed:
+                path = os.path.join(UPLOAD_DIR, r['stored_name'])
+                if os.path.exists(path):
+                    os.remove(path)
+                previews.discard(UPLOAD_DIR, r['stored_name'])
+            cur = conn.cursor()
+            cur.executemany(f'DELETE FROM attachments WHERE stored_name = {_ph()} AND ref_count = 0', [(r['stored_name'],) for r in doomed])
+            conn.commit()
+            cur.close()
+    finally:
+        conn.close()
+    stale = attachments.prune_scratch(UPLOAD_DIR, grace_hours * 3600, dry_run=dry_run)
+    verb = 'Would delete' if dry_run else 'Deleted'
+    click.echo(f'{verb} {len(doomed)} unreferenced file(s) ({sum(int(r["size"]) for r in doomed)} bytes) '
+               f'and {stale} stale partial upload(s)')
+
+
+@uploads_cli.command('previews')
+@click.option('--force', is_flag=True, help='Render again even if the variants exist.')
+def uploads_previews_command(force):
+    """Render missing thumbnails/previews of stored uploads (e.g. after dedupe or an upgrade)."""
+    if not previews.enabled():
+        raise click.ClickException('Pillow is not installed')
+    names = sorted(e.name for e in os.scandir(UPLOAD_DIR) if e.is_file() and attachments.is_stored_name(e.name))
+    rendered = failed = 0
+    for name in names:
+        if not previews.can_render(name):
+            continue
+        if not force and os.path.exists(previews.variant_path(UPLOAD_DIR, name, 'thumb')):
+            continue
+        try:
+            previews.render(UPLOAD_DIR, name)
+            rendered += 1
+        except Exception as e:
+            failed += 1
+            click.echo(f'{name}: {e}', err=True)
+    click.echo(f'Rendered previews of {rendered} file(s); {failed} failed')
+
+
+@uploads_cli.command('dedupe')
+@click.option('--dry-run', is_flag=True, help='Only report how much space would be saved.')
+def uploads_dedupe_command(dry_run):
+    """Move uuid-named legacy uploads into the content-addressed store and rewrite their URLs."""
+    legacy = sorted(e.name for e in os.scandir(UPLOAD_DIR)
+                    if e.is_file() and not e.name.startswith('.') and not attachments.is_stored_name(e.name)) if os.path.isdir(UPLOAD_DIR) else []
+    mapping: Dict[str, str] = {}
+    stored: Dict[str, Tuple[str, int]] = {}
+    for name in legacy:
+        path = os.path.join(UPLOAD_DIR, name)
+        sha256 = attachments.hash_file(path)
+        stored_name = sha256 + attachments.extension(name)
+        if not dry_run and stored_name not in stored:
+            scratch = attachments.tmp_path(UPLOAD_DIR)
+            shutil.copyfile(path, scratch)
+            attachments.place(UPLOAD_DIR, scratch, sha256, name)
+            _register_attachment(stored_name, sha256, os.path.getsize(path), name)
+        stored.setdefault(stored_name, (sha256, os.path.getsize(path)))
+        mapping[name] = attachments.url_for(stored_name, name)
+    saved = sum(os.path.getsize(os.path.join(UPLOAD_DIR, n)) for n in legacy) - sum(size for _, size in stored.values())
+    if dry_run:
+        click.echo(f'{len(legacy)} legacy file(s) would become {len(stored)} stored file(s), saving {saved} bytes')
+        return
+
+    def rewrite(url):
+        tail = url.rsplit('/uploads/', 1)[-1] if '/uploads/' in url else None
+        return mapping.get(tail, url) if tail else url
+
+    ph = _ph()
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        # old URLs are exactly what _save_attachment_if_any returned: /uploads/<name>
+        cur.executemany(f'UPDATE close_contract_forms SET attachment_url = {ph}, version = version + 1 WHERE attachment_url = {ph}',
+                        [(new, f'/uploads/{old}') for old, new in mapping.items()])
+        action_updates = []
+        form_ids: List[int] = []
+        for r in _query_dicts(conn, "SELECT id, request_id, attachments FROM close_contract_actions WHERE attachments LIKE '%/uploads/%'"):
+            urls = _attachment_url_list(r['attachments'])
+            new_urls = [rewrite(u) for u in urls]
+            if new_urls != urls:
+                action_updates.append((json.dumps(new_urls), r['id']))
+                if r['request_id'] not in form_ids:
+                    form_ids.append(r['request_id'])
+        if action_updates:
+            cur.executemany(f'UPDATE close_contract_actions SET attachments = {ph} WHERE id = {ph}', action_updates)
+        # the forms' responses changed with their actions' URLs, so their ETags and versions must too
+        for start in range(0, len(form_ids), _IN_BATCH_SIZE):
+            chunk = form_ids[start:start + _IN_BATCH_SIZE]
+            cur.execute(f'UPDATE close_contract_forms SET version = version + 1 WHERE id IN ({", ".join([ph] * len(chunk))})', chunk)
+        conn.commit()
+        cur.close()
+        _sync_attachment_refs(conn)
+    finally:
+        conn.close()
+    for name in legacy:
+        os.remove(os.path.join(UPLOAD_DIR, name))
+    click.echo(f'Moved {len(legacy)} legacy file(s) into {len(stored)} stored file(s), saved {saved} bytes; '
+               f'rewrote {len(action_updates)} action attachment list(s)')
+
+
+# Session tokens: a successful password login returns an HMAC-signed token so that
+# later logins (and _user_from_token callers) skip the deliberately slow password hash.
+LOGIN_TOKEN_TTL = int(os.getenv('LOGIN_TOKEN_TTL', str(7 * 24 * 3600)))
+_LOGIN_TOKEN_SALT = 'login-token'
+_password_hash_target: Optional[str] = None
+
+
+def _hash_password(password: str) -> str:
+    method = os.getenv('PASSWORD_HASH_METHOD')
+    return generate_password_hash(password, method) if method else generate_password_hash(password)
+
+
+def _hash_params(password_hash: str) -> str:
+    # werkzeug hashes look like "<method>:<params>$<salt>$<hash>"
+    return password_hash.split('$', 1)[0]
+
+
+def _password_needs_rehash(password_hash: str) -> bool:
+    global _password_hash_target
+    if _password_hash_target is None:
+        _password_hash_target = _hash_params(_hash_password('rehash-probe'))
+    return _hash_params(password_hash) != _password_hash_target
+
+
+def _password_fingerprint(password_hash: str) -> str:
+    # binds a token to the current password: changing it invalidates old tokens
+    return hashlib.sha256(password_hash.encode('utf-8')).hexdigest()[:16]
+
+
+def _token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt=_LOGIN_TOKEN_SALT)
+
+
+def _issue_login_token(row: Dict[str, Any]) -> str:
+    return _token_serializer().dumps({
+        'uid': row.get('id'),
+        'email': row.get('email'),
+        'pf': _password_fingerprint(str(row.get('password_hash', ''))),
+    })
+
+
+def _user_from_token(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Resolve a login token to its user row (HMAC check + one indexed lookup, no password hash)."""
+    if not token:
+        return None
+    try:
+        claims = _token_serializer().loads(token, max_age=LOGIN_TOKEN_TTL)
+    except (BadSignature, SignatureExpired):
+        return None
+    row = query_user(str(claims.get('email') or ''))
+    if not row or row.get('id') != claims.get('uid'):
+        return None
+    if _password_fingerprint(str(row.get('password_hash', ''))) != claims.get('pf'):
+        return None
+    return row
+
+
+def _bearer_token() -> Optional[str]:
+    auth = request.headers.get('Authorization', '')
+    if auth.lower().startswith('bearer '):
+        return auth[7:].strip() or None
+    return None
+
+
+def _rehash_password(user_id, password: str):
+    new_hash = _hash_password(password)
+    ph = _ph()
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'UPDATE users SET password_hash = {ph} WHERE id = {ph}', (new_hash, user_id))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    _users_changed()
+    return new_hash
 
 
 @app.route('/api/login', methods=['POST'])
 def login():
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     email = data.get('email')
     password = data.get('password')
-    if not email or not password:
-        return jsonify({'error': 'Email and password required'}), 400
+    token = data.get('token') or _bearer_token()
 
-    row = query_user(email)
-    if not row:
-        logging.warning('Login attempt for unknown email: %s', email)
-        return jsonify({'error': 'Invalid credentials'}), 401
+    if token and not password:
+        # re-login with a previously issued token: no password hashing at all
+        row = _user_from_token(token)
+        if not row:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+    else:
+        if not email or not password:
+            return jsonify({'error': 'Email and password required'}), 400
 
-    # row is a dict (converted for sqlite) when present
-    password_hash = str(row.get('password_hash', ''))
+        row = query_user(email)
+        if not row:
+            logging.warning('Login attempt for unknown email: %s', email)
+            return jsonify({'error': 'Invalid credentials'}), 401
 
-    if not check_password_hash(password_hash, password):
-        logging.warning('Failed password for email: %s', email)
-        return jsonify({'error': 'Invalid credentials'}), 401
+        # row is a dict (converted for sqlite) when present
+        password_hash = str(row.get('password_hash', ''))
+
+        if not check_password_hash(password_hash, password):
+            logging.warning('Failed password for email: %s', email)
+            return jsonify({'error': 'Invalid credentials'}), 401
+
+        # upgrade hashes created with older/weaker parameters while we have the plaintext
+        if _password_needs_rehash(password_hash):
+            try:
+                row['password_hash'] = _rehash_password(row.get('id'), password)
+                logging.info('Rehashed password for user id=%s', row.get('id'))
+            except Exception as e:
+                logging.warning('Password rehash failed for user id=%s: %s', row.get('id'), e)
+        token = _issue_login_token(row)
 
     # Authentication successful — return basic user info
     user_info = {
@@ -355,7 +981,21 @@ def login():
         'role': row.get('role', 'User'),
         'department': row.get('department')
     }
-    return jsonify({'ok': True, 'user': user_info})
+    return jsonify({'ok': True, 'user': user_info, 'token': token, 'token_expires_in': LOGIN_TOKEN_TTL})
+
+
+@app.route('/api/session', methods=['GET'])
+def session_info():
+    # cheap token check for clients resuming a session (Authorization: Bearer <token>)
+    row = _user_from_token(_bearer_token())
+    if not row:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    return jsonify({'ok': True, 'user': {
+        'id': row.get('id'),
+        'email': row.get('email'),
+        'role': row.get('role', 'User'),
+        'department': row.get('department')
+    }})
 
 
 @app.route('/api/debug/users', methods=['GET'])
@@ -382,6 +1022,69 @@ def debug_users():
         return jsonify({'users': [dict(r) for r in rows]})
 
 
+@app.route('/api/debug/pool', methods=['GET'])
+def debug_pool():
+    # connection pool counters (wait time, health-check failures, idle evictions)
+    if os.getenv('ENABLE_DEV_ENDPOINTS') != '1' and os.getenv('FLASK_ENV') != 'development':
+        return jsonify({'error': 'Not allowed'}), 403
+    return jsonify({'pools': [p.stats() for p in _pools.values()]})
+
+
+# Full-text search (tables/columns are defined in migrations.FULLTEXT_INDEXES)
+_FULLTEXT = {table: (fts, columns) for table, fts, columns in migrations.FULLTEXT_INDEXES}
+# InnoDB ignores words shorter than innodb_ft_min_token_size (default 3)
+MYSQL_FT_MIN_TOKEN = int(os.getenv('MYSQL_FT_MIN_TOKEN', '3'))
+
+
+def _fulltext_terms(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+def _fulltext_query(terms: List[str]) -> str:
+    # every word must match, each as a prefix ("adm" finds "admin")
+    if DB_TYPE.lower() == 'mysql':
+        return ' '.join(f'+{t}*' for t in terms)
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def _fulltext_usable(terms: List[str]) -> bool:
+    if not terms:
+        return False
+    return DB_TYPE.lower() != 'mysql' or min(len(t) for t in terms) >= MYSQL_FT_MIN_TOKEN
+
+
+def _fulltext_filter(table: str, text: str) -> Tuple[str, List[Any]]:
+    """WHERE clause restricting ``table`` to full-text matches, or LIKE when ``text`` has no indexable words."""
+    fts, columns = _FULLTEXT[table]
+    ph = _ph()
+    terms = _fulltext_terms(text)
+    if not _fulltext_usable(terms):
+        like = f'%{text}%'
+        return '(' + ' OR '.join(f'{c} LIKE {ph}' for c in columns) + ')', [like] * len(columns)
+    if DB_TYPE.lower() == 'mysql':
+        return f'MATCH({", ".join(columns)}) AGAINST ({ph} IN BOOLEAN MODE)', [_fulltext_query(terms)]
+    return f'id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH {ph})', [_fulltext_query(terms)]
+
+
+def _fulltext_search(conn, table: str, select_cols: str, text: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+    """Ranked matches from one table, best first, with a ``score`` column (higher is better)."""
+    fts, columns = _FULLTEXT[table]
+    terms = _fulltext_terms(text)
+    if not _fulltext_usable(terms):
+        return []
+    query = _fulltext_query(terms)
+    cols = ', '.join(f't.{c.strip()}' for c in select_cols.split(','))
+    if DB_TYPE.lower() == 'mysql':
+        match = f'MATCH({", ".join("t." + c for c in columns)}) AGAINST (%s IN BOOLEAN MODE)'
+        sql = f'SELECT {cols}, {match} AS score FROM {table} t WHERE {match} ORDER BY score DESC, t.id DESC LIMIT %s OFFSET %s'
+        return _query_dicts(conn, sql, [query, query, limit, offset])
+    # bm25() is lower-is-better; negate so both backends rank the same way
+    sql = (
+        f'SELECT {cols}, -bm25({fts}) AS score FROM {fts} JOIN {table} t ON t.id = {fts}.rowid '
+        f'WHERE {fts} MATCH ? ORDER BY bm25({fts}), t.id DESC LIMIT ? OFFSET ?'
+    )
+    return _query_dicts(conn, sql, [query, limit, offset])
+
 
 @app.route('/api/users', methods=['GET', 'POST'])
 def users_collection():
@@ -395,15 +1098,10 @@ def users_collection():
         where = []
         params = []
         if search:
-            # search in email, first_name, last_name, staff_no
-            if DB_TYPE.lower() == 'mysql':
-                where.append('(email LIKE %s OR first_name LIKE %s OR last_name LIKE %s OR staff_no LIKE %s)')
-                like = f'%{search}%'
-                params.extend([like, like, like, like])
-            else:
-                where.append('(email LIKE ? OR first_name LIKE ? OR last_name LIKE ? OR staff_no LIKE ?)')
-                like = f'%{search}%'
-                params.extend([like, like, like, like])
+            # search in email, first_name, last_name, staff_no via the full-text index
+            clause, clause_params = _fulltext_filter('users', search)
+            where.append(clause)
+            params.extend(clause_params)
         if department:
             if DB_TYPE.lower() == 'mysql':
                 where.append('department = %s')
@@ -420,6 +1118,11 @@ def users_collection():
                 params.append(status)
 
         select_cols = 'id, email, role, department, staff_no, first_name, last_name, nickname, under_manager, last_login, status'
+        fields, fields_error = _parse_fields(request.args.get('fields'), [c.strip() for c in select_cols.split(',')])
+        if fields_error:
+            return jsonify({'error': fields_error}), 400
+        if fields:
+            select_cols = ', '.join(fields)
         if DB_TYPE.lower() == 'mysql':
             conn = get_mysql_conn()
             cur = conn.cursor(dictionary=True)
@@ -458,7 +1161,7 @@ def users_collection():
     if not email or not password:
         return jsonify({'error': 'email and password required'}), 400
 
-    password_hash = generate_password_hash(password)
+    password_hash = _hash_password(password)
 
     if DB_TYPE.lower() == 'mysql':
         conn = get_mysql_conn()
@@ -474,6 +1177,7 @@ def users_collection():
         finally:
             cur.close()
             conn.close()
+        _users_changed()
         return jsonify({'ok': True, 'id': user_id}), 201
     else:
         conn = get_sqlite_conn()
@@ -488,6 +1192,7 @@ def users_collection():
             return jsonify({'error': 'Could not create user', 'detail': str(e)}), 400
         finally:
             conn.close()
+        _users_changed()
         return jsonify({'ok': True, 'id': user_id}), 201
 
 
@@ -513,6 +1218,7 @@ def users_item(user_id):
             cur.execute('DELETE FROM users WHERE id = ?', (user_id,))
             conn.commit()
             conn.close()
+        _users_changed()
         return jsonify({'ok': True})
 
     # PATCH -> update several user fields
@@ -560,7 +1266,7 @@ def users_item(user_id):
         params.append(status)
     if password is not None:
         updates.append('password_hash = ?')
-        params.append(generate_password_hash(password))
+        params.append(_hash_password(password))
 
     if not updates:
         return jsonify({'error': 'Nothing to update'}), 400
@@ -592,24 +1298,147 @@ def users_item(user_id):
         finally:
             conn.close()
 
+    _users_changed()
     return jsonify({'ok': True})
 
 
 def _save_attachment_if_any(file_storage):
+    """Store an upload once by content hash and return its ``/uploads/...`` URL (ref_count starts at 0)."""
     if not file_storage or not getattr(file_storage, 'filename', ''):
         return None
     try:
-        fname = secure_filename(file_storage.filename or 'attachment')
-        fname = f"{uuid4().hex}_{fname}"
-        target = os.path.join(UPLOAD_DIR, fname)
-        os.makedirs(os.path.dirname(target), exist_ok=True)
-        file_storage.save(target)
-        return f"/uploads/{fname}"
+        stored_name, sha256, size = attachments.store_stream(UPLOAD_DIR, file_storage.stream, file_storage.filename)
+        _register_attachment(stored_name, sha256, size, file_storage.filename, file_storage.mimetype)
+        _preview_pool.schedule(UPLOAD_DIR, stored_name)
+        return attachments.url_for(stored_name, file_storage.filename)
     except Exception as e:
         logging.error('Failed to save attachment: %s', e)
         return None
 
 
+def _register_attachment(stored_name: str, sha256: str, size: int, filename: Optional[str], mimetype: Optional[str] = None):
+    content_type = mimetypes.guess_type(filename or stored_name)[0] or mimetype or 'application/octet-stream'
+    ph = _ph()
+    ignore = 'INSERT IGNORE' if _dialect() == 'mysql' else 'INSERT OR IGNORE'
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f'{ignore} INTO attachments (stored_name, sha256, size, content_type, ref_count, created_at) VALUES ({ph}, {ph}, {ph}, {ph}, 0, {ph})',
+            (stored_name, sha256, size, content_type, now_iso()),
+        )
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+# Resumable uploads: POST opens, PATCH appends at Upload-Offset, HEAD reports it, POST .../commit returns an attachment_url
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(512 * 1024 * 1024)))
+
+
+def _upload_session_response(info: Dict[str, Any], status: int = 200):
+    body = {k: info.get(k) for k in ('upload_id', 'filename', 'length', 'offset')}
+    if info.get('stored_name'):
+        body['attachment_url'] = attachments.url_for(info['stored_name'], info.get('filename'))
+    resp = jsonify(body)
+    resp.status_code = status
+    resp.headers['Upload-Offset'] = str(info.get('offset') or 0)
+    if info.get('length') is not None:
+        resp.headers['Upload-Length'] = str(info['length'])
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = (data.get('filename') or '').strip()
+    if not filename:
+        return jsonify({'error': 'filename is required'}), 400
+    length = _to_int(data.get('length', request.headers.get('Upload-Length')))
+    if length is not None and not 0 < length <= UPLOAD_MAX_BYTES:
+        return jsonify({'error': f'length must be between 1 and {UPLOAD_MAX_BYTES}'}), 413 if length > 0 else 400
+    info = attachments.create_partial(UPLOAD_DIR, filename, length, data.get('content_type'))
+    resp = _upload_session_response(info, 201)
+    resp.headers['Location'] = f'/api/uploads/{info["upload_id"]}'
+    return resp
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def upload_session(upload_id):
+    info = attachments.partial_info(UPLOAD_DIR, upload_id)
+    if info is None:
+        return jsonify({'error': 'Not found'}), 404
+    if request.method in ('GET', 'HEAD'):
+        return _upload_session_response(info)
+    if request.method == 'DELETE':
+        attachments.discard_partial(UPLOAD_DIR, upload_id)
+        return '', 204
+    if info.get('stored_name'):
+        return jsonify({'error': 'Upload is already committed'}), 409
+    offset = _to_int(request.headers.get('Upload-Offset'))
+    if offset is None or offset < 0:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    limit = info['length'] if info.get('length') is not None else UPLOAD_MAX_BYTES
+    try:
+        # request.stream is read chunk by chunk; nothing is buffered beyond attachments.CHUNK_SIZE
+        info['offset'] = attachments.append_partial(UPLOAD_DIR, upload_id, offset, request.stream, limit)
+    except attachments.OffsetMismatch as e:
+        return _upload_session_response(dict(info, offset=e.offset), 409)
+    except attachments.UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return _upload_session_response(info)
+
+
+@app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    info = attachments.partial_info(UPLOAD_DIR, upload_id)
+    if info is None:
+        return jsonify({'error': 'Not found'}), 404
+    if not info.get('stored_name'):
+        if info.get('length') is not None and info['offset'] != info['length']:
+            return _upload_session_response(info, 409)
+        if not info['offset']:
+            return jsonify({'error': 'Upload is empty'}), 400
+    stored_name, sha256, size = attachments.finish_partial(UPLOAD_DIR, upload_id)
+    if not info.get('stored_name'):
+        # registered even if the checksum below fails, so that `uploads gc` can remove it
+        _register_attachment(stored_name, sha256, size, info.get('filename'), info.get('content_type'))
+        _preview_pool.schedule(UPLOAD_DIR, stored_name)
+    expected = ((request.get_json(silent=True) or {}).get('sha256') or '').lower()
+    if expected and expected != sha256:
+        return jsonify({'error': 'sha256 does not match the uploaded bytes', 'sha256': sha256}), 400
+    return jsonify({'upload_id': upload_id, 'attachment_url': attachments.url_for(stored_name, info.get('filename')),
+                    'sha256': sha256, 'size': size})
+
+
+def _attachment_url_list(value) -> List[str]:
+    """URLs from an ``attachments`` JSON column or an ``attachment_url`` value."""
+    if isinstance(value, str) and value.startswith('['):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, str)]
+    return [value] if isinstance(value, str) and value else []
+
+
+def _adjust_attachment_refs(cur, added: Iterable[Optional[str]] = (), removed: Iterable[Optional[str]] = ()):
+    """Count references to stored uploads gained/lost by a write, on the caller's cursor."""
+    deltas: Dict[str, int] = {}
+    for sign, urls in ((1, added), (-1, removed)):
+        for url in urls:
+            name = attachments.stored_name_from_url(url)
+            if name:
+                deltas[name] = deltas.get(name, 0) + sign
+    rows = [(delta, name) for name, delta in deltas.items() if delta]
+    if rows:
+        ph = _ph()
+        cur.executemany(f'UPDATE attachments SET ref_count = ref_count + {ph} WHERE stored_name = {ph}', rows)
+
+
 def _fetch_actions_for_request(conn, request_id: int) -> List[Dict[str, Any]]:
     if DB_TYPE.lower() == 'mysql':
         cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
@@ -638,6 +1467,36 @@ def _fetch_comments_for_request(conn, request_id: int) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+# keep IN (...) lists well under SQLite's bound-parameter limit
+_IN_BATCH_SIZE = 500
+
+
+def _fetch_grouped_by_request(conn, sql_prefix: str, order_by: str, request_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    grouped: Dict[int, List[Dict[str, Any]]] = {rid: [] for rid in request_ids}
+    ids = list(grouped.keys())
+    for start in range(0, len(ids), _IN_BATCH_SIZE):
+        chunk = ids[start:start + _IN_BATCH_SIZE]
+        placeholders = ', '.join([_ph()] * len(chunk))
+        rows = _query_dicts(conn, f'{sql_prefix} WHERE request_id IN ({placeholders}) ORDER BY {order_by}', chunk)
+        for r in rows:
+            grouped[int(r['request_id'])].append(r)
+    return grouped
+
+
+def _fetch_actions_for_requests(conn, request_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Actions for many requests in one query per 500 ids, grouped by request_id."""
+    return _fetch_grouped_by_request(conn, 'SELECT * FROM close_contract_actions', 'request_id, acted_at ASC, id ASC', request_ids)
+
+
+def _fetch_comments_for_requests(conn, request_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Comments for many requests in one query per 500 ids, grouped by request_id."""
+    return _fetch_grouped_by_request(
+        conn,
+        'SELECT id, request_id, user_id, user_email, user_name, text, created_at FROM close_contract_comments',
+        'request_id, created_at ASC, id ASC',
+        request_ids,
+    )
+
 def _load_request(conn, request_id: int) -> Optional[Dict[str, Any]]:
     if DB_TYPE.lower() == 'mysql':
         cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
@@ -652,100 +1511,214 @@ def _load_request(conn, request_id: int) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
-@app.route('/api/close-contracts', methods=['GET', 'POST'])
-def close_contracts():
-    if request.method == 'GET':
-        role = request.args.get('role')
-        created_by = request.args.get('created_by_email')
-        status = request.args.get('status')
-        include_actions = request.args.get('include_actions') == '1'
-        step_key = _step_key_for_role(role)
+def _ph() -> str:
+    return '%s' if DB_TYPE.lower() == 'mysql' else '?'
 
-        where = []
-        params = []
 
-        if role:
-            if step_key:
-                where.append('(current_step = %s OR current_step = %s)' if DB_TYPE.lower() == 'mysql' else '(current_step = ? OR current_step = ?)')
-                params.extend([role, step_key])
-            else:
-                where.append('current_step = %s' if DB_TYPE.lower() == 'mysql' else 'current_step = ?')
-                params.append(role)
-        if created_by:
-            where.append('created_by_email = %s' if DB_TYPE.lower() == 'mysql' else 'created_by_email = ?')
-            params.append(created_by)
-        if status:
-            where.append('status = %s' if DB_TYPE.lower() == 'mysql' else 'status = ?')
-            params.append(status)
+def _query_dicts(conn, sql: str, params=()) -> List[Dict[str, Any]]:
+    if DB_TYPE.lower() == 'mysql':
+        cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall()
+        cur.close()
+        return cast(List[Dict[str, Any]], rows)
+    cur = conn.cursor()
+    cur.execute(sql, tuple(params))
+    rows = cur.fetchall()
+    cur.close()
+    return [dict(r) for r in rows]
 
-        if DB_TYPE.lower() == 'mysql':
-            conn = get_mysql_conn()
-            cur = conn.cursor(dictionary=True)
-            q = 'SELECT * FROM close_contract_forms'
-            if where:
-                q += ' WHERE ' + ' AND '.join(where)
-            q += ' ORDER BY created_at DESC'
-            cur.execute(q, tuple(params))
-            rows = cur.fetchall()
-            cur.close()
-            result = [close_contract_row_to_dict(r) for r in rows]
-            if include_actions:
-                for r in result:
-                    r['actions'] = _fetch_actions_for_request(conn, r['id'])
-            conn.close()
-            return jsonify({'items': result})
-        else:
-            conn = get_sqlite_conn()
-            cur = conn.cursor()
-            q = 'SELECT * FROM close_contract_forms'
-            if where:
-                q += ' WHERE ' + ' AND '.join(where)
-            q += ' ORDER BY created_at DESC'
-            cur.execute(q, tuple(params))
-            rows = cur.fetchall()
-            cur.close()
-            result = [close_contract_row_to_dict(dict(r)) for r in rows]
-            if include_actions:
-                for r in result:
-                    r['actions'] = _fetch_actions_for_request(conn, r['id'])
-            conn.close()
-            return jsonify({'items': result})
 
-    # POST -> create new close contract request
-    logging.info('POST /api/close-contracts incoming; content_type=%s', request.content_type)
+def _encode_cursor(created_at, row_id) -> str:
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(value: str) -> Optional[Tuple[str, int]]:
     try:
-        payload = request.get_json(silent=True) or {}
-    except Exception as e:
-        logging.exception('Failed to parse JSON payload: %s', e)
-        payload = {}
-    is_multipart = request.content_type and 'multipart/form-data' in request.content_type
-    if is_multipart:
-        payload = request.form.to_dict()
-        logging.info('Multipart form keys: %s', list(payload.keys()))
+        padded = value + '=' * (-len(value) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(created_at), int(row_id)
+    except Exception:
+        return None
 
-    # ensure numbers become int/float where appropriate
-    def _to_int(v):
-        try:
-            return int(v) if v not in (None, '') else None
-        except Exception:
-            return None
 
-    def _to_float(v):
-        try:
-            return float(v) if v not in (None, '') else None
-        except Exception:
-            return None
+def _close_contract_filters(args) -> Tuple[List[str], List[Any]]:
+    """WHERE clauses for the close contract listing query params (role, created_by_email, status)."""
+    role = args.get('role')
+    created_by = args.get('created_by_email')
+    status = args.get('status')
+    step_key = _step_key_for_role(role)
+    ph = _ph()
+
+    where: List[str] = []
+    params: List[Any] = []
+    if role:
+        if step_key:
+            where.append(f'(current_step = {ph} OR current_step = {ph})')
+            params.extend([role, step_key])
+        else:
+            where.append(f'current_step = {ph}')
+            params.append(role)
+    if created_by:
+        where.append(f'created_by_email = {ph}')
+        params.append(created_by)
+    if status:
+        where.append(f'status = {ph}')
+        params.append(status)
+    return where, params
 
-    attachment_url = None
-    if is_multipart and 'attachment' in request.files:
-        attachment_url = _save_attachment_if_any(request.files['attachment'])
-    else:
-        attachment_url = payload.get('attachment_url')
 
-    current_step_key = 'credit'
-    now = now_iso()
+def _count_close_contracts(conn, where: List[str], params: List[Any], estimate: bool = False) -> Tuple[int, bool]:
+    """Return (total, is_estimate) for the listing filters."""
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    if estimate:
+        if DB_TYPE.lower() == 'mysql':
+            if not where:
+                rows = _query_dicts(conn, "SELECT TABLE_ROWS AS n FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'close_contract_forms'")
+                if rows and rows[0].get('n') is not None:
+                    return int(rows[0]['n']), True
+            else:
+                rows = _query_dicts(conn, 'EXPLAIN SELECT id FROM close_contract_forms' + where_sql, params)
+                if rows and rows[0].get('rows') is not None:
+                    return int(rows[0]['rows']), True
+        elif not where:
+            rows = _query_dicts(conn, 'SELECT MAX(id) AS n FROM close_contract_forms')
+            return int(rows[0]['n'] or 0), True
+    rows = _query_dicts(conn, 'SELECT COUNT(*) AS n FROM close_contract_forms' + where_sql, params)
+    return int(rows[0]['n']), False
+
+
+def _set_pending_work(cur, request_id: int, step_key: Optional[str], queued_at: str):
+    """Move a request into the queue of ``step_key`` (``None`` drops it) on the caller's cursor."""
+    ph = _ph()
+    cur.execute(f'DELETE FROM pending_work WHERE request_id = {ph}', (request_id,))
+    if step_key:
+        cur.execute(f'INSERT INTO pending_work (request_id, step_key, queued_at) VALUES ({ph}, {ph}, {ph})', (request_id, step_key, queued_at))
+
+
+def _make_etag(*parts) -> str:
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag: str):
+    resp = app.response_class(status=304)
+    return _with_etag(resp, etag)
+
+
+def _with_etag(resp, etag: str):
+    resp.set_etag(etag)
+    # clients may keep the body but must revalidate before reusing it
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+def _expected_version(payload: Optional[Dict[str, Any]] = None) -> Tuple[Optional[int], Optional[str]]:
+    """Version from ``If-Match`` or ``expected_version`` as ``(version, error)``; None means no check."""
+    raw = None
+    if request.if_match:
+        if request.if_match.star_tag:
+            return None, None
+        tags = request.if_match.as_set(include_weak=True)
+        if len(tags) != 1:
+            return None, 'If-Match must name exactly one version'
+        raw = next(iter(tags))
+    elif payload and payload.get('expected_version') not in (None, ''):
+        raw = payload.get('expected_version')
+    if raw is None:
+        return None, None
+    version = _to_int(raw)
+    if version is None:
+        return None, 'If-Match/expected_version must be the version of the request, e.g. "3"'
+    return version, None
+
+
+def _version_conflict(conn, request_id: int, version: Any = None):
+    """409 with the form's current version, so the client can reload and retry."""
+    if version is None:
+        state = _load_states(conn, [request_id]).get(request_id)
+        version = state['version'] if state else None
+    return jsonify({
+        'error': 'The request was changed by someone else; reload it and try again',
+        'version': int(version) if version is not None else None,
+    }), 409
+
+
+def _detail_version(conn, request_id: int) -> Optional[Tuple[Any, Any, Any]]:
+    """(form version, last action id, last comment id) in one round trip; None if the form is missing."""
+    ph = _ph()
+    rows = _query_dicts(conn, (
+        'SELECT f.version AS version, '
+        '(SELECT MAX(a.id) FROM close_contract_actions a WHERE a.request_id = f.id) AS last_action_id, '
+        '(SELECT MAX(c.id) FROM close_contract_comments c WHERE c.request_id = f.id) AS last_comment_id '
+        f'FROM close_contract_forms f WHERE f.id = {ph}'
+    ), [request_id])
+    if not rows:
+        return None
+    r = rows[0]
+    return r['version'], r['last_action_id'], r['last_comment_id']
+
+
+def _listing_version(conn, page_sql: str, params: List[Any], include_comments: bool) -> Tuple[Any, ...]:
+    """Ids and versions of a listing page (``page_sql`` is its WHERE/ORDER/LIMIT tail), for its ETag."""
+    extra = ', (SELECT MAX(id) FROM close_contract_comments) AS last_comment_id' if include_comments else ''
+    rows = _query_dicts(conn, f'SELECT id, version{extra} FROM close_contract_forms{page_sql}', params)
+    version: List[Any] = [(r['id'], r['version']) for r in rows]
+    if include_comments and rows:
+        version.append(rows[0]['last_comment_id'])
+    return tuple(version)
+
 
-    base_fields = (
+class _EventBroker:
+    """In-process wake-up signal for SSE streams; close_contract_events stays the source of truth."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def notify(self):
+        with self._cond:
+            self._seq += 1
+            self._cond.notify_all()
+
+    def wait(self, seen_seq: int, timeout: float) -> bool:
+        """Block until notify() is called after ``seen_seq`` was read; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq != seen_seq, timeout)
+
+
+_event_broker = _EventBroker()
+
+
+def _record_event(cur, request_id: int, event_type: str, from_step: Optional[str], to_step: Optional[str],
+                  status: Optional[str], actor_email: Optional[str], created_at: str):
+    """Append to the event log on the caller's cursor (commits with the change it describes)."""
+    ph = _ph()
+    cur.execute(
+        f'INSERT INTO close_contract_events (request_id, event_type, from_step, to_step, status, actor_email, created_at) '
+        f'VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})',
+        (request_id, event_type, from_step, to_step, status, actor_email, created_at),
+    )
+
+
+_CLOSE_FORM_INSERT_COLS = (
+    'collection_type, contract_no, person_in_charge, manager_in_charge, last_contract_info, '
+    'paid_term, total_term, full_paid_date, s_count, a_count, b_count, c_count, f_count, '
+    'principal_remaining, interest_remaining, penalty_remaining, others_remaining, '
+    'principal_willing, interest_willing, interest_months, penalty_willing, others_willing, '
+    'remark, attachment_url, status, current_step, created_by_email, created_by_id, created_at, updated_at'
+)
+_CLOSE_FORM_INSERT_NAMES = [c.strip() for c in _CLOSE_FORM_INSERT_COLS.split(',')]
+_CLOSE_FORM_COLUMNS = ['id'] + _CLOSE_FORM_INSERT_NAMES
+
+
+def _close_form_values(payload: Dict[str, Any], attachment_url: Optional[str], current_step_key: str, now: str) -> Tuple[Any, ...]:
+    """Coerce a create payload into values matching ``_CLOSE_FORM_INSERT_COLS``."""
+    return (
         payload.get('collection_type'),
         payload.get('contract_no'),
         payload.get('person_in_charge'),
@@ -778,102 +1751,414 @@ def close_contracts():
         now
     )
 
-    if not payload.get('contract_no'):
-        return jsonify({'error': 'contract_no is required'}), 400
 
-    if DB_TYPE.lower() == 'mysql':
-        conn = get_mysql_conn()
-        cur = conn.cursor()
+_STATS_FORM_COLS = 'status, current_step, collection_type, principal_remaining, principal_willing'
+
+
+class _StatsDelta:
+    """Pending changes to the analytics summary tables, applied on the writer's cursor."""
+
+    def __init__(self):
+        self.status: Dict[Tuple[str, str], int] = {}
+        self.collection: Dict[str, List[float]] = {}
+        self.step_time: Dict[str, List[float]] = {}
+
+    def count(self, status, current_step, sign: int = 1):
+        key = ('' if status is None else str(status), '' if current_step is None else str(current_step))
+        self.status[key] = self.status.get(key, 0) + sign
+
+    def move(self, old_status, old_step, new_status, new_step):
+        self.count(old_status, old_step, -1)
+        self.count(new_status, new_step, 1)
+
+    def form(self, row: Dict[str, Any], sign: int = 1):
+        """Count a whole form (any mapping with ``_STATS_FORM_COLS``) in, or out with ``sign=-1``."""
+        self.count(row.get('status'), row.get('current_step'), sign)
+        totals = self.collection.setdefault(row.get('collection_type') or '', [0, 0.0, 0.0])
+        totals[0] += sign
+        totals[1] += sign * float(row.get('principal_remaining') or 0)
+        totals[2] += sign * float(row.get('principal_willing') or 0)
+
+    def refresh_form(self, cur, request_id: int, old_row: Dict[str, Any]):
+        """Swap ``old_row``'s contribution for the form as it is now (call after the UPDATE)."""
+        self.form(old_row, -1)
+        cur.execute(f'SELECT {_STATS_FORM_COLS} FROM close_contract_forms WHERE id = {_ph()}', (request_id,))
+        rows = cur.fetchall()
+        if rows:
+            self.form(dict(zip([c.strip() for c in _STATS_FORM_COLS.split(',')], rows[0])))
+
+    def step(self, step_key: str, seconds: Optional[float]):
+        if seconds is None:
+            return
+        totals = self.step_time.setdefault(step_key, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def apply(self, cur):
+        self._upsert(cur, 'analytics_status_counts', ['status', 'current_step'], ['n'],
+                     [(k[0], k[1], n) for k, n in self.status.items() if n])
+        self._upsert(cur, 'analytics_collection_totals', ['collection_type'], ['n', 'principal_remaining', 'principal_willing'],
+                     [(k, *v) for k, v in self.collection.items() if any(v)])
+        self._upsert(cur, 'analytics_step_time', ['step_key'], ['n', 'total_seconds'],
+                     [(k, *v) for k, v in self.step_time.items()])
+
+    @staticmethod
+    def _upsert(cur, table: str, keys: List[str], counters: List[str], rows: List[Tuple[Any, ...]]):
+        if not rows:
+            return
+        cols = keys + counters
+        sql = f'INSERT INTO {table} ({", ".join(cols)}) VALUES ({", ".join([_ph()] * len(cols))}) '
+        if _dialect() == 'mysql':
+            sql += 'ON DUPLICATE KEY UPDATE ' + ', '.join(f'{c} = {c} + VALUES({c})' for c in counters)
+        else:
+            sql += f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET ' + ', '.join(f'{c} = {c} + excluded.{c}' for c in counters)
+        cur.executemany(sql, rows)
+
+
+def _queued_seconds(cur, request_id: int, step_key: str, acted_at: str) -> Optional[float]:
+    """How long the request has waited at ``step_key``, from its pending_work row (read before it moves)."""
+    cur.execute(f'SELECT step_key, queued_at FROM pending_work WHERE request_id = {_ph()}', (request_id,))
+    rows = cur.fetchall()
+    if not rows or rows[0][0] != step_key:
+        return None
+    return migrations.seconds_between(rows[0][1], acted_at)
+
+
+@app.route('/api/close-contracts', methods=['GET', 'POST'])
+def close_contracts():
+    if request.method == 'GET':
+        include_actions = request.args.get('include_actions') == '1'
+        include_comments = request.args.get('include_comments') == '1'
+        where, params = _close_contract_filters(request.args)
+
+        # keyset pagination on (created_at, id); without limit/cursor the full list is returned
+        paginate = request.args.get('limit') is not None or request.args.get('cursor') is not None
+        total_mode = request.args.get('total')
+        if total_mode not in (None, '', 'exact', 'estimate'):
+            return jsonify({'error': 'total must be exact or estimate'}), 400
+        # id/created_at are always returned: paging cursors and include_* need them
+        fields, fields_error = _parse_fields(request.args.get('fields'), _CLOSE_FORM_COLUMNS, ('id', 'created_at'))
+        if fields_error:
+            return jsonify({'error': fields_error}), 400
+        limit = None
+        page_where = list(where)
+        page_params = list(params)
+        if paginate:
+            try:
+                limit = int(request.args.get('limit') or CLOSE_LIST_DEFAULT_LIMIT)
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+            limit = max(1, min(limit, CLOSE_LIST_MAX_LIMIT))
+            cursor_arg = request.args.get('cursor')
+            if cursor_arg:
+                after = _decode_cursor(cursor_arg)
+                if after is None:
+                    return jsonify({'error': 'Invalid cursor'}), 400
+                ph = _ph()
+                page_where.append(f'(created_at < {ph} OR (created_at = {ph} AND id < {ph}))')
+                page_params.extend([after[0], after[0], after[1]])
+
+        page_sql = ' WHERE ' + ' AND '.join(page_where) if page_where else ''
+        page_sql += ' ORDER BY created_at DESC, id DESC'
+        if limit is not None:
+            # one extra row tells us whether another page exists
+            page_sql += f' LIMIT {limit + 1}'
+
+        conn = get_conn()
         try:
-            cols = (
-                'collection_type, contract_no, person_in_charge, manager_in_charge, last_contract_info, '
-                'paid_term, total_term, full_paid_date, s_count, a_count, b_count, c_count, f_count, '
-                'principal_remaining, interest_remaining, penalty_remaining, others_remaining, '
-                'principal_willing, interest_willing, interest_months, penalty_willing, others_willing, '
-                'remark, attachment_url, status, current_step, created_by_email, created_by_id, created_at, updated_at'
-            )
-            placeholders = ', '.join(['%s'] * len(base_fields))
-            cur.execute(f'INSERT INTO close_contract_forms ({cols}) VALUES ({placeholders})', base_fields)
-            raw_request_id = cur.lastrowid
-            if raw_request_id is None:
-                raise ValueError('Failed to obtain request id after insert')
-            request_id_int = int(raw_request_id)
-            conn.commit()
-            # add submit action
-            act_placeholders = ', '.join(['%s'] * 10)
-            cur.execute(f'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) VALUES ({act_placeholders})', (request_id_int, 'submit', 'Submit', 'Submitter', 'submitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), now))
-            conn.commit()
-            row = _load_request(conn, request_id_int)
-            row = close_contract_row_to_dict(row)
-            row['actions'] = _fetch_actions_for_request(conn, request_id_int)
-            cur.close()
-            conn.close()
-            logging.info('Created close_contract id=%s by %s', request_id_int, payload.get('created_by_email'))
-            return jsonify({'ok': True, 'item': row}), 201
-        except Exception as e:
-            conn.rollback()
-            logging.exception('Failed to insert close_contract (mysql): %s; payload keys: %s', e, list(payload.keys()))
-            cur.close()
+            total = None
+            if total_mode:
+                total = _count_close_contracts(conn, where, params, estimate=(total_mode == 'estimate'))
+            etag = _make_etag('list', request.query_string.decode('utf-8', 'replace'), total,
+                              *_listing_version(conn, page_sql, page_params, include_comments))
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+            rows = _query_dicts(conn, f'SELECT {", ".join(fields) if fields else "*"} FROM close_contract_forms{page_sql}', page_params)
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+            result = [close_contract_row_to_dict(r) for r in rows]
+            page_ids = [r['id'] for r in result]
+            if include_actions:
+                with metrics.span('actions'):
+                    actions_by_request = _fetch_actions_for_requests(conn, page_ids)
+                for r in result:
+                    r['actions'] = actions_by_request.get(r['id'], [])
+            if include_comments:
+                with metrics.span('comments'):
+                    comments_by_request = _fetch_comments_for_requests(conn, page_ids)
+                for r in result:
+                    r['comments'] = comments_by_request.get(r['id'], [])
+            body: Dict[str, Any] = {'items': result}
+            if paginate:
+                body['next_cursor'] = next_cursor
+            if total is not None:
+                body['total'], body['total_is_estimate'] = total
+        finally:
             conn.close()
-            return jsonify({'error': 'Insert failed', 'detail': str(e)}), 500
+        with metrics.span('serialize'):
+            return _with_etag(jsonify(body), etag)
+
+    # POST -> create new close contract request
+    logging.info('POST /api/close-contracts incoming; content_type=%s', request.content_type)
+    try:
+        payload = request.get_json(silent=True) or {}
+    except Exception as e:
+        logging.exception('Failed to parse JSON payload: %s', e)
+        payload = {}
+    is_multipart = request.content_type and 'multipart/form-data' in request.content_type
+    if is_multipart:
+        payload = request.form.to_dict()
+        logging.info('Multipart form keys: %s', list(payload.keys()))
+
+    attachment_url = None
+    if is_multipart and 'attachment' in request.files:
+        attachment_url = _save_attachment_if_any(request.files['attachment'])
     else:
-        conn = get_sqlite_conn()
-        cur = conn.cursor()
-        try:
-            cols = (
-                'collection_type, contract_no, person_in_charge, manager_in_charge, last_contract_info, '
-                'paid_term, total_term, full_paid_date, s_count, a_count, b_count, c_count, f_count, '
-                'principal_remaining, interest_remaining, penalty_remaining, others_remaining, '
-                'principal_willing, interest_willing, interest_months, penalty_willing, others_willing, '
-                'remark, attachment_url, status, current_step, created_by_email, created_by_id, created_at, updated_at'
-            )
-            placeholders = ', '.join(['?'] * len(base_fields))
-            cur.execute(f'INSERT INTO close_contract_forms ({cols}) VALUES ({placeholders})', base_fields)
-            raw_request_id = cur.lastrowid
-            if raw_request_id is None:
-                raise ValueError('Failed to obtain request id after insert')
-            request_id_int = int(raw_request_id)
-            conn.commit()
-            act_placeholders = ', '.join(['?'] * 10)
-            cur.execute(f'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) VALUES ({act_placeholders})', (request_id_int, 'submit', 'Submit', 'Submitter', 'submitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), now))
-            conn.commit()
-            row = _load_request(conn, request_id_int)
-            row = close_contract_row_to_dict(row)
-            row['actions'] = _fetch_actions_for_request(conn, request_id_int)
-            cur.close()
-            conn.close()
-            logging.info('Created close_contract id=%s by %s', request_id_int, payload.get('created_by_email'))
-            return jsonify({'ok': True, 'item': row}), 201
-        except Exception as e:
-            conn.rollback()
-            logging.exception('Failed to insert close_contract (sqlite): %s; payload keys: %s', e, list(payload.keys()))
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Insert failed', 'detail': str(e)}), 500
+        attachment_url = payload.get('attachment_url')
+
+    current_step_key = 'credit'
+    now = now_iso()
+
+    base_fields = _close_form_values(payload, attachment_url, current_step_key, now)
+
+    if not payload.get('contract_no'):
+        return jsonify({'error': 'contract_no is required'}), 400
+
+    ph = _ph()
+    conn = get_conn()
+    conn.begin_write()
+    cur = conn.cursor()
+    try:
+        cur.execute(f'INSERT INTO close_contract_forms ({_CLOSE_FORM_INSERT_COLS}) VALUES ({", ".join([ph] * len(base_fields))})', base_fields)
+        raw_request_id = cur.lastrowid
+        if raw_request_id is None:
+            raise ValueError('Failed to obtain request id after insert')
+        request_id_int = int(raw_request_id)
+        # add submit action
+        cur.execute(
+            'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) '
+            f'VALUES ({", ".join([ph] * 10)})',
+            (request_id_int, 'submit', 'Submit', 'Submitter', 'submitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), now),
+        )
+        _set_pending_work(cur, request_id_int, current_step_key, now)
+        _record_event(cur, request_id_int, 'submitted', 'submit', current_step_key, 'under_review', payload.get('created_by_email'), now)
+        stats = _StatsDelta()
+        stats.form(dict(zip(_CLOSE_FORM_INSERT_NAMES, base_fields)))
+        stats.apply(cur)
+        _adjust_attachment_refs(cur, [attachment_url])
+        conn.commit()
+        _event_broker.notify()
+        row = _load_request(conn, request_id_int)
+        row = close_contract_row_to_dict(row)
+        row['actions'] = _fetch_actions_for_request(conn, request_id_int)
+        cur.close()
+        conn.close()
+        logging.info('Created close_contract id=%s by %s', request_id_int, payload.get('created_by_email'))
+        return jsonify({'ok': True, 'item': row}), 201
+    except Exception as e:
+        conn.rollback()
+        logging.exception('Failed to insert close_contract (%s): %s; payload keys: %s', _dialect(), e, list(payload.keys()))
+        cur.close()
+        conn.close()
+        return jsonify({'error': 'Insert failed', 'detail': str(e)}), 500
+
+
+@app.route('/api/inbox', methods=['GET'])
+def inbox():
+    """Open requests waiting on one step, oldest first, read from pending_work."""
+    role = request.args.get('role')
+    step_key = _step_key_for_role(role) or (role if _step_by_key(role) else None)
+    if not step_key:
+        return jsonify({'error': 'role must be a step role or step key'}), 400
+    created_by = request.args.get('created_by_email')
+    include_actions = request.args.get('include_actions') == '1'
+    try:
+        limit = int(request.args.get('limit') or CLOSE_LIST_DEFAULT_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, CLOSE_LIST_MAX_LIMIT))
+
+    ph = _ph()
+    where = [f'p.step_key = {ph}']
+    params: List[Any] = [step_key]
+    if created_by:
+        # the submit queue is shared by all submitters; let each see only their own
+        where.append(f'f.created_by_email = {ph}')
+        params.append(created_by)
+    cursor_arg = request.args.get('cursor')
+    if cursor_arg:
+        after = _decode_cursor(cursor_arg)
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        where.append(f'(p.queued_at > {ph} OR (p.queued_at = {ph} AND p.request_id > {ph}))')
+        params.extend([after[0], after[0], after[1]])
+    q = (
+        'SELECT f.*, p.queued_at AS queued_at FROM pending_work p '
+        'JOIN close_contract_forms f ON f.id = p.request_id '
+        'WHERE ' + ' AND '.join(where) +
+        f' ORDER BY p.queued_at ASC, p.request_id ASC LIMIT {limit + 1}'
+    )
+
+    conn = get_conn()
+    try:
+        rows = _query_dicts(conn, q, params)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]['queued_at'], rows[-1]['id'])
+        result = [close_contract_row_to_dict(r) for r in rows]
+        if include_actions:
+            actions_by_request = _fetch_actions_for_requests(conn, [r['id'] for r in result])
+            for r in result:
+                r['actions'] = actions_by_request.get(r['id'], [])
+    finally:
+        conn.close()
+    return jsonify({'step_key': step_key, 'items': result, 'next_cursor': next_cursor})
+
+
+SEARCH_SECTIONS = {
+    'users': ('users', 'id, email, first_name, last_name, staff_no, role, department, status'),
+    'forms': ('close_contract_forms', 'id, contract_no, person_in_charge, manager_in_charge, collection_type, status, current_step, created_by_email, created_at'),
+    'comments': ('close_contract_comments', 'id, request_id, user_email, user_name, text, created_at'),
+}
+
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Ranked full-text hits per section (users, forms, comments), paged with limit/offset."""
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    types = [t.strip() for t in (request.args.get('types') or ','.join(SEARCH_SECTIONS)).split(',') if t.strip()]
+    unknown = [t for t in types if t not in SEARCH_SECTIONS]
+    if unknown:
+        return jsonify({'error': 'Unknown search type(s): ' + ', '.join(unknown)}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit') or 20), 100))
+        offset = max(0, int(request.args.get('offset') or 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    results: Dict[str, Any] = {}
+    conn = get_conn()
+    try:
+        for t in types:
+            table, cols = SEARCH_SECTIONS[t]
+            # fetch one extra row to report whether another page exists
+            hits = _fulltext_search(conn, table, cols, q, limit + 1, offset)
+            results[t] = {
+                'items': hits[:limit],
+                'next_offset': offset + limit if len(hits) > limit else None,
+            }
+    finally:
+        conn.close()
+    return jsonify({'q': q, 'results': results})
+
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+# streams end after this long so workers are recycled; EventSource reconnects with Last-Event-ID
+SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))
+
+
+def _events_after(last_id: int, step_key: Optional[str], limit: int = 500) -> List[Dict[str, Any]]:
+    ph = _ph()
+    q = 'SELECT id, request_id, event_type, from_step, to_step, status, actor_email, created_at FROM close_contract_events'
+    where = [f'id > {ph}']
+    params: List[Any] = [last_id]
+    if step_key:
+        # an approver cares about requests arriving in or leaving their step
+        where.append(f'(from_step = {ph} OR to_step = {ph})')
+        params.extend([step_key, step_key])
+    q += ' WHERE ' + ' AND '.join(where) + f' ORDER BY id ASC LIMIT {int(limit)}'
+    conn = get_conn()
+    try:
+        return _query_dicts(conn, q, params)
+    finally:
+        conn.close()
+
+
+def _latest_event_id() -> int:
+    conn = get_conn()
+    try:
+        rows = _query_dicts(conn, 'SELECT MAX(id) AS last_id FROM close_contract_events')
+    finally:
+        conn.close()
+    return int(rows[0]['last_id'] or 0)
+
+
+@app.route('/api/close-contracts/stream', methods=['GET'])
+def close_contract_stream():
+    """Server-Sent Events feed of approval changes, optionally limited to one role's step."""
+    role = request.args.get('role')
+    step_key = None
+    if role:
+        step_key = _step_key_for_role(role) or (role if _step_by_key(role) else None)
+        if not step_key:
+            return jsonify({'error': 'role must be a step role or step key'}), 400
+    resume_from = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(resume_from) if resume_from else _latest_event_id()
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    def generate(last_id: int):
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            # read the broker sequence before querying so a commit in between is not missed
+            seen = _event_broker.seq
+            events = _events_after(last_id, step_key)
+            for e in events:
+                last_id = int(e['id'])
+                yield f"id: {last_id}\nevent: {e['event_type']}\ndata: {json.dumps(e)}\n\n"
+            if events:
+                continue
+            if not _event_broker.wait(seen, SSE_HEARTBEAT_SECONDS):
+                yield ': keepalive\n\n'
+
+    return app.response_class(generate(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # stop nginx from buffering the stream
+        'X-Accel-Buffering': 'no',
+    })
 
 
 @app.route('/api/close-contracts/<int:request_id>', methods=['GET'])
 def close_contract_detail(request_id):
-    conn = get_mysql_conn() if DB_TYPE.lower() == 'mysql' else get_sqlite_conn()
+    conn = get_conn()
+    # cheap version probe first: a matching If-None-Match never loads the full rows
+    version = _detail_version(conn, request_id)
+    if version is None:
+        conn.close()
+        return jsonify({'error': 'Not found'}), 404
+    etag = _make_etag('detail', request_id, *version)
+    if request.if_none_match.contains_weak(etag):
+        conn.close()
+        return _not_modified(etag)
     row = _load_request(conn, request_id)
     if not row:
         conn.close()
         return jsonify({'error': 'Not found'}), 404
     row = close_contract_row_to_dict(row)
-    row['actions'] = _fetch_actions_for_request(conn, request_id)
+    with metrics.span('actions'):
+        row['actions'] = _fetch_actions_for_request(conn, request_id)
     # include free-form comments
-    try:
-        row['comments'] = _fetch_comments_for_request(conn, request_id)
-    except Exception:
-        row['comments'] = []
+    with metrics.span('comments'):
+        try:
+            row['comments'] = _fetch_comments_for_request(conn, request_id)
+        except Exception:
+            row['comments'] = []
     conn.close()
-    return jsonify({'item': row})
+    with metrics.span('serialize'):
+        return _with_etag(jsonify({'item': row}), etag)
 
 
 @app.route('/api/close-contracts/<int:request_id>', methods=['PATCH'])
 def close_contract_update(request_id):
     # allow updating an existing request (used for resubmit/edit)
-    conn = get_mysql_conn() if DB_TYPE.lower() == 'mysql' else get_sqlite_conn()
+    conn = get_conn()
     row = _load_request(conn, request_id)
     if not row:
         conn.close()
@@ -887,21 +2172,18 @@ def close_contract_update(request_id):
     if is_multipart:
         payload = request.form.to_dict()
 
+    expected, error = _expected_version(payload)
+    if error:
+        conn.close()
+        return jsonify({'error': error}), 400
+    if expected is not None and expected != int(row['version']):
+        response = _version_conflict(conn, request_id, row['version'])
+        conn.close()
+        return response
+
     # allow caller to bypass status/current_step reset (used for attachment-only patch)
     skip_reset = str(payload.get('skip_reset', '')).lower() in ('1', 'true', 'yes')
 
-    def _to_int(v):
-        try:
-            return int(v) if v not in (None, '') else None
-        except Exception:
-            return None
-
-    def _to_float(v):
-        try:
-            return float(v) if v not in (None, '') else None
-        except Exception:
-            return None
-
     attachment_url = None
     if is_multipart and 'attachment' in request.files:
         attachment_url = _save_attachment_if_any(request.files['attachment'])
@@ -910,6 +2192,11 @@ def close_contract_update(request_id):
         if 'attachment_url' in payload:
             attachment_url = payload.get('attachment_url')
 
+    # the attachment is committed on its own; the form update waits its turn as a writer
+    if conn.begin_write():
+        row = _load_request(conn, request_id) or row
+
+    ph = _ph()
     updates = []
     params = []
     fields = [
@@ -920,7 +2207,7 @@ def close_contract_update(request_id):
     ]
     for f in fields:
         if f in payload:
-            updates.append(f + (' = %s' if DB_TYPE.lower() == 'mysql' else ' = ?'))
+            updates.append(f'{f} = {ph}')
             val = payload.get(f)
             if f in ('paid_term','total_term','s_count','a_count','b_count','c_count','f_count','interest_months'):
                 params.append(_to_int(val))
@@ -931,57 +2218,64 @@ def close_contract_update(request_id):
 
     # attachment_url update handling
     if attachment_url is not None:
-        updates.append('attachment_url' + (' = %s' if DB_TYPE.lower() == 'mysql' else ' = ?'))
+        updates.append(f'attachment_url = {ph}')
         params.append(attachment_url)
 
     # always update updated_at
-    updates.append('updated_at' + (' = %s' if DB_TYPE.lower() == 'mysql' else ' = ?'))
+    updates.append(f'updated_at = {ph}')
     params.append(now_iso())
 
     # when resubmitting, reset status/current_step to restart approval flow (unless explicitly skipped)
     if not skip_reset:
-        updates.append('status' + (' = %s' if DB_TYPE.lower() == 'mysql' else ' = ?'))
+        updates.append(f'status = {ph}')
         params.append('under_review')
-        updates.append('current_step' + (' = %s' if DB_TYPE.lower() == 'mysql' else ' = ?'))
+        updates.append(f'current_step = {ph}')
         params.append('credit')
 
     if not updates:
         conn.close()
         return jsonify({'error': 'Nothing to update'}), 400
+    # compare-and-swap: only applies on top of the version the client (or this handler) saw
+    updates.append('version = version + 1')
+    base_version = expected if expected is not None else int(row['version'])
 
     cur = None
     try:
-        if DB_TYPE.lower() == 'mysql':
-            q = ', '.join([u.replace(' = %s', ' = %s') for u in updates])
-            cur = conn.cursor()
-            cur.execute(f'UPDATE close_contract_forms SET {q} WHERE id = %s', (*params, request_id))
-            conn.commit()
-            # add resubmit action record only when not skipping reset
-            if not skip_reset:
-                acted_at = now_iso()
-                cur.execute('INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', (request_id, 'submit', 'Submit', 'Submitter', 'resubmitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), acted_at))
-                conn.commit()
-            updated = _load_request(conn, request_id)
-            updated = close_contract_row_to_dict(updated)
-            updated['actions'] = _fetch_actions_for_request(conn, request_id)
+        q = ', '.join(updates)
+        cur = conn.cursor()
+        cur.execute(f'UPDATE close_contract_forms SET {q} WHERE id = {ph} AND version = {ph}', (*params, request_id, base_version))
+        if cur.rowcount == 0:
+            conn.rollback()
+            response = _version_conflict(conn, request_id)
             cur.close()
             conn.close()
-            return jsonify({'ok': True, 'item': updated})
+            return response
+        stats = _StatsDelta()
+        stats.refresh_form(cur, request_id, row)
+        if not skip_reset:
+            acted_at = now_iso()
+            step_seconds = _queued_seconds(cur, request_id, 'submit', acted_at)
+            cur.execute(
+                'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at, step_seconds) '
+                f'VALUES ({", ".join([ph] * 11)})',
+                (request_id, 'submit', 'Submit', 'Submitter', 'resubmitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), acted_at, step_seconds),
+            )
+            stats.step('submit', step_seconds)
+            _set_pending_work(cur, request_id, 'credit', acted_at)
+            _record_event(cur, request_id, 'resubmitted', row.get('current_step'), 'credit', 'under_review', payload.get('created_by_email'), acted_at)
         else:
-            q = ', '.join(updates)
-            cur = conn.cursor()
-            cur.execute(f'UPDATE close_contract_forms SET {q} WHERE id = ?', (*params, request_id))
-            conn.commit()
-            if not skip_reset:
-                acted_at = now_iso()
-                cur.execute('INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (request_id, 'submit', 'Submit', 'Submitter', 'resubmitted', payload.get('remark') or '', payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), acted_at))
-                conn.commit()
-            updated = _load_request(conn, request_id)
-            updated = close_contract_row_to_dict(updated)
-            updated['actions'] = _fetch_actions_for_request(conn, request_id)
-            cur.close()
-            conn.close()
-            return jsonify({'ok': True, 'item': updated})
+            _record_event(cur, request_id, 'updated', row.get('current_step'), row.get('current_step'), row.get('status'), payload.get('created_by_email'), now_iso())
+        stats.apply(cur)
+        if attachment_url is not None and attachment_url != row.get('attachment_url'):
+            _adjust_attachment_refs(cur, [attachment_url], [row.get('attachment_url')])
+        conn.commit()
+        _event_broker.notify()
+        updated = _load_request(conn, request_id)
+        updated = close_contract_row_to_dict(updated)
+        updated['actions'] = _fetch_actions_for_request(conn, request_id)
+        cur.close()
+        conn.close()
+        return jsonify({'ok': True, 'item': updated})
     except Exception as e:
         conn.rollback()
         if cur:
@@ -993,7 +2287,7 @@ def close_contract_update(request_id):
 
 @app.route('/api/close-contracts/<int:request_id>/comments', methods=['GET', 'POST'])
 def close_contract_comments(request_id):
-    conn = get_mysql_conn() if DB_TYPE.lower() == 'mysql' else get_sqlite_conn()
+    conn = get_conn()
     # ensure request exists
     req = _load_request(conn, request_id)
     if not req:
@@ -1014,122 +2308,710 @@ def close_contract_comments(request_id):
     user_email = data.get('user_email')
     user_id = data.get('user_id')
     user_name = data.get('user_name')
+    if conn.begin_write():
+        req = _load_request(conn, request_id) or req
     created_at = now_iso()
 
-    if DB_TYPE.lower() == 'mysql':
-        cur = conn.cursor()
-        cur.execute('INSERT INTO close_contract_comments (request_id, user_id, user_email, user_name, text, created_at) VALUES (%s, %s, %s, %s, %s, %s)', (request_id, user_id, user_email, user_name, text, created_at))
-        conn.commit()
-        comment_id = cur.lastrowid
-        cur.close()
-        # fetch inserted
-        cur = conn.cursor(dictionary=True)  # type: ignore[arg-type]
-        cur.execute('SELECT id, request_id, user_id, user_email, user_name, text, created_at FROM close_contract_comments WHERE id = %s', (comment_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-        return jsonify({'ok': True, 'comment': row}), 201
-    else:
-        cur = conn.cursor()
-        cur.execute('INSERT INTO close_contract_comments (request_id, user_id, user_email, user_name, text, created_at) VALUES (?, ?, ?, ?, ?, ?)', (request_id, user_id, user_email, user_name, text, created_at))
-        conn.commit()
-        comment_id = cur.lastrowid
-        cur.close()
-        cur = conn.cursor()
-        cur.execute('SELECT id, request_id, user_id, user_email, user_name, text, created_at FROM close_contract_comments WHERE id = ?', (comment_id,))
-        r = cur.fetchone()
-        conn.close()
-        comment_row = dict(r) if r else None  # type: ignore[arg-type]
-        return jsonify({'ok': True, 'comment': comment_row}), 201
+    ph = _ph()
+    cur = conn.cursor()
+    cur.execute(
+        f'INSERT INTO close_contract_comments (request_id, user_id, user_email, user_name, text, created_at) VALUES ({", ".join([ph] * 6)})',
+        (request_id, user_id, user_email, user_name, text, created_at),
+    )
+    comment_id = cur.lastrowid
+    _record_event(cur, request_id, 'commented', req.get('current_step'), req.get('current_step'), req.get('status'), user_email, created_at)
+    conn.commit()
+    _event_broker.notify()
+    cur.close()
+    # fetch inserted
+    rows = _query_dicts(conn, f'SELECT id, request_id, user_id, user_email, user_name, text, created_at FROM close_contract_comments WHERE id = {ph}', [comment_id])
+    conn.close()
+    return jsonify({'ok': True, 'comment': rows[0] if rows else None}), 201
 
 
 @app.route('/api/close-contracts/<int:request_id>/action', methods=['POST'])
 def close_contract_action(request_id):
+    """Record approve/reject/send_back at the request's current step."""
     data = request.get_json() or {}
     result = (data.get('result') or '').lower()
-    if result not in ('approve', 'reject', 'send_back'):
+    if result not in ACTION_RESULTS:
         return jsonify({'error': 'result must be approve, reject, or send_back'}), 400
+    full = request.args.get('full') == '1'
+    expected, error = _expected_version(data)
+    if error:
+        return jsonify({'error': error}), 400
 
-    conn = get_mysql_conn() if DB_TYPE.lower() == 'mysql' else get_sqlite_conn()
-    row = _load_request(conn, request_id)
-    if not row:
+    conn = get_conn()
+    try:
+        # queue behind other writers before reading the state this action moves on from
+        conn.begin_write()
+        state = _load_states(conn, [request_id]).get(request_id)
+        if not state:
+            return jsonify({'error': 'Not found'}), 404
+        version = int(state['version'])
+        if expected is not None and expected != version:
+            return _version_conflict(conn, request_id, version)
+        current_status = state.get('status')
+        current_step_key = state.get('current_step')
+        if current_status in FINAL_STATUSES:
+            return jsonify({'error': 'Request already finalized'}), 400
+        step = _step_by_key(str(current_step_key)) if current_step_key is not None else None
+        if not step:
+            return jsonify({'error': 'Invalid current step'}), 400
+
+        acted_at = now_iso()
+        from_step = step['key']
+        new_status, new_step_key = _compute_transition(from_step, result)
+        step_seconds = migrations.seconds_between(state['queued_at'], acted_at) if state.get('queued_step') == from_step else None
+        action = {
+            'request_id': request_id, 'step_key': from_step, 'step_label': step['label'],
+            'role': data.get('actor_role') or step['role'], 'result': result, 'comment': data.get('comment'),
+            'actor_email': data.get('actor_email'), 'actor_id': data.get('actor_id'), 'actor_name': data.get('actor_name'),
+            'acted_at': acted_at, 'attachments': _attachments_json(data.get('attachment_urls')), 'step_seconds': step_seconds,
+        }
+        ph = _ph()
+        cur = conn.cursor()
+        try:
+            # only the first of two concurrent approvers matches; the other gets 409
+            cur.execute(
+                f'UPDATE close_contract_forms SET status = {ph}, current_step = {ph}, updated_at = {ph}, version = version + 1 '
+                f'WHERE id = {ph} AND current_step = {ph} AND status = {ph} AND version = {ph}',
+                (new_status, new_step_key, acted_at, request_id, current_step_key, current_status, version),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return _version_conflict(conn, request_id)
+            cur.execute(
+                f'INSERT INTO close_contract_actions ({", ".join(action)}) VALUES ({", ".join([ph] * len(action))})',
+                tuple(action.values()),
+            )
+            action = {'id': cur.lastrowid, **action}
+            _set_pending_work(cur, request_id, None if new_status in FINAL_STATUSES else new_step_key, acted_at)
+            _record_event(cur, request_id, result, from_step, new_step_key, new_status, action['actor_email'], acted_at)
+            stats = _StatsDelta()
+            stats.move(current_status, current_step_key, new_status, new_step_key)
+            stats.step(from_step, step_seconds)
+            stats.apply(cur)
+            _adjust_attachment_refs(cur, _attachment_url_list(action['attachments']))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.exception('Failed to record action on close_contract %s', request_id)
+            return jsonify({'error': 'Action failed', 'detail': str(e)}), 500
+        finally:
+            cur.close()
+        _event_broker.notify()
+
+        if full:
+            item = close_contract_row_to_dict(_load_request(conn, request_id))
+            item['actions'] = _fetch_actions_for_request(conn, request_id)
+            return jsonify({'ok': True, 'item': item})
+        item = {'id': request_id, 'status': new_status, 'current_step': new_step_key, 'updated_at': acted_at, 'version': version + 1}
+        return jsonify({'ok': True, 'item': item, 'action': action})
+    finally:
         conn.close()
-        return jsonify({'error': 'Not found'}), 404
 
-    current_status = row.get('status')
-    current_step_key = row.get('current_step')
-    if current_status in ('approved', 'rejected'):
-        conn.close()
-        return jsonify({'error': 'Request already finalized'}), 400
 
-    step_key_str = current_step_key if isinstance(current_step_key, str) else (str(current_step_key) if current_step_key is not None else None)
-    step = _step_by_key(step_key_str)
-    if not step:
+
+ACTION_BATCH_MAX = int(os.getenv('ACTION_BATCH_MAX', '500'))
+
+
+def _load_states(conn, request_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Fetch ``status``/``current_step``/``version`` and queue position for many requests with chunked IN queries."""
+    states: Dict[int, Dict[str, Any]] = {}
+    ph = _ph()
+    for start in range(0, len(request_ids), _IN_BATCH_SIZE):
+        chunk = request_ids[start:start + _IN_BATCH_SIZE]
+        sql = ('SELECT f.id, f.status, f.current_step, f.version, p.step_key AS queued_step, p.queued_at '
+               'FROM close_contract_forms f LEFT JOIN pending_work p ON p.request_id = f.id '
+               f'WHERE f.id IN ({", ".join([ph] * len(chunk))})')
+        for r in _query_dicts(conn, sql, chunk):
+            states[int(r['id'])] = r
+    return states
+
+
+@app.route('/api/close-contracts/actions:batch', methods=['POST'])
+def close_contract_actions_batch():
+    """Apply many approve/reject/send_back actions in one transaction."""
+    data = request.get_json() or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    if len(items) > ACTION_BATCH_MAX:
+        return jsonify({'error': f'at most {ACTION_BATCH_MAX} items per batch'}), 400
+
+    wanted: List[int] = []
+    for item in items:
+        try:
+            rid = int(item.get('id')) if isinstance(item, dict) else None
+        except (TypeError, ValueError):
+            rid = None
+        if rid is not None and rid not in wanted:
+            wanted.append(rid)
+
+    conn = get_conn()
+    try:
+        conn.begin_write()
+        states = _load_states(conn, wanted)
+        acted_at = now_iso()
+        # (status, current_step, version) as read, for the guarded UPDATEs
+        read_states = {rid: (st['status'], st['current_step'], st['version']) for rid, st in states.items()}
+        results: List[Dict[str, Any]] = []
+        # rid, outcome, action row, event row, (old status, old step, from step, step seconds) per applied item
+        applied_items: List[Tuple[int, Dict[str, Any], Tuple[Any, ...], Tuple[Any, ...], Tuple[Any, ...]]] = []
+        touched: List[int] = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({'index': index, 'ok': False, 'error': 'item must be an object'})
+                continue
+            try:
+                rid = int(item.get('id'))
+            except (TypeError, ValueError):
+                results.append({'index': index, 'id': item.get('id'), 'ok': False, 'error': 'id must be an integer'})
+                continue
+            outcome: Dict[str, Any] = {'index': index, 'id': rid}
+            result = (item.get('result') or '').lower()
+            state = states.get(rid)
+            step = _step_by_key(str(state['current_step'])) if state and state.get('current_step') is not None else None
+            expected = item.get('expected_version')
+            expected = None if expected in (None, '') else _to_int(expected)
+            if result not in ACTION_RESULTS:
+                error = 'result must be approve, reject, or send_back'
+            elif expected is None and item.get('expected_version') not in (None, ''):
+                error = 'expected_version must be the version of the request, e.g. 3'
+            elif not state:
+                error = 'Not found'
+            elif expected is not None and expected != int(state['version']):
+                outcome.update({'ok': False, 'conflict': True, 'version': int(state['version']),
+                                'error': 'The request was changed by someone else; reload it and try again'})
+                results.append(outcome)
+                continue
+            elif state.get('status') in FINAL_STATUSES:
+                error = 'Request already finalized'
+            elif not step:
+                error = 'Invalid current step'
+            else:
+                error = None
+            if error:
+                outcome.update({'ok': False, 'error': error})
+                results.append(outcome)
+                continue
+
+            from_step = step['key']
+            new_status, new_step_key = _compute_transition(from_step, result)
+            actor_email = item.get('actor_email') or data.get('actor_email')
+            step_seconds = migrations.seconds_between(state['queued_at'], acted_at) if state.get('queued_step') == from_step else None
+            action_row = (
+                rid, from_step, step['label'], item.get('actor_role') or data.get('actor_role') or step['role'], result,
+                item.get('comment'), actor_email, item.get('actor_id') or data.get('actor_id'),
+                item.get('actor_name') or data.get('actor_name'), acted_at, _attachments_json(item.get('attachment_urls')), step_seconds,
+            )
+            event_row = (rid, result, from_step, new_step_key, new_status, actor_email, acted_at)
+            applied_items.append((rid, outcome, action_row, event_row, (state.get('status'), state.get('current_step'), from_step, step_seconds)))
+            state['status'] = new_status
+            state['current_step'] = new_step_key
+            state['queued_step'] = None if new_status in FINAL_STATUSES else new_step_key
+            state['queued_at'] = acted_at
+            state['version'] = int(state['version']) + 1
+            if rid not in touched:
+                touched.append(rid)
+            outcome.update({'ok': True, 'status': new_status, 'current_step': new_step_key, 'version': state['version']})
+            results.append(outcome)
+
+        if touched:
+            ph = _ph()
+            cur = conn.cursor()
+            try:
+                conflicts = set()
+                # guarded like the single action: a form another write changed becomes a conflict
+                for rid in touched:
+                    read_status, read_step, read_version = read_states[rid]
+                    cur.execute(
+                        f'UPDATE close_contract_forms SET status = {ph}, current_step = {ph}, updated_at = {ph}, version = {ph} '
+                        f'WHERE id = {ph} AND current_step = {ph} AND status = {ph} AND version = {ph}',
+                        (states[rid]['status'], states[rid]['current_step'], acted_at, states[rid]['version'],
+                         rid, read_step, read_status, read_version),
+                    )
+                    if cur.rowcount == 0:
+                        conflicts.add(rid)
+                written = [rid for rid in touched if rid not in conflicts]
+                action_rows: List[Tuple[Any, ...]] = []
+                event_rows: List[Tuple[Any, ...]] = []
+                stats = _StatsDelta()
+                for rid, outcome, action_row, event_row, (old_status, old_step, from_step, step_seconds) in applied_items:
+                    if rid in conflicts:
+                        outcome.update({'ok': False, 'conflict': True,
+                                        'error': 'The request was changed by someone else; reload it and try again'})
+                        outcome.pop('status', None)
+                        outcome.pop('current_step', None)
+                        outcome.pop('version', None)
+                        continue
+                    action_rows.append(action_row)
+                    event_rows.append(event_row)
+                    stats.move(old_status, old_step, event_row[4], event_row[3])
+                    stats.step(from_step, step_seconds)
+                if written:
+                    cur.executemany(
+                        'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at, attachments, step_seconds) '
+                        f'VALUES ({", ".join([ph] * 12)})',
+                        action_rows,
+                    )
+                    cur.executemany(f'DELETE FROM pending_work WHERE request_id = {ph}', [(rid,) for rid in written])
+                    queued = [(rid, states[rid]['current_step'], acted_at) for rid in written
+                              if states[rid]['status'] not in FINAL_STATUSES and states[rid]['current_step']]
+                    if queued:
+                        cur.executemany(f'INSERT INTO pending_work (request_id, step_key, queued_at) VALUES ({ph}, {ph}, {ph})', queued)
+                    cur.executemany(
+                        'INSERT INTO close_contract_events (request_id, event_type, from_step, to_step, status, actor_email, created_at) '
+                        f'VALUES ({", ".join([ph] * 7)})',
+                        event_rows,
+                    )
+                    stats.apply(cur)
+                    _adjust_attachment_refs(cur, [url for r in action_rows for url in _attachment_url_list(r[10])])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.exception('Batch action failed')
+                return jsonify({'error': f'Batch failed, nothing was applied: {e}'}), 500
+            finally:
+                cur.close()
+            if written:
+                _event_broker.notify()
+    finally:
         conn.close()
-        return jsonify({'error': 'Invalid current step'}), 400
-
-    acted_at = now_iso()
-    actor_email = data.get('actor_email')
-    actor_id = data.get('actor_id')
-    actor_name = data.get('actor_name')
-    actor_role = data.get('actor_role') or step['role']
-    comment = data.get('comment')
-    attachments = data.get('attachment_urls') or []
-    if isinstance(attachments, str):
+
+    applied = sum(1 for r in results if r['ok'])
+    return jsonify({'ok': True, 'applied': applied, 'failed': len(results) - applied, 'results': results})
+
+
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', '1000'))
+_IMPORT_INT_FIELDS = ('paid_term', 'total_term', 's_count', 'a_count', 'b_count', 'c_count', 'f_count', 'interest_months', 'created_by_id')
+_IMPORT_FLOAT_FIELDS = ('principal_remaining', 'interest_remaining', 'penalty_remaining', 'others_remaining',
+                        'principal_willing', 'interest_willing', 'penalty_willing', 'others_willing')
+_ImportRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+def _import_format(filename: Optional[str], mimetype: Optional[str]) -> Optional[str]:
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.csv' or mimetype == 'text/csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson') or mimetype in ('application/jsonl', 'application/x-ndjson', 'application/x-jsonlines'):
+        return 'jsonl'
+    return None
+
+
+def _iter_import_rows(stream: Iterable[Any], fmt: str) -> Iterator[_ImportRow]:
+    """Yield ``(line_no, payload, error)`` from a CSV/JSONL byte stream, one line at a time."""
+    lines = (raw.decode('utf-8-sig', errors='replace') if isinstance(raw, bytes) else raw for raw in stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
         try:
-            parsed = json.loads(attachments)
-            if isinstance(parsed, list):
-                attachments = parsed
-        except Exception:
-            attachments = [a.strip() for a in attachments.split(',') if a.strip()]
-    attachments_json = json.dumps(attachments) if attachments else None
+            for row in reader:
+                payload = {k.strip(): (v if v != '' else None) for k, v in row.items() if isinstance(k, str) and k.strip()}
+                yield reader.line_num, payload, None
+        except csv.Error as e:
+            yield reader.line_num, None, f'Malformed CSV, import stopped here: {e}'
+        return
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payload = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(payload, dict):
+            yield line_no, None, 'Each line must be a JSON object'
+            continue
+        yield line_no, payload, None
 
-    if DB_TYPE.lower() == 'mysql':
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at, attachments)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (request_id, current_step_key, step['label'], actor_role, result, comment, actor_email, actor_id, actor_name, acted_at, attachments_json))  # type: ignore[arg-type]
-    else:
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at, attachments)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (request_id, current_step_key, step['label'], actor_role, result, comment, actor_email, actor_id, actor_name, acted_at, attachments_json))
 
-    new_status = 'under_review'
-    new_step_key = step_key_str
-    if result == 'approve':
-        nxt = _next_step_key(step_key_str)
-        if nxt:
-            new_step_key = nxt
-            new_status = 'under_review'
-        else:
-            new_status = 'approved'
-    elif result == 'reject':
-        new_status = 'rejected'
-    elif result == 'send_back':
-        new_status = 'sent_back'
-        new_step_key = 'submit'
+def _import_row_error(payload: Dict[str, Any]) -> Optional[str]:
+    if not payload.get('contract_no'):
+        return 'contract_no is required'
+    for name in _IMPORT_INT_FIELDS:
+        if payload.get(name) not in (None, '') and _to_int(payload.get(name)) is None:
+            return f'{name} must be an integer'
+    for name in _IMPORT_FLOAT_FIELDS:
+        if payload.get(name) not in (None, '') and _to_float(payload.get(name)) is None:
+            return f'{name} must be a number'
+    return None
 
-    if DB_TYPE.lower() == 'mysql':
-        cur.execute('UPDATE close_contract_forms SET status = %s, current_step = %s, updated_at = %s WHERE id = %s', (new_status, new_step_key, acted_at, request_id))  # type: ignore[arg-type]
+
+def _write_import_chunk(conn, chunk: List[Tuple[int, Dict[str, Any]]]):
+    """Insert forms plus their submit action, queue row, event and summary counts in one transaction."""
+    conn.begin_write()
+    ph = _ph()
+    now = now_iso()
+    current_step_key = 'credit'
+    form_sql = f'INSERT INTO close_contract_forms ({_CLOSE_FORM_INSERT_COLS}) VALUES ({", ".join([ph] * (_CLOSE_FORM_INSERT_COLS.count(",") + 1))})'
+    actions, queued, events = [], [], []
+    stats = _StatsDelta()
+    cur = conn.cursor()
+    try:
+        for _, payload in chunk:
+            values = _close_form_values(payload, payload.get('attachment_url'), current_step_key, now)
+            cur.execute(form_sql, values)
+            stats.form(dict(zip(_CLOSE_FORM_INSERT_NAMES, values)))
+            if cur.lastrowid is None:
+                raise ValueError('Failed to obtain request id after insert')
+            request_id = int(cur.lastrowid)
+            actions.append((request_id, 'submit', 'Submit', 'Submitter', 'submitted', payload.get('remark') or '',
+                            payload.get('created_by_email'), _to_int(payload.get('created_by_id')), payload.get('created_by_name'), now))
+            queued.append((request_id, current_step_key, now))
+            events.append((request_id, 'submitted', 'submit', current_step_key, 'under_review', payload.get('created_by_email'), now))
+        cur.executemany(
+            'INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, actor_id, actor_name, acted_at) '
+            f'VALUES ({", ".join([ph] * 10)})',
+            actions,
+        )
+        cur.executemany(f'INSERT INTO pending_work (request_id, step_key, queued_at) VALUES ({ph}, {ph}, {ph})', queued)
+        cur.executemany(
+            'INSERT INTO close_contract_events (request_id, event_type, from_step, to_step, status, actor_email, created_at) '
+            f'VALUES ({", ".join([ph] * 7)})',
+            events,
+        )
+        stats.apply(cur)
+        _adjust_attachment_refs(cur, [payload.get('attachment_url') for _, payload in chunk])
         conn.commit()
+    finally:
         cur.close()
-        updated = _load_request(conn, request_id)
-        updated = close_contract_row_to_dict(updated)
-        updated['actions'] = _fetch_actions_for_request(conn, request_id)
+
+
+def _import_close_contracts(rows: Iterable[_ImportRow], chunk_size: int = IMPORT_CHUNK_SIZE,
+                            defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Create close-contract requests from parsed rows, ``chunk_size`` rows per transaction."""
+    chunk_size = max(1, chunk_size)
+    defaults = {k: v for k, v in (defaults or {}).items() if v not in (None, '')}
+    summary: Dict[str, Any] = {'rows': 0, 'imported': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+    started = time.perf_counter()
+
+    def fail(line_no: int, error: str):
+        summary['failed'] += 1
+        if len(summary['errors']) < IMPORT_MAX_ERRORS:
+            summary['errors'].append({'line': line_no, 'error': error})
+        else:
+            summary['errors_truncated'] = True
+
+    def flush(chunk: List[Tuple[int, Dict[str, Any]]]):
+        try:
+            _write_import_chunk(conn, chunk)
+            summary['imported'] += len(chunk)
+        except Exception as e:
+            conn.rollback()
+            logging.warning('Import chunk of %d rows failed (%s); retrying row by row', len(chunk), e)
+            for item in chunk:
+                try:
+                    _write_import_chunk(conn, [item])
+                    summary['imported'] += 1
+                except Exception as row_error:
+                    conn.rollback()
+                    fail(item[0], f'Insert failed: {row_error}')
+        _event_broker.notify()
+
+    conn = get_conn()
+    try:
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        for line_no, payload, error in rows:
+            summary['rows'] += 1
+            if payload is not None:
+                for key, value in defaults.items():
+                    if payload.get(key) in (None, ''):
+                        payload[key] = value
+                error = _import_row_error(payload)
+            if error or payload is None:
+                fail(line_no, error or 'Unreadable row')
+                continue
+            chunk.append((line_no, payload))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    finally:
         conn.close()
-        return jsonify({'ok': True, 'item': updated})
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+@app.route('/api/close-contracts/import', methods=['POST'])
+def close_contracts_import():
+    """Bulk-create requests from a CSV or JSONL body (or a multipart ``file``)."""
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'file is required'}), 400
+        stream, fmt = upload.stream, _import_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, _import_format(None, request.mimetype)
+    fmt = (request.args.get('format') or fmt or '').lower()
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    try:
+        chunk_size = int(request.args.get('chunk_size') or IMPORT_CHUNK_SIZE)
+    except ValueError:
+        return jsonify({'error': 'chunk_size must be an integer'}), 400
+    defaults = {k: request.args.get(k) for k in ('created_by_email', 'created_by_id', 'created_by_name')}
+    summary = _import_close_contracts(_iter_import_rows(stream, fmt), chunk_size, defaults)
+    logging.info('Imported %s/%s close_contract rows in %ss', summary['imported'], summary['rows'], summary['seconds'])
+    return jsonify({'ok': True, **summary})
+
+
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '1000'))
+_EXPORT_ACTION_COLUMNS = ['id', 'step_key', 'step_label', 'role', 'result', 'comment', 'actor_email', 'actor_id', 'actor_name', 'acted_at', 'attachments']
+
+
+def _export_rows(where: List[str], params: List[Any]) -> Iterator[List[Tuple[Any, ...]]]:
+    """Yield batches of form x action rows (LEFT JOIN, ordered by form) from a server-side cursor."""
+    cols = ', '.join([f'f.{c}' for c in _CLOSE_FORM_COLUMNS] + [f'a.{c} AS action_{c}' for c in _EXPORT_ACTION_COLUMNS])
+    sql = (f'SELECT {cols} FROM close_contract_forms f '
+           'LEFT JOIN close_contract_actions a ON a.request_id = f.id')
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY f.id ASC, a.acted_at ASC, a.id ASC'
+    conn = get_conn()
+    mysql = DB_TYPE.lower() == 'mysql'
+    finished = False
+    try:
+        cur = conn.cursor(buffered=False) if mysql else conn.cursor()
+        cur.execute(sql, params)
+        while True:
+            batch = cur.fetchmany(EXPORT_FETCH_SIZE)
+            if not batch:
+                break
+            yield [tuple(r) for r in batch]
+        cur.close()
+        finished = True
+    finally:
+        if finished or not mysql:
+            conn.close()
+        else:
+            # an unbuffered MySQL result that was not read to the end cannot be reused
+            conn.invalidate()
+
+
+def _export_csv(batches: Iterator[List[Tuple[Any, ...]]]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(_CLOSE_FORM_COLUMNS + [f'action_{c}' for c in _EXPORT_ACTION_COLUMNS])
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _export_jsonl(batches: Iterator[List[Tuple[Any, ...]]]) -> Iterator[str]:
+    """One JSON object per form with its ``actions``; rows of a form arrive consecutively."""
+    n_form = len(_CLOSE_FORM_COLUMNS)
+    current: Optional[Dict[str, Any]] = None
+    for batch in batches:
+        lines = []
+        for r in batch:
+            if current is None or current['id'] != r[0]:
+                if current is not None:
+                    lines.append(json.dumps(current, default=str))
+                current = dict(zip(_CLOSE_FORM_COLUMNS, r[:n_form]))
+                current['actions'] = []
+            if r[n_form] is not None:
+                action = dict(zip(_EXPORT_ACTION_COLUMNS, r[n_form:]))
+                if action.get('attachments'):
+                    try:
+                        action['attachments'] = json.loads(action['attachments'])
+                    except ValueError:
+                        pass
+                current['actions'].append(action)
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    if current is not None:
+        yield json.dumps(current, default=str) + '\n'
+
+
+@app.route('/api/close-contracts/export', methods=['GET'])
+def close_contracts_export():
+    """Stream forms with their approval history as CSV (one row per action) or JSONL (one line per form)."""
+    fmt = (request.args.get('format') or 'csv').lower()
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    where, params = _close_contract_filters(request.args)
+    batches = _export_rows(where, params)
+    filename = f'close-contracts-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}'
+    if fmt == 'csv':
+        body, mimetype = _export_csv(batches), 'text/csv'
     else:
-        cur.execute('UPDATE close_contract_forms SET status = ?, current_step = ?, updated_at = ? WHERE id = ?', (new_status, new_step_key, acted_at, request_id))
+        body, mimetype = _export_jsonl(batches), 'application/x-ndjson'
+
+    def generate():
+        try:
+            yield from body
+        finally:
+            # hand the connection back as soon as the client goes away
+            batches.close()
+
+    return app.response_class(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@app.cli.group('close-contracts')
+def close_contracts_cli():
+    """Close-contract request commands."""
+
+
+@close_contracts_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+@click.option('--created-by-email', help='Used for rows without created_by_email.')
+def close_contracts_import_command(path, fmt, chunk_size, created_by_email):
+    """Create requests from a CSV or JSONL file, reporting rows that could not be imported."""
+    fmt = fmt or _import_format(path, None)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format csv|jsonl')
+    with open(path, 'rb') as fh:
+        summary = _import_close_contracts(_iter_import_rows(fh, fmt), chunk_size, {'created_by_email': created_by_email})
+    for err in summary['errors']:
+        click.echo(f'line {err["line"]}: {err["error"]}', err=True)
+    rate = summary['imported'] / summary['seconds'] if summary['seconds'] else 0.0
+    click.echo(f'Imported {summary["imported"]} of {summary["rows"]} row(s), {summary["failed"]} failed, '
+               f'in {summary["seconds"]}s ({rate:.0f} rows/sec)')
+
+
+
+# time-in-step percentiles older than this are recomputed in the background on the next read
+ANALYTICS_ROLLUP_SECONDS = float(os.getenv('ANALYTICS_ROLLUP_SECONDS', '300'))
+_STEP_PERCENTILES = (('p50_seconds', 0.50), ('p90_seconds', 0.90), ('p95_seconds', 0.95))
+_rollup_lock = threading.Lock()
+
+
+def _rollup_step_percentiles() -> Dict[str, int]:
+    """Recompute per-step time-in-step percentiles from close_contract_actions.step_seconds."""
+    ph = _ph()
+    computed_at = now_iso()
+    rows = []
+    conn = get_conn()
+    try:
+        for s in CLOSE_STEPS:
+            base = f'FROM close_contract_actions WHERE step_key = {ph} AND step_seconds IS NOT NULL'
+            stat = _query_dicts(conn, f'SELECT COUNT(*) AS n, MAX(step_seconds) AS max_seconds {base}', (s['key'],))[0]
+            n = int(stat['n'] or 0)
+            values = []
+            for _, q in _STEP_PERCENTILES:
+                if not n:
+                    values.append(None)
+                    continue
+                pick = _query_dicts(conn, f'SELECT step_seconds {base} ORDER BY step_seconds LIMIT 1 OFFSET {min(n - 1, int(q * n))}', (s['key'],))
+                values.append(pick[0]['step_seconds'] if pick else None)
+            rows.append((s['key'], n, *values, stat['max_seconds'], computed_at))
+        cur = conn.cursor()
+        try:
+            cur.execute('DELETE FROM analytics_step_percentiles')
+            cur.executemany(
+                'INSERT INTO analytics_step_percentiles (step_key, n, ' + ', '.join(c for c, _ in _STEP_PERCENTILES) + ', max_seconds, computed_at) '
+                f'VALUES ({", ".join([ph] * (len(_STEP_PERCENTILES) + 4))})',
+                rows,
+            )
+            conn.commit()
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+    return {r[0]: r[1] for r in rows}
+
+
+def _rollup_in_background():
+    if not _rollup_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            _rollup_step_percentiles()
+        except Exception:
+            logging.exception('Analytics rollup failed')
+        finally:
+            _rollup_lock.release()
+    threading.Thread(target=run, name='analytics-rollup', daemon=True).start()
+
+
+@app.route('/api/analytics/close-contracts', methods=['GET'])
+def close_contract_analytics():
+    """Dashboard numbers read from the summary tables (constant time, independent of history size)."""
+    conn = get_conn()
+    try:
+        by_status = _query_dicts(conn, 'SELECT status, current_step, n FROM analytics_status_counts WHERE n <> 0 ORDER BY status, current_step')
+        by_collection = _query_dicts(conn, 'SELECT collection_type, n, principal_remaining, principal_willing FROM analytics_collection_totals WHERE n <> 0 ORDER BY collection_type')
+        step_time = {r['step_key']: r for r in _query_dicts(conn, 'SELECT step_key, n, total_seconds FROM analytics_step_time')}
+        percentiles = {r['step_key']: r for r in _query_dicts(conn, 'SELECT * FROM analytics_step_percentiles')}
+    finally:
+        conn.close()
+
+    status_totals: Dict[str, int] = {}
+    for r in by_status:
+        # JSON object keys must be strings: forms without a status are counted as 'unknown'
+        key = r['status'] or 'unknown'
+        status_totals[key] = status_totals.get(key, 0) + int(r['n'])
+    steps = []
+    for s in CLOSE_STEPS:
+        t = step_time.get(s['key']) or {}
+        pct = percentiles.get(s['key']) or {}
+        n = int(t.get('n') or 0)
+        entry = {'step_key': s['key'], 'label': s['label'], 'count': n,
+                 'avg_seconds': float(t['total_seconds']) / n if n else None,
+                 'max_seconds': pct.get('max_seconds'), 'percentiles_count': pct.get('n')}
+        for col, _ in _STEP_PERCENTILES:
+            entry[col] = pct.get(col)
+        steps.append(entry)
+    computed_at = min((p['computed_at'] for p in percentiles.values()), default=None)
+    age = migrations.seconds_between(computed_at, now_iso()) if computed_at else None
+    if ANALYTICS_ROLLUP_SECONDS > 0 and (age is None or age > ANALYTICS_ROLLUP_SECONDS):
+        _rollup_in_background()
+
+    return jsonify({
+        'status_totals': status_totals,
+        'by_status': [{'status': r['status'] or None, 'current_step': r['current_step'] or None, 'count': int(r['n'])} for r in by_status],
+        'by_collection_type': [{
+            'collection_type': r['collection_type'] or None,
+            'count': int(r['n']),
+            'principal_remaining': float(r['principal_remaining']),
+            'principal_willing': float(r['principal_willing']),
+        } for r in by_collection],
+        'step_time': steps,
+        'percentiles_computed_at': computed_at,
+    })
+
+
+@app.cli.group('analytics')
+def analytics_cli():
+    """Analytics summary table commands."""
+
+
+@analytics_cli.command('rollup')
+def analytics_rollup_command():
+    """Recompute time-in-step percentiles (run from cron, or let the endpoint refresh them)."""
+    counts = _rollup_step_percentiles()
+    click.echo('Step percentiles updated: ' + ', '.join(f'{k}={n}' for k, n in counts.items()))
+
+
+@analytics_cli.command('rebuild')
+def analytics_rebuild_command():
+    """Recompute the summary tables from scratch (full scan; use after manual data fixes)."""
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        migrations.rebuild_analytics(cur)
         conn.commit()
         cur.close()
-        updated = _load_request(conn, request_id)
-        updated = close_contract_row_to_dict(updated)
-        updated['actions'] = _fetch_actions_for_request(conn, request_id)
+    finally:
         conn.close()
-        return jsonify({'ok': True, 'item': updated})
+    _rollup_step_percentiles()
+    click.echo('Analytics summaries rebuilt')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,278 @@
+"""Content-addressed storage for uploaded attachments.
+
+Every file is stored once as ``UPLOAD_DIR/<sha256><ext>``; uploading the same
+bytes again reuses that file. URLs carry the original file name as a last path
+segment purely for display (``/uploads/<sha256><ext>/<name>``), so identical
+content uploaded under different names still shares one file. Stored names never
+change meaning, which is what allows immutable cache headers.
+
+Large files can also arrive in pieces: ``create_partial`` opens a resumable
+upload under ``UPLOAD_DIR/.partial/``, ``append_partial`` writes each chunk at
+the offset the client says it continues from, and ``finish_partial`` moves the
+result into the store like any other upload.
+
+This module only touches the filesystem; reference counts live in the
+``attachments`` table and are maintained by app.py.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 1024 * 1024
+# scratch space for uploads in progress; excluded from gc/dedupe scans
+TMP_DIR = '.tmp'
+PARTIAL_DIR = '.partial'
+
+_STORED_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,16})?$')
+_LEGACY_PREFIX_RE = re.compile(r'^[0-9a-f]{32}_')
+_EXT_RE = re.compile(r'^\.[a-z0-9]{1,16}$')
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def extension(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if _EXT_RE.match(ext) else ''
+
+
+def is_stored_name(name: str) -> bool:
+    return bool(_STORED_RE.match(name or ''))
+
+
+def display_name(filename: Optional[str]) -> str:
+    """File name shown to users: sanitized, without the uuid prefix of pre-dedupe uploads."""
+    name = secure_filename(filename or '') or 'attachment'
+    return _LEGACY_PREFIX_RE.sub('', name) or name
+
+
+def url_for(stored_name: str, filename: Optional[str]) -> str:
+    return f'/uploads/{stored_name}/{display_name(filename)}'
+
+
+def stored_name_from_url(url: Optional[str]) -> Optional[str]:
+    """The content-addressed file behind an ``/uploads/...`` URL (``None`` for legacy or foreign URLs)."""
+    if not url or not isinstance(url, str):
+        return None
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    marker = path.find('/uploads/')
+    if marker < 0:
+        return None
+    first = path[marker + len('/uploads/'):].split('/', 1)[0]
+    return first if is_stored_name(first) else None
+
+
+def tmp_path(upload_dir: str) -> str:
+    """Create an empty scratch file next to the store (same filesystem, so placing it is a rename)."""
+    tmp_dir = os.path.join(upload_dir, TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=tmp_dir)
+    os.close(fd)
+    return path
+
+
+def place(upload_dir: str, path: str, sha256: str, filename: Optional[str]) -> str:
+    """Move a fully written scratch file to its content-addressed name and return that name.
+
+    If the blob already exists the scratch copy is dropped. Two concurrent
+    uploads of the same bytes both rename onto the same name, which is harmless.
+    """
+    name = sha256 + extension(filename)
+    target = os.path.join(upload_dir, name)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.replace(path, target)
+    return name
+
+
+def store_stream(upload_dir: str, stream: BinaryIO, filename: Optional[str]) -> Tuple[str, str, int]:
+    """Copy ``stream`` to disk in chunks while hashing it; returns ``(stored_name, sha256, size)``."""
+    path = tmp_path(upload_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        return place(upload_dir, path, sha256, filename), sha256, size
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the partial upload currently ends."""
+
+    def __init__(self, offset: int):
+        super().__init__(f'upload is at offset {offset}')
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+# running hashes of partial uploads appended to by this process, keyed by upload id;
+# finish_partial falls back to reading the file when the chunks went elsewhere
+_partial_hashes: Dict[str, Tuple[int, Any]] = {}
+_partial_hashes_lock = threading.Lock()
+_PARTIAL_HASHES_MAX = 256
+_append_lock = threading.Lock()
+
+
+def _partial_paths(upload_dir: str, upload_id: str) -> Tuple[str, str]:
+    base = os.path.join(upload_dir, PARTIAL_DIR, upload_id)
+    return base, base + '.json'
+
+
+def create_partial(upload_dir: str, filename: Optional[str], length: Optional[int],
+                   content_type: Optional[str] = None) -> Dict[str, Any]:
+    """Start a resumable upload; ``length`` is the final size if the client knows it."""
+    upload_id = os.urandom(16).hex()
+    os.makedirs(os.path.join(upload_dir, PARTIAL_DIR), exist_ok=True)
+    data_path, meta_path = _partial_paths(upload_dir, upload_id)
+    meta = {'upload_id': upload_id, 'filename': filename, 'length': length,
+            'content_type': content_type, 'created_at': datetime.utcnow().isoformat() + 'Z'}
+    open(data_path, 'wb').close()
+    _write_meta(meta_path, meta)
+    return dict(meta, offset=0)
+
+
+def _write_meta(meta_path: str, meta: Dict[str, Any]):
+    tmp = meta_path + '.part'
+    with open(tmp, 'w') as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, meta_path)
+
+
+def partial_info(upload_dir: str, upload_id: str) -> Optional[Dict[str, Any]]:
+    """Metadata plus current ``offset`` of an upload (``None`` if unknown or expired)."""
+    if not _UPLOAD_ID_RE.match(upload_id or ''):
+        return None
+    data_path, meta_path = _partial_paths(upload_dir, upload_id)
+    try:
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if meta.get('stored_name'):
+        return dict(meta, offset=meta.get('size'))
+    try:
+        meta['offset'] = os.path.getsize(data_path)
+    except OSError:
+        return None
+    return meta
+
+
+def append_partial(upload_dir: str, upload_id: str, offset: int, stream: BinaryIO, max_size: int) -> int:
+    """Write ``stream`` at ``offset`` and return the new offset.
+
+    Bytes are flushed as they arrive, so when the connection drops mid-chunk
+    whatever was received is kept and the client resumes from the offset it
+    reads back. The file is locked while appending; a chunk that does not start
+    at the current end raises ``OffsetMismatch``.
+    """
+    data_path, _ = _partial_paths(upload_dir, upload_id)
+    with _append_lock if fcntl is None else nullcontext(), open(data_path, 'ab') as out:
+        if fcntl is not None:
+            fcntl.flock(out.fileno(), fcntl.LOCK_EX)
+        current = os.fstat(out.fileno()).st_size
+        if current != offset:
+            raise OffsetMismatch(current)
+        with _partial_hashes_lock:
+            running = _partial_hashes.pop(upload_id, None)
+        digest = running[1] if running and running[0] == offset else (hashlib.sha256() if offset == 0 else None)
+        size = offset
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size + len(chunk) > max_size:
+                    out.truncate(offset)
+                    size, digest = offset, None
+                    raise UploadTooLarge(f'upload would exceed {max_size} bytes')
+                out.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                size += len(chunk)
+        finally:
+            out.flush()
+            if digest is not None:
+                with _partial_hashes_lock:
+                    _partial_hashes[upload_id] = (size, digest)
+                    while len(_partial_hashes) > _PARTIAL_HASHES_MAX:
+                        _partial_hashes.pop(next(iter(_partial_hashes)))
+    return size
+
+
+def finish_partial(upload_dir: str, upload_id: str) -> Tuple[str, str, int]:
+    """Move a complete partial upload into the store; returns ``(stored_name, sha256, size)``.
+
+    The metadata file stays behind with the result, so a client retrying a
+    commit whose response it never saw gets the same answer.
+    """
+    data_path, meta_path = _partial_paths(upload_dir, upload_id)
+    with open(meta_path) as fh:
+        meta = json.load(fh)
+    if meta.get('stored_name'):
+        return meta['stored_name'], meta['sha256'], meta['size']
+    size = os.path.getsize(data_path)
+    with _partial_hashes_lock:
+        running = _partial_hashes.pop(upload_id, None)
+    sha256 = running[1].hexdigest() if running and running[0] == size else hash_file(data_path)
+    stored_name = place(upload_dir, data_path, sha256, meta.get('filename'))
+    meta.update(stored_name=stored_name, sha256=sha256, size=size)
+    _write_meta(meta_path, meta)
+    return stored_name, sha256, size
+
+
+def discard_partial(upload_dir: str, upload_id: str):
+    with _partial_hashes_lock:
+        _partial_hashes.pop(upload_id, None)
+    for path in _partial_paths(upload_dir, upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def prune_scratch(upload_dir: str, max_age_seconds: float, dry_run: bool = False) -> int:
+    """Delete scratch files and partial uploads untouched for ``max_age_seconds``; returns how many."""
+    cutoff = time.time() - max_age_seconds
+    stale = []
+    for sub in (TMP_DIR, PARTIAL_DIR):
+        path = os.path.join(upload_dir, sub)
+        if os.path.isdir(path):
+            stale.extend(e.path for e in os.scandir(path) if e.is_file() and e.stat().st_mtime < cutoff)
+    if not dry_run:
+        for path in stale:
+            os.remove(path)
+    # count a partial upload (data file plus .json) once
+    return sum(1 for p in stale if os.path.basename(os.path.dirname(p)) == TMP_DIR or p.endswith('.json'))
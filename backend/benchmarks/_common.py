@@ -0,0 +1,58 @@
+"""Shared helpers for the backend benchmarks.
+
+The benchmarks run against a throw-away SQLite database so they never touch the
+database configured in ``backend/.env`` (``seed.py``/``loadtest.py`` use it
+only when given ``--mysql``). Run them from the ``backend`` folder, e.g.
+``python benchmarks/bench_login.py``.
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def load_app(db_path: str = '', mysql: bool = False):
+    """Import app.py pointed at a scratch SQLite file (or the .env MySQL database) and migrate it."""
+    import app as app_module  # load_dotenv(override=True) runs here
+
+    if mysql:
+        db_path = f'mysql://{os.getenv("DB_HOST", "127.0.0.1")}:{os.getenv("DB_PORT", "3308")}/{os.getenv("DB_NAME", "approval_db")}'
+    elif not db_path:
+        fd, db_path = tempfile.mkstemp(prefix='approval-bench-', suffix='.db')
+        os.close(fd)
+        os.remove(db_path)
+    if not mysql:
+        os.environ['SQLITE_PATH'] = db_path
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    app_module.app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
+    app_module.DB_TYPE = 'mysql' if mysql else 'sqlite'
+    for pool in app_module._pools.values():
+        pool.dispose()
+    app_module._pools.clear()
+    app_module.ensure_close_contract_tables()
+    return app_module, db_path
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+def time_calls(fn: Callable[[], object], n: int) -> List[float]:
+    """Call fn n times and return per-call latencies in milliseconds."""
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
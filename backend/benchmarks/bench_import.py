@@ -0,0 +1,72 @@
+"""Bulk-import throughput: rows/sec for CSV and JSONL through the import endpoint.
+
+    python benchmarks/bench_import.py [-n 20000] [--chunk-size 500]
+
+Generates synthetic contracts in memory, posts them to
+/api/close-contracts/import and reports the server-side rate. For comparison
+it also creates a few hundred forms one at a time through POST
+/api/close-contracts.
+"""
+import argparse
+import csv
+import io
+import json
+import time
+
+from _common import load_app
+
+FIELDS = ['contract_no', 'collection_type', 'person_in_charge', 'paid_term', 'total_term',
+          'principal_remaining', 'interest_remaining', 'remark', 'created_by_email']
+
+
+def make_rows(n, prefix):
+    for i in range(n):
+        yield {
+            'contract_no': f'{prefix}-{i:07d}', 'collection_type': 'normal', 'person_in_charge': 'Bench',
+            'paid_term': i % 36, 'total_term': 36, 'principal_remaining': round(i * 1.5, 2),
+            'interest_remaining': 12.5, 'remark': 'imported', 'created_by_email': 'bench@example.com',
+        }
+
+
+def as_csv(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode()
+
+
+def as_jsonl(rows):
+    return ''.join(json.dumps(r) + '\n' for r in rows).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=20000, help='rows per format')
+    parser.add_argument('--chunk-size', type=int, default=500, help='rows per transaction')
+    args = parser.parse_args()
+
+    app_module, db_path = load_app()
+    client = app_module.app.test_client()
+    print(f'database: {db_path}')
+
+    for fmt, encode, content_type in (('csv', as_csv, 'text/csv'), ('jsonl', as_jsonl, 'application/x-ndjson')):
+        body = encode(make_rows(args.n, fmt))
+        t0 = time.perf_counter()
+        r = client.post(f'/api/close-contracts/import?chunk_size={args.chunk_size}', data=body, content_type=content_type)
+        elapsed = time.perf_counter() - t0
+        summary = r.get_json()
+        assert r.status_code == 200 and summary['imported'] == args.n, summary
+        print(f'{fmt:>7}: {args.n / elapsed:9.0f} rows/sec  ({args.n} rows in {elapsed:.2f}s, chunk={args.chunk_size})')
+
+    n_single = max(1, min(500, args.n // 10))
+    t0 = time.perf_counter()
+    for row in make_rows(n_single, 'single'):
+        r = client.post('/api/close-contracts', json=row)
+        assert r.status_code == 201, r.data
+    elapsed = time.perf_counter() - t0
+    print(f' single: {n_single / elapsed:9.0f} rows/sec  ({n_single} POSTs in {elapsed:.2f}s)')
+
+
+if __name__ == '__main__':
+    main()
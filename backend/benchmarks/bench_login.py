@@ -0,0 +1,48 @@
+"""Logins per second per core: password login vs. token re-login.
+
+    python benchmarks/bench_login.py [-n 200]
+
+Runs in a single thread, so the numbers are per core. Password logins pay for
+the configured hash (PASSWORD_HASH_METHOD or werkzeug's default); token logins
+pay only for an HMAC check and one indexed user lookup.
+"""
+import argparse
+import statistics
+
+from _common import load_app, percentiles, time_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=200, help='logins per mode')
+    args = parser.parse_args()
+
+    app_module, db_path = load_app()
+    conn = app_module.get_conn()
+    conn.execute('INSERT INTO users (email, password_hash, role) VALUES (?, ?, ?)',
+                 ('bench@example.com', app_module._hash_password('bench-pass'), 'User'))
+    conn.commit()
+    conn.close()
+
+    client = app_module.app.test_client()
+    first = client.post('/api/login', json={'email': 'bench@example.com', 'password': 'bench-pass'})
+    token = first.get_json()['token']
+
+    def password_login():
+        r = client.post('/api/login', json={'email': 'bench@example.com', 'password': 'bench-pass'})
+        assert r.status_code == 200, r.data
+
+    def token_login():
+        r = client.post('/api/login', json={'token': token})
+        assert r.status_code == 200, r.data
+
+    print(f'database: {db_path}')
+    for name, fn, n in (('password', password_login, max(1, args.n // 10)), ('token', token_login, args.n)):
+        samples = time_calls(fn, n)
+        p = percentiles(samples)
+        per_sec = 1000.0 / statistics.mean(samples)
+        print(f'{name:>8}: {per_sec:9.1f} logins/sec/core  p50={p["p50"]:.2f}ms p95={p["p95"]:.2f}ms p99={p["p99"]:.2f}ms (n={n})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Listing payload size and serialization cost: before/after compression, orjson and fields=.
+
+    python benchmarks/bench_payload.py [-n 2000] [--repeat 20]
+
+Seeds forms with realistic long ``remark``/``last_contract_info`` text, then
+reports for GET /api/close-contracts:
+- JSON encode time of the listing body with the stdlib encoder (sorted keys, as
+  Flask did before) vs. the app's provider (orjson when installed);
+- bytes on the wire and request latency for identity, gzip and (if the brotli
+  module is installed) br, with and without a ``fields=`` projection.
+"""
+import argparse
+import json
+import random
+import statistics
+
+from _common import load_app, percentiles, time_calls
+
+LIST_FIELDS = 'contract_no,collection_type,person_in_charge,status,current_step,principal_remaining,principal_willing'
+WORDS = ('contract', 'customer', 'payment', 'overdue', 'agreed', 'settlement', 'branch', 'vehicle', 'term', 'interest')
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=2000, help='forms in the listing')
+    parser.add_argument('--repeat', type=int, default=20, help='requests per variant')
+    args = parser.parse_args()
+
+    app_module, db_path = load_app()
+    rng = random.Random(42)
+    rows = [{
+        'contract_no': f'P-{i:07d}', 'collection_type': rng.choice(['car', 'bike', 'home']), 'person_in_charge': 'Field Agent',
+        'principal_remaining': round(rng.uniform(100, 9000), 2), 'principal_willing': round(rng.uniform(50, 5000), 2),
+        'last_contract_info': text(rng, 60), 'remark': text(rng, 40), 'created_by_email': 'bench@example.com',
+    } for i in range(args.n)]
+    body = ''.join(json.dumps(r) + '\n' for r in rows).encode()
+    client = app_module.app.test_client()
+    r = client.post('/api/close-contracts/import', data=body, content_type='application/x-ndjson')
+    assert r.status_code == 200 and r.get_json()['imported'] == args.n, r.data
+    print(f'database: {db_path}')
+
+    listing = client.get('/api/close-contracts', headers={'Accept-Encoding': 'identity'}).get_json()
+    stdlib = time_calls(lambda: json.dumps(listing, sort_keys=True, separators=(',', ':')), args.repeat)
+    provider = time_calls(lambda: app_module.app.json.dumps(listing), args.repeat)
+    encoder = 'orjson' if app_module.orjson is not None else 'stdlib, unsorted'
+    print(f'encode {args.n} forms: stdlib sorted p50={percentiles(stdlib)["p50"]:.1f}ms  '
+          f'app provider ({encoder}) p50={percentiles(provider)["p50"]:.1f}ms')
+
+    encodings = ['identity', 'gzip'] + (['br'] if app_module.brotli is not None else [])
+    baseline = None
+    for fields in (None, LIST_FIELDS):
+        url = '/api/close-contracts' + (f'?fields={fields}' if fields else '')
+        for enc in encodings:
+            resp = client.get(url, headers={'Accept-Encoding': enc})
+            size = len(resp.get_data())
+            baseline = baseline or size
+            samples = time_calls(lambda: client.get(url, headers={'Accept-Encoding': enc}), args.repeat)
+            label = f'{"fields" if fields else "all columns"}, {enc}'
+            print(f'{label:>22}: {size:>10,} bytes ({size / baseline:6.1%})  '
+                  f'mean={statistics.mean(samples):.1f}ms p95={percentiles(samples)["p95"]:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
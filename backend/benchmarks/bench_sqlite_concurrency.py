@@ -0,0 +1,152 @@
+"""Concurrent read and write throughput of SQLite under each SQLITE_PROFILE.
+
+    python benchmarks/bench_sqlite_concurrency.py --forms 20000
+    python benchmarks/bench_sqlite_concurrency.py --db /tmp/bench.db --readers 16 --writers 8
+
+Readers fetch form details and listing pages while writers approve forms and
+post comments, all at once for ``--duration`` seconds. Every profile starts
+from its own copy of the same seeded file (``--db``, or ``--forms`` forms
+seeded by seed.py) and runs in a fresh process, since the profile is read when
+app.py is imported. Results are operations/sec, latency percentiles in ms and
+failed requests (``database is locked`` shows up here) for each side.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from _common import load_app, percentiles
+
+PROFILES = ('default', 'production')
+READS = ('detail', 'list')
+WRITES = ('action', 'comment')
+
+
+def _summary(samples: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    p = percentiles(samples)
+    return {
+        'ops': len(samples), 'errors': errors, 'ops_per_sec': round(len(samples) / elapsed, 1),
+        'p50_ms': round(p['p50'], 2), 'p95_ms': round(p['p95'], 2), 'p99_ms': round(p['p99'], 2),
+        'mean_ms': round(statistics.mean(samples), 2) if samples else 0.0,
+    }
+
+
+def run_mix(scenarios, readers: int, writers: int, duration: float, seed: int) -> Dict[str, Any]:
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    samples: Dict[str, List[float]] = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    locked = [0]
+
+    def worker(index):
+        side, names = ('read', READS) if index < readers else ('write', WRITES)
+        rng = random.Random(seed * 1000 + index)
+        mine: List[float] = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                status, body = scenarios[rng.choice(names)](rng)
+            except Exception as e:
+                status, body = 0, str(e).encode()
+            mine.append((time.perf_counter() - t0) * 1000.0)
+            if not 200 <= status < 300:
+                failed += 1
+                if b'locked' in body:
+                    with lock:
+                        locked[0] += 1
+        with lock:
+            samples[side].extend(mine)
+            errors[side] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=readers + writers) as pool:
+        list(pool.map(worker, range(readers + writers)))
+    elapsed = time.perf_counter() - started
+    return {
+        'read': _summary(samples['read'], errors['read'], elapsed),
+        'write': _summary(samples['write'], errors['write'], elapsed),
+        'database_locked': locked[0],
+    }
+
+
+def child(args):
+    """Run the mix against ``args.db`` with the profile set in the environment; print JSON."""
+    from loadtest import TestClientTransport, load_fixture, make_scenarios
+
+    app_module, _ = load_app(args.db)
+    fixture = load_fixture(app_module)
+    scenarios = make_scenarios(TestClientTransport(app_module), fixture, args.list_limit, args.seed)
+    result = run_mix(scenarios, args.readers, args.writers, args.duration, args.seed)
+    conn = app_module.get_conn()
+    try:
+        result['journal_mode'] = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        conn.close()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--forms', type=int, default=10000, help='forms to seed when no --db is given')
+    parser.add_argument('--db', default='', help='an already seeded SQLite file (copied, never modified)')
+    parser.add_argument('--readers', type=int, default=8, help='threads reading')
+    parser.add_argument('--writers', type=int, default=4, help='threads writing')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per profile')
+    parser.add_argument('--list-limit', type=int, default=50, help='page size of the listing reads')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='comma-separated SQLITE_PROFILE values to compare')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for ids and users')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        parser.error(f'unknown profile(s): {", ".join(unknown)}')
+
+    work_dir = tempfile.mkdtemp(prefix='approval-bench-')
+    try:
+        template = args.db
+        if not template:
+            template = os.path.join(work_dir, 'template.db')
+            app_module, _ = load_app(template)
+            from seed import seed
+            print(f'seeding {args.forms:,} forms into {template}')
+            seed(app_module, args.forms)
+            for pool in app_module._pools.values():
+                pool.dispose()
+        print(f'readers={args.readers} writers={args.writers} duration={args.duration:g}s list_limit={args.list_limit}')
+        for profile in profiles:
+            db = os.path.join(work_dir, f'{profile}.db')
+            shutil.copyfile(template, db)
+            cmd = [sys.executable, os.path.abspath(__file__), '--child', '--db', db,
+                   '--readers', str(args.readers), '--writers', str(args.writers),
+                   '--duration', str(args.duration), '--list-limit', str(args.list_limit), '--seed', str(args.seed)]
+            out = subprocess.run(cmd, env={**os.environ, 'SQLITE_PROFILE': profile}, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.exit(f'{profile} run failed:\n{out.stderr[-2000:]}')
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f'{profile} (journal_mode={r["journal_mode"]}, {r["database_locked"]} "database is locked" errors)')
+            for side in ('read', 'write'):
+                s = r[side]
+                print(f'  {side:>5}: {s["ops_per_sec"]:9.1f} ops/s  p50={s["p50_ms"]:.2f}ms p95={s["p95_ms"]:.2f}ms '
+                      f'p99={s["p99_ms"]:.2f}ms  ({s["ops"]} ops, {s["errors"]} errors)', flush=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Load test of the main API endpoints at fixed concurrency, with a JSON baseline.
+
+    python benchmarks/loadtest.py --forms 10000 --save baseline.json
+    python benchmarks/loadtest.py --db /tmp/bench.db --baseline baseline.json
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --db /tmp/bench.db --concurrency 16
+
+Each scenario runs for ``--duration`` seconds on ``--concurrency`` threads:
+password login, token login, the listing (a page of ``--list-limit`` forms, 0
+for the whole list as the Flutter client requests it) with and without
+``include_actions``, detail, approve action and comment POST. Results are
+requests/sec and p50/p95/p99/mean latency in ms.
+
+Without ``--url`` requests go through Flask's test client in this process
+(no network, one GIL), which is the most repeatable for comparing commits.
+With ``--url`` they go over HTTP keep-alive connections to a running server;
+``--db``/``--mysql`` must then name the database that server uses (the test
+picks ids and users from it). Without ``--db`` a scratch SQLite database with
+``--forms`` forms is seeded first (see seed.py).
+
+The action and comment scenarios write to the database, so for strictly
+comparable runs start each one from a copy of the same seeded file.
+
+``--save`` writes the results as a baseline; ``--baseline`` compares against
+one and exits with status 1 when a scenario's p95 grew, or its throughput
+fell, by more than ``--tolerance``.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from _common import BACKEND_DIR, load_app, percentiles
+
+SCENARIOS = ('login', 'login_token', 'list', 'list_actions', 'detail', 'action', 'comment')
+
+
+class TestClientTransport:
+    def __init__(self, app_module):
+        self._app = app_module.app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        resp = client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_data()
+
+
+class HttpTransport:
+    """One keep-alive connection per thread."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self._https = parts.scheme == 'https'
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self._netloc, timeout=60)
+        return conn
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, self._prefix + path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        raise AssertionError('unreachable')
+
+
+def load_fixture(app_module) -> Dict[str, Any]:
+    """Ids and users the scenarios pick from."""
+    conn = app_module.get_conn()
+    try:
+        ids = [r['id'] for r in app_module._query_dicts(conn, 'SELECT id FROM close_contract_forms')]
+        # actions need forms that are still waiting at an approval step
+        open_ids = [r['request_id'] for r in app_module._query_dicts(
+            conn, "SELECT request_id FROM pending_work WHERE step_key <> 'submit'")]
+        emails = [r['email'] for r in app_module._query_dicts(
+            conn, "SELECT email FROM users WHERE email LIKE 'bench%@example.com'")]
+    finally:
+        conn.close()
+    if not ids or not emails:
+        sys.exit('the database has no forms or bench users; run benchmarks/seed.py first')
+    return {'ids': ids, 'open_ids': open_ids, 'emails': emails}
+
+
+def make_scenarios(transport, fixture: Dict[str, Any], list_limit: int, seed: int) -> Dict[str, Callable[[random.Random], Tuple[int, bytes]]]:
+    from seed import PASSWORD
+
+    ids, emails = fixture['ids'], fixture['emails']
+    open_ids = list(fixture['open_ids'])
+    random.Random(seed).shuffle(open_ids)
+    open_lock = threading.Lock()
+    status, body = transport.request('POST', '/api/login', {'email': emails[0], 'password': PASSWORD})
+    if status != 200:
+        sys.exit(f'login failed ({status}): {body[:200]!r}')
+    token = json.loads(body)['token']
+    listing = f'/api/close-contracts?limit={list_limit}&' if list_limit else '/api/close-contracts?'
+
+    def action(rng):
+        # every form is approved at most once per run; afterwards actions fail and are counted as errors
+        with open_lock:
+            request_id = open_ids.pop() if open_ids else rng.choice(ids)
+        return transport.request('POST', f'/api/close-contracts/{request_id}/action',
+                                 {'result': 'approve', 'comment': 'load test', 'actor_email': rng.choice(emails)})
+
+    return {
+        'login': lambda rng: transport.request('POST', '/api/login', {'email': rng.choice(emails), 'password': PASSWORD}),
+        'login_token': lambda rng: transport.request('POST', '/api/login', {'token': token}),
+        'list': lambda rng: transport.request('GET', listing.rstrip('?&')),
+        'list_actions': lambda rng: transport.request('GET', listing + 'include_actions=1'),
+        'detail': lambda rng: transport.request('GET', f'/api/close-contracts/{rng.choice(ids)}'),
+        'action': action,
+        'comment': lambda rng: transport.request('POST', f'/api/close-contracts/{rng.choice(ids)}/comments',
+                                                 {'text': 'load test comment', 'user_email': rng.choice(emails)}),
+    }
+
+
+def run_scenario(fn: Callable[[random.Random], Tuple[int, bytes]], concurrency: int, duration: float, seed: int) -> Dict[str, Any]:
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        samples: List[float] = []
+        errors = 0
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                status, _ = fn(rng)
+            except Exception:
+                status = 0
+            samples.append((time.perf_counter() - t0) * 1000.0)
+            if not 200 <= status < 300:
+                errors += 1
+        return samples, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    samples = [s for r in results for s in r[0]]
+    p = percentiles(samples)
+    return {
+        'requests': len(samples), 'errors': sum(r[1] for r in results),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(p['p50'], 2), 'p95_ms': round(p['p95'], 2), 'p99_ms': round(p['p99'], 2),
+        'mean_ms': round(statistics.mean(samples), 2) if samples else 0.0,
+    }
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Scenario names whose p95 or throughput regressed by more than ``tolerance`` (a fraction)."""
+    regressed = []
+    print(f'\ncompared with baseline from {baseline.get("meta", {}).get("timestamp", "?")} (tolerance {tolerance:.0%}):')
+    for name, now in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f'  {name:>13}: not in baseline')
+            continue
+        p95_change = now['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        rps_change = now['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        bad = p95_change > tolerance or rps_change < -tolerance
+        if bad:
+            regressed.append(name)
+        print(f'  {name:>13}: p95 {base["p95_ms"]:8.2f} -> {now["p95_ms"]:8.2f}ms ({p95_change:+7.1%})  '
+              f'rps {base["rps"]:9.1f} -> {now["rps"]:9.1f} ({rps_change:+7.1%}){"  REGRESSION" if bad else ""}')
+    return regressed
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--forms', type=int, default=10000, help='forms to seed when no --db/--mysql is given')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--db', default='', help='an already seeded SQLite file')
+    target.add_argument('--mysql', action='store_true', help='use the (seeded) MySQL database configured in backend/.env')
+    parser.add_argument('--url', help='drive a running server instead of the in-process test client')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads sending requests')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per scenario')
+    parser.add_argument('--list-limit', type=int, default=50, help='page size of the listing scenarios (0 = full list)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'comma-separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for ids and users')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare with this JSON file; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed p95/throughput change vs. the baseline')
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenario(s): {", ".join(unknown)}')
+
+    app_module, db_path = load_app(args.db, mysql=args.mysql)
+    if not args.db and not args.mysql:
+        from seed import seed
+        print(f'seeding {args.forms:,} forms into {db_path}')
+        seed(app_module, args.forms)
+    transport = HttpTransport(args.url) if args.url else TestClientTransport(app_module)
+    fixture = load_fixture(app_module)
+    scenarios = make_scenarios(transport, fixture, args.list_limit, args.seed)
+    print(f'database: {db_path} ({len(fixture["ids"]):,} forms, {len(fixture["open_ids"]):,} open)  '
+          f'target: {args.url or "test client"}  concurrency={args.concurrency} duration={args.duration:g}s')
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        results[name] = r = run_scenario(scenarios[name], args.concurrency, args.duration, args.seed)
+        print(f'  {name:>13}: {r["rps"]:9.1f} req/s  p50={r["p50_ms"]:.2f}ms p95={r["p95_ms"]:.2f}ms '
+              f'p99={r["p99_ms"]:.2f}ms  ({r["requests"]} requests, {r["errors"]} errors)', flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'git': git_revision(),
+            'forms': len(fixture['ids']), 'dialect': app_module._dialect(), 'target': 'http' if args.url else 'test_client',
+            'concurrency': args.concurrency, 'duration': args.duration, 'list_limit': args.list_limit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        print(f'saved {args.save}')
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        for key in ('forms', 'dialect', 'target', 'concurrency', 'list_limit'):
+            if baseline.get('meta', {}).get(key) != report['meta'][key]:
+                print(f'warning: baseline {key}={baseline.get("meta", {}).get(key)!r}, this run {report["meta"][key]!r}')
+        regressed = compare(baseline, results, args.tolerance)
+        if regressed:
+            print(f'regressions: {", ".join(regressed)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Fill a database with synthetic forms, actions, comments and users for load tests.
+
+    python benchmarks/seed.py --forms 100000 --db /tmp/bench.db
+    python benchmarks/seed.py --forms 1000000 --mysql      # the database in backend/.env
+
+Each form walks the approval steps with ``--actions`` actions (mostly approvals,
+some send-backs and resubmissions, a few rejections), so the data has the
+usual mix of open, approved and rejected requests. The pending work queue and
+analytics summaries are filled in to match. Users ``bench0@example.com`` ...
+log in with the password ``bench-pass``. Rows are written with executemany in
+transactions of ``--batch`` forms; the same seed always produces the same data.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from _common import load_app
+
+PASSWORD = 'bench-pass'
+WORDS = ('contract', 'customer', 'payment', 'overdue', 'agreed', 'settlement', 'branch', 'vehicle', 'term', 'interest')
+
+
+def user_email(i):
+    return f'bench{i}@example.com'
+
+
+def seed_users(app_module, conn, n):
+    ph = app_module._ph()
+    password_hash = app_module._hash_password(PASSWORD)
+    existing = {r['email'] for r in app_module._query_dicts(conn, 'SELECT email FROM users')}
+    rows = [(user_email(i), password_hash, 'User', 'Bench', f'B{i:05d}', 'Bench', f'User {i}')
+            for i in range(n) if user_email(i) not in existing]
+    cur = conn.cursor()
+    cur.executemany(
+        f'INSERT INTO users (email, password_hash, role, department, staff_no, first_name, last_name) '
+        f'VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})', rows)
+    conn.commit()
+    cur.close()
+
+
+def _iso(t):
+    return t.isoformat() + 'Z'
+
+
+def generate_form(app_module, rng, form_id, created, n_actions, n_comments, users):
+    """Rows for one form: (form values, actions, comments, pending_work row or None)."""
+    steps = {s['key']: s for s in app_module.CLOSE_STEPS}
+    creator = rng.randrange(users)
+    payload = {
+        'contract_no': f'BENCH-{form_id:08d}', 'collection_type': rng.choice(['car', 'bike', 'home']),
+        'person_in_charge': 'Field Agent', 'manager_in_charge': 'Branch Manager',
+        'paid_term': rng.randint(0, 36), 'total_term': 36,
+        'principal_remaining': round(rng.uniform(100, 9000), 2), 'principal_willing': round(rng.uniform(50, 5000), 2),
+        'interest_remaining': round(rng.uniform(0, 900), 2), 'remark': ' '.join(rng.choice(WORDS) for _ in range(12)),
+        'created_by_email': user_email(creator), 'created_by_id': creator + 1,
+    }
+    values = list(app_module._close_form_values(payload, None, 'credit', _iso(created)))
+    status, step, queued = 'under_review', 'credit', created
+    t = created
+    actions = []
+    for _ in range(n_actions):
+        if status in app_module.FINAL_STATUSES:
+            break
+        t += timedelta(minutes=rng.randint(5, 48 * 60))
+        actor = rng.randrange(users)
+        if step == 'submit':
+            result, label, role = 'resubmitted', 'Submit', 'Submitter'
+            status, next_step = 'under_review', 'credit'
+        else:
+            result = rng.choices(('approve', 'send_back', 'reject'), (90, 7, 3))[0]
+            label, role = steps[step]['label'], steps[step]['role']
+            status, next_step = app_module._compute_transition(step, result)
+        actions.append((form_id, step, label, role, result, rng.choice(WORDS), user_email(actor), actor + 1,
+                        f'User {actor}', _iso(t), None, (t - queued).total_seconds()))
+        step, queued = next_step, t
+    names = app_module._CLOSE_FORM_INSERT_NAMES
+    values[names.index('status')] = status
+    values[names.index('current_step')] = step
+    values[names.index('updated_at')] = _iso(t)
+    comments = []
+    for c in range(n_comments):
+        who = rng.randrange(users)
+        comments.append((form_id, who + 1, user_email(who), f'User {who}',
+                         ' '.join(rng.choice(WORDS) for _ in range(8)), _iso(created + timedelta(minutes=30 * (c + 1)))))
+    pending = None if status in app_module.FINAL_STATUSES else (form_id, step, _iso(queued))
+    return [form_id] + values, actions, comments, pending
+
+
+def seed_forms(app_module, conn, n, n_actions, n_comments, users, batch, rng):
+    ph = app_module._ph()
+    cols = app_module._CLOSE_FORM_COLUMNS
+    form_sql = f'INSERT INTO close_contract_forms ({", ".join(cols)}) VALUES ({", ".join([ph] * len(cols))})'
+    action_sql = ('INSERT INTO close_contract_actions (request_id, step_key, step_label, role, result, comment, actor_email, '
+                  f'actor_id, actor_name, acted_at, attachments, step_seconds) VALUES ({", ".join([ph] * 12)})')
+    comment_sql = ('INSERT INTO close_contract_comments (request_id, user_id, user_email, user_name, text, created_at) '
+                   f'VALUES ({", ".join([ph] * 6)})')
+    pending_sql = f'INSERT INTO pending_work (request_id, step_key, queued_at) VALUES ({ph}, {ph}, {ph})'
+
+    cur = conn.cursor()
+    cur.execute('SELECT COALESCE(MAX(id), 0) FROM close_contract_forms')
+    first_id = int(cur.fetchone()[0]) + 1
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(seconds=max(1, 365 * 24 * 3600 // max(n, 1)))
+    t0 = time.perf_counter()
+    for lo in range(0, n, batch):
+        forms, actions, comments, pending = [], [], [], []
+        for i in range(lo, min(n, lo + batch)):
+            f, a, c, p = generate_form(app_module, rng, first_id + i, start + step * i, n_actions, n_comments, users)
+            forms.append(f)
+            actions.extend(a)
+            comments.extend(c)
+            if p:
+                pending.append(p)
+        cur.executemany(form_sql, forms)
+        cur.executemany(action_sql, actions)
+        cur.executemany(comment_sql, comments)
+        cur.executemany(pending_sql, pending)
+        conn.commit()
+        done = min(n, lo + batch)
+        print(f'  {done:>9,}/{n:,} forms  ({done / (time.perf_counter() - t0):,.0f} forms/sec)', flush=True)
+    cur.close()
+
+
+def seed(app_module, forms, actions=5, comments=2, users=20, batch=5000, seed_value=42):
+    conn = app_module.get_conn()
+    try:
+        sqlite = app_module._dialect() == 'sqlite'
+        if sqlite:
+            # durability does not matter for a benchmark fixture; restored below
+            old_sync = conn.execute('PRAGMA synchronous').fetchone()[0]
+            conn.execute('PRAGMA synchronous = OFF')
+        seed_users(app_module, conn, users)
+        seed_forms(app_module, conn, forms, actions, comments, users, batch, random.Random(seed_value))
+        cur = conn.cursor()
+        app_module.migrations.rebuild_analytics(cur)
+        conn.commit()
+        cur.close()
+        if sqlite:
+            conn.execute('ANALYZE')
+            conn.execute(f'PRAGMA synchronous = {int(old_sync)}')
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--forms', type=int, default=10000, help='forms to add (10k-1M are typical)')
+    parser.add_argument('--actions', type=int, default=5, help='actions per form (fewer when a form is finished early)')
+    parser.add_argument('--comments', type=int, default=2, help='comments per form')
+    parser.add_argument('--users', type=int, default=20, help='bench users who submit, approve and comment')
+    parser.add_argument('--batch', type=int, default=5000, help='forms per transaction')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--db', default='', help='SQLite file to create or extend (default: a new temp file)')
+    target.add_argument('--mysql', action='store_true', help='seed the MySQL database configured in backend/.env')
+    args = parser.parse_args()
+
+    app_module, db_path = load_app(args.db, mysql=args.mysql)
+    print(f'database: {db_path}')
+    t0 = time.perf_counter()
+    seed(app_module, args.forms, args.actions, args.comments, args.users, args.batch, args.seed)
+    print(f'seeded {args.forms:,} forms in {time.perf_counter() - t0:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
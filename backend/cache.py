@@ -0,0 +1,127 @@
+"""Read-through caches with a TTL and LRU eviction.
+
+A ``Cache`` is a named view on a ``backend``: it keeps ``loader()`` results
+under ``<name>:<key>`` for ``ttl`` seconds and counts hits and misses. The
+default ``MemoryBackend`` lives in this process, so with several workers a
+change made through one worker reaches the others once their entries expire;
+``ttl`` bounds how stale a read can be. A shared store (Redis, memcached)
+plugs in by implementing the ``get``/``set``/``delete``/``clear`` methods of
+``MemoryBackend`` (see ``load_backend``); values are plain dicts and lists so
+they can be serialized.
+"""
+import importlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# returned by Backend.get for a key that is absent or expired (None is a valid cached value)
+MISSING = object()
+
+
+class MemoryBackend:
+    """Thread-safe LRU map with a per-entry expiry time."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        # key -> (expires_at_monotonic, value), least recently used first
+        self._data: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self, prefix: str = ''):
+        with self._lock:
+            if not prefix:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class Cache:
+    def __init__(self, name: str, backend: Any, ttl: float,
+                 on_lookup: Optional[Callable[[str, bool], None]] = None):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.on_lookup = on_lookup
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+        # bumped by invalidate()/clear(): a load that overlapped one is not stored
+        self._generation = 0
+
+    def _key(self, key: Any) -> str:
+        return f'{self.name}:{key}'
+
+    def get_or_load(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """The cached value of ``key``, or ``loader()``'s result (cached unless ttl is 0)."""
+        if self.ttl <= 0:
+            return loader()
+        value = self.backend.get(self._key(key))
+        hit = value is not MISSING
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+            generation = self._generation
+        if self.on_lookup is not None:
+            self.on_lookup(self.name, hit)
+        if hit:
+            return value
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self.backend.set(self._key(key), value, self.ttl)
+        return value
+
+    def invalidate(self, *keys: Any):
+        with self._lock:
+            self._generation += 1
+            self.backend.delete(*(self._key(k) for k in keys))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.backend.clear(self._key(''))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        lookups = out['hits'] + out['misses']
+        out.update({'name': self.name, 'ttl': self.ttl, 'hit_rate': out['hits'] / lookups if lookups else 0.0})
+        return out
+
+
+def load_backend(spec: str, max_entries: int = 10000) -> Any:
+    """``''``/``memory`` for a ``MemoryBackend``, or ``package.module:factory`` for a shared one."""
+    if not spec or spec == 'memory':
+        return MemoryBackend(max_entries)
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise RuntimeError(f'CACHE_BACKEND must be memory or module:factory, not {spec!r}')
+    return getattr(importlib.import_module(module_name), attr)()
@@ -0,0 +1,403 @@
+"""Small connection pool shared by the Flask handlers.
+
+A pool is owned by one process: after a fork (gunicorn workers) the inherited
+idle connections are dropped and new ones are opened lazily. Within a process
+the pool is shared across threads; a thread that borrows while it already holds
+a connection gets the same one back, so helpers such as ``query_user`` can be
+called from inside a handler without taking a second connection.
+
+Optional hooks report how long each borrow waited (``on_acquire``) and the SQL,
+time and row count of every statement run through ``cursor()`` (``on_query``).
+
+A pool created with ``writer_lock=True`` lets one borrower at a time write:
+``conn.begin_write()`` waits for the pool's writer lock and opens the
+transaction with ``BEGIN IMMEDIATE``; ``commit()``, ``rollback()`` or returning
+the connection hands the lock to the next writer. Readers never take it. This
+is for SQLite, which allows a single writer per database file — queueing
+writers in the process beats having them spin on ``database is locked``.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available within the wait timeout."""
+
+
+class TimedCursor:
+    """Cursor proxy that reports ``(sql, seconds, rows)`` of each statement to ``on_query``.
+
+    The time covers ``execute()`` plus fetching its rows (SQLite does most of
+    its work while fetching). A statement is reported when its rows are
+    exhausted, on the next ``execute()``, or on ``close()``.
+    """
+
+    def __init__(self, raw: Any, on_query: Callable[[str, float, int], None]):
+        self._raw = raw
+        self._on_query = on_query
+        self._sql: Optional[str] = None
+        self._seconds = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self._on_query(sql, self._seconds, self._rows)
+
+    def _run(self, method, sql, args, kwargs):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = method(sql, *args, **kwargs)
+        finally:
+            self._sql, self._seconds, self._rows = sql, time.perf_counter() - start, 0
+        # sqlite3 returns the cursor itself; keep callers on the proxy
+        return self if result is self._raw else result
+
+    def execute(self, sql, *args, **kwargs):
+        return self._run(self._raw.execute, sql, args, kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._run(self._raw.executemany, sql, args, kwargs)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._raw.fetchone()
+        self._seconds += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = self._raw.fetchmany(*args, **kwargs)
+        self._seconds += time.perf_counter() - start
+        if rows:
+            self._rows += len(rows)
+        else:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._raw.fetchall()
+        self._seconds += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class PooledConnection:
+    """Proxy around a DB-API connection; ``close()`` returns it to the pool."""
+
+    def __init__(self, pool: 'ConnectionPool', raw: Any):
+        self._pool = pool
+        self._raw = raw
+        self._depth = 1
+        self._closed = False
+        self._writing = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def cursor(self, *args, **kwargs):
+        raw = self._raw.cursor(*args, **kwargs)
+        on_query = self._pool.on_query
+        return TimedCursor(raw, on_query) if on_query is not None else raw
+
+    def begin_write(self) -> bool:
+        """Take the pool's writer lock and start a write transaction.
+
+        Returns False (and does nothing) when the pool has no writer lock, so
+        callers can use it unconditionally. Call it before the transaction's
+        first statement that must see the latest data.
+        """
+        if self._pool._writer is None:
+            return False
+        if self._writing:
+            return True
+        self._pool._acquire_writer()
+        self._writing = True
+        try:
+            if not getattr(self._raw, 'in_transaction', False):
+                self._raw.execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._end_write()
+            raise
+        return True
+
+    def _end_write(self):
+        if self._writing:
+            self._writing = False
+            self._pool._writer.release()
+
+    def commit(self):
+        try:
+            self._raw.commit()
+        finally:
+            self._end_write()
+
+    def rollback(self):
+        try:
+            self._raw.rollback()
+        finally:
+            self._end_write()
+
+    def close(self):
+        if self._closed:
+            return
+        self._depth -= 1
+        if self._depth <= 0:
+            self._closed = True
+            self._pool._release(self)
+
+    def invalidate(self):
+        """Drop the underlying connection instead of returning it for reuse."""
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self, broken=True)
+
+
+class ConnectionPool:
+    def __init__(self, name: str, factory: Callable[[], Any], ping: Callable[[Any], None],
+                 size: int = 5, timeout: float = 10.0, max_idle: float = 300.0,
+                 ping_interval: float = 30.0,
+                 on_acquire: Optional[Callable[[str, float], None]] = None,
+                 on_query: Optional[Callable[[str, float, int], None]] = None,
+                 writer_lock: bool = False,
+                 on_writer_wait: Optional[Callable[[str, float], None]] = None):
+        self.name = name
+        self._factory = factory
+        self._ping = ping
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+        self.on_acquire = on_acquire
+        self.on_query = on_query
+        self.writer_lock = writer_lock
+        self.on_writer_wait = on_writer_wait
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        # idle entries are (raw_connection, last_used_monotonic)
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._waiters: Deque[object] = deque()
+        self._local = threading.local()
+        self._writer = threading.Lock() if self.writer_lock else None
+        self._stats: Dict[str, float] = {
+            'created': 0, 'reused': 0, 'closed': 0, 'evicted_idle': 0,
+            'failed_health_checks': 0, 'waits': 0, 'wait_timeouts': 0,
+            'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0,
+            'writes': 0, 'writer_waits': 0, 'writer_timeouts': 0,
+            'writer_wait_seconds_total': 0.0, 'writer_wait_seconds_max': 0.0,
+        }
+
+    def _check_pid(self):
+        # a forked child must never reuse the parent's sockets/file handles
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._reset_state()
+
+    def connection(self) -> PooledConnection:
+        """Borrow a connection; call ``close()`` to return it."""
+        self._check_pid()
+        held = getattr(self._local, 'conn', None)
+        if held is not None and not held._closed:
+            held._depth += 1
+            return held
+        if self.on_acquire is None:
+            raw = self._checkout()
+        else:
+            start = time.perf_counter()
+            raw = self._checkout()
+            self.on_acquire(self.name, time.perf_counter() - start)
+        conn = PooledConnection(self, raw)
+        self._local.conn = conn
+        return conn
+
+    def _checkout(self) -> Any:
+        deadline = None
+        waited_from = None
+        ticket = None
+        with self._cond:
+            while True:
+                self._evict_idle_locked()
+                # waiters are served in arrival order; a thread that just returned a
+                # connection must not take it straight back from someone queued longer
+                turn = not self._waiters or self._waiters[0] is ticket
+                if turn and (self._idle or self._in_use < self.size):
+                    if ticket is not None:
+                        self._waiters.popleft()
+                        if self._waiters:
+                            self._cond.notify_all()
+                    self._in_use += 1
+                    if self._idle:
+                        raw, last_used = self._idle.pop()
+                    else:
+                        raw, last_used = None, None
+                    break
+                now = time.monotonic()
+                if waited_from is None:
+                    waited_from = now
+                    deadline = now + self.timeout
+                    ticket = object()
+                    self._waiters.append(ticket)
+                    self._stats['waits'] += 1
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+                    self._stats['wait_timeouts'] += 1
+                    raise PoolTimeout(f'{self.name} pool exhausted ({self.size} connections in use)')
+                self._cond.wait(remaining)
+            if waited_from is not None:
+                waited = time.monotonic() - waited_from
+                self._stats['wait_seconds_total'] += waited
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        if raw is not None:
+            # only ping connections that sat idle for a while; a hot connection is trusted
+            if last_used is not None and time.monotonic() - last_used >= self.ping_interval:
+                try:
+                    self._ping(raw)
+                except Exception as e:
+                    logging.warning('%s pool: dropping connection that failed health check: %s', self.name, e)
+                    self._stats['failed_health_checks'] += 1
+                    self._close_raw(raw)
+                    raw = None
+            if raw is not None:
+                self._stats['reused'] += 1
+                return raw
+        try:
+            raw = self._factory()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify_all()
+            raise
+        self._stats['created'] += 1
+        return raw
+
+    def _acquire_writer(self):
+        if self._writer.acquire(blocking=False):
+            waited = 0.0
+        else:
+            start = time.perf_counter()
+            acquired = self._writer.acquire(timeout=self.timeout)
+            waited = time.perf_counter() - start
+            with self._cond:
+                self._stats['writer_waits'] += 1
+                if not acquired:
+                    self._stats['writer_timeouts'] += 1
+                else:
+                    self._stats['writer_wait_seconds_total'] += waited
+                    self._stats['writer_wait_seconds_max'] = max(self._stats['writer_wait_seconds_max'], waited)
+            if not acquired:
+                raise PoolTimeout(f'{self.name} pool: writer lock not free after {self.timeout:g}s')
+        with self._cond:
+            self._stats['writes'] += 1
+        if self.on_writer_wait is not None:
+            self.on_writer_wait(self.name, waited)
+
+    def _release(self, conn: PooledConnection, broken: bool = False):
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+        raw = conn._raw
+        if self._pid != os.getpid():
+            return
+        if not broken:
+            try:
+                # never hand an open transaction to the next borrower
+                if getattr(raw, 'in_transaction', False):
+                    raw.rollback()
+            except Exception:
+                broken = True
+        conn._end_write()
+        with self._cond:
+            self._in_use -= 1
+            if not broken:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify_all()
+        if broken:
+            self._close_raw(raw)
+
+    def _evict_idle_locked(self):
+        if not self._idle or self.max_idle <= 0:
+            return
+        cutoff = time.monotonic() - self.max_idle
+        keep = []
+        for raw, last_used in self._idle:
+            if last_used < cutoff:
+                self._stats['evicted_idle'] += 1
+                self._close_raw(raw)
+            else:
+                keep.append((raw, last_used))
+        self._idle = keep
+
+    def _close_raw(self, raw: Any):
+        self._stats['closed'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def release_current(self) -> bool:
+        """Return a connection this thread forgot to close (e.g. after an exception)."""
+        held = getattr(self._local, 'conn', None)
+        if held is None or held._closed:
+            return False
+        held._depth = 1
+        held.close()
+        return True
+
+    def dispose(self):
+        """Close every idle connection (borrowed ones are closed on return)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update({'name': self.name, 'size': self.size, 'in_use': self._in_use, 'idle': len(self._idle)})
+        return out
@@ -0,0 +1,283 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+No client library is needed: counters, gauges and histograms live in this
+process and ``Registry.render()`` produces the ``/metrics`` body. With several
+worker processes each one reports its own numbers (Prometheus adds them up when
+every worker is scraped, e.g. one port per worker).
+
+A ``RequestTimer`` collects the time one request spends in named parts
+(database, connection acquire, handler sections wrapped in ``span()``) for
+the ``Server-Timing`` header and the per-span histogram.
+"""
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+# label sets beyond this are folded into one "other" series (e.g. unexpected SQL shapes)
+DEFAULT_MAX_SERIES = 500
+# per-statement histograms: every series carries a full set of buckets
+QUERY_MAX_SERIES = 50
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), max_series: int = DEFAULT_MAX_SERIES):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        key = tuple([str(labels.get(n, '')) for n in self.labelnames])
+        if len(self._values) >= self.max_series and key not in self._values:
+            return ('other',) * len(self.labelnames)
+        return key
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(str(labels.get(n, '')) for n in self.labelnames), 0)
+
+
+class Gauge(_Metric):
+    """A value that is set, or read at scrape time from ``collect()`` (``[(labels, value), ...]``)."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 collect: Optional[Callable[[], Iterable[Tuple[Dict[str, Any], float]]]] = None):
+        super().__init__(name, help, labelnames)
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        if self._collect is not None:
+            values = {tuple(str(l.get(n, '')) for n in self.labelnames): v for l, v in self._collect()}
+            with self._lock:
+                self._values = values
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, max_series: int = DEFAULT_MAX_SERIES):
+        super().__init__(name, help, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        # bucket i counts values <= buckets[i]; the last slot is +Inf
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = 'le="%s"' % _format_value(bound)
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS, max_series: int = DEFAULT_MAX_SERIES) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets, max_series))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# the keyword that precedes the statement's main table, by leading verb
+_TABLE_KEYWORD = {'select': 'FROM', 'delete': 'FROM', 'insert': 'INTO', 'replace': 'INTO', 'update': 'UPDATE'}
+# schema changes (migrations) run once; one series per verb keeps them from using up the series cap
+_DDL_VERBS = ('create', 'alter', 'drop')
+
+
+def _top_level_word(text: str, word: str, start: int = 0) -> int:
+    """Index of the first ``word`` (case-insensitive) at parenthesis depth 0, or -1."""
+    depth = 0
+    upper = text.upper()
+    for i in range(start, len(text)):
+        ch = text[i]
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth == 0 and upper.startswith(word, i) and (i == 0 or not text[i - 1].isalnum() and text[i - 1] != '_'):
+            end = i + len(word)
+            if end == len(text) or not (text[end].isalnum() or text[end] == '_'):
+                return i
+    return -1
+
+
+def normalize(sql: str) -> str:
+    """SQL with literals, placeholder lists and the SELECT column list collapsed.
+
+    Dropping the column list makes ``fields=`` variants of one query the same
+    statement.
+    """
+    text = _STRING_RE.sub('?', sql).replace('%s', '?')
+    text = _NUMBER_RE.sub('?', text)
+    text = _PLACEHOLDER_LIST_RE.sub('(...)', text)
+    text = _SPACE_RE.sub(' ', text).strip()
+    if text[:6].upper() == 'SELECT':
+        at = _top_level_word(text, 'FROM', 6)
+        if at > 0:
+            text = 'SELECT ... ' + text[at:]
+    return text
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Short, stable label for a statement: ``<verb> <table> <hash of normalize(sql)>``."""
+    text = normalize(sql)
+    words = _WORD_RE.findall(text[:16])
+    verb = words[0].lower() if words else '?'
+    if verb in _DDL_VERBS:
+        return verb
+    parts = [verb]
+    keyword = _TABLE_KEYWORD.get(verb)
+    if keyword:
+        at = _top_level_word(text, keyword)
+        table = _WORD_RE.match(text, at + len(keyword) + 1) if at >= 0 else None
+        if table:
+            parts.append(table.group(0))
+    parts.append(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8])
+    return ' '.join(parts)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # name -> [seconds, count], in first-seen order
+        self.parts: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        part = self.parts.get(name)
+        if part is None:
+            self.parts[name] = [seconds, 1]
+        else:
+            part[0] += seconds
+            part[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        entries = [f'{name};dur={seconds * 1000:.2f};desc="{int(count)}x"' for name, (seconds, count) in self.parts.items()]
+        entries.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(entries)
+
+
+_local = threading.local()
+
+
+def start_timer() -> RequestTimer:
+    timer = RequestTimer()
+    _local.timer = timer
+    return timer
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return getattr(_local, 'timer', None)
+
+
+def stop_timer():
+    _local.timer = None
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the current request under ``name``."""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
@@ -0,0 +1,583 @@
+"""Versioned schema migrations for the approval tables (SQLite and MySQL).
+
+Each migration is a function ``(cur, dialect)`` registered in ``MIGRATIONS``
+with an increasing version number. ``upgrade()`` applies the ones newer than
+the version recorded in ``schema_migrations`` and records each as it succeeds,
+so a migration runs exactly once per database. Never edit a migration that has
+shipped; add a new one instead.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def _now_iso():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def seconds_between(start: Any, end: Any) -> Optional[float]:
+    """Seconds from ``start`` to ``end`` (ISO strings or datetimes); ``None`` if either is unreadable."""
+    def parse(value):
+        if isinstance(value, datetime):
+            return value.replace(tzinfo=None)
+        try:
+            return datetime.fromisoformat(str(value).rstrip('Z')).replace(tzinfo=None)
+        except ValueError:
+            return None
+    a, b = parse(start), parse(end)
+    if a is None or b is None:
+        return None
+    return max(0.0, (b - a).total_seconds())
+
+
+def table_columns(cur, dialect: str, table: str) -> Set[str]:
+    if dialect == 'mysql':
+        cur.execute(f'SHOW COLUMNS FROM {table}')
+        return {row[0] for row in cur.fetchall()}
+    cur.execute(f"PRAGMA table_info('{table}')")
+    return {row[1] for row in cur.fetchall()}
+
+
+def _create_index(cur, dialect: str, name: str, table: str, columns: str):
+    # MySQL has no CREATE INDEX IF NOT EXISTS; the version table guarantees a single run
+    if dialect == 'mysql':
+        cur.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+    else:
+        cur.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+def _m001_base_tables(cur, dialect: str):
+    """users + close contract forms/actions/comments, as previously created at import."""
+    if dialect == 'mysql':
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            role VARCHAR(100) NOT NULL DEFAULT 'User',
+            department VARCHAR(255),
+            staff_no VARCHAR(100),
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            nickname VARCHAR(255),
+            under_manager VARCHAR(255),
+            last_login DATETIME,
+            status VARCHAR(50) NOT NULL DEFAULT 'active'
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_forms (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            collection_type VARCHAR(255),
+            contract_no VARCHAR(255) NOT NULL,
+            person_in_charge VARCHAR(255),
+            manager_in_charge VARCHAR(255),
+            last_contract_info TEXT,
+            paid_term INT,
+            total_term INT,
+            full_paid_date VARCHAR(64),
+            s_count INT,
+            a_count INT,
+            b_count INT,
+            c_count INT,
+            f_count INT,
+            principal_remaining DECIMAL(18,2),
+            interest_remaining DECIMAL(18,2),
+            penalty_remaining DECIMAL(18,2),
+            others_remaining DECIMAL(18,2),
+            principal_willing DECIMAL(18,2),
+            interest_willing DECIMAL(18,2),
+            interest_months INT,
+            penalty_willing DECIMAL(18,2),
+            others_willing DECIMAL(18,2),
+            remark TEXT,
+            attachment_url TEXT,
+            status VARCHAR(64),
+            current_step VARCHAR(64),
+            created_by_email VARCHAR(255),
+            created_by_id INT,
+            created_at VARCHAR(64),
+            updated_at VARCHAR(64)
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_actions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            request_id INT NOT NULL,
+            step_key VARCHAR(64) NOT NULL,
+            step_label VARCHAR(255) NOT NULL,
+            role VARCHAR(255),
+            result VARCHAR(64) NOT NULL,
+            comment TEXT,
+            actor_email VARCHAR(255),
+            actor_id INT,
+            actor_name VARCHAR(255),
+            acted_at VARCHAR(64),
+            attachments TEXT,
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_comments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            request_id INT NOT NULL,
+            user_id INT,
+            user_email VARCHAR(255),
+            user_name VARCHAR(255),
+            text TEXT NOT NULL,
+            created_at VARCHAR(64),
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+    else:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'User',
+            department TEXT,
+            staff_no TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            nickname TEXT,
+            under_manager TEXT,
+            last_login TEXT,
+            status TEXT NOT NULL DEFAULT 'active'
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_forms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_type TEXT,
+            contract_no TEXT NOT NULL,
+            person_in_charge TEXT,
+            manager_in_charge TEXT,
+            last_contract_info TEXT,
+            paid_term INTEGER,
+            total_term INTEGER,
+            full_paid_date TEXT,
+            s_count INTEGER,
+            a_count INTEGER,
+            b_count INTEGER,
+            c_count INTEGER,
+            f_count INTEGER,
+            principal_remaining REAL,
+            interest_remaining REAL,
+            penalty_remaining REAL,
+            others_remaining REAL,
+            principal_willing REAL,
+            interest_willing REAL,
+            interest_months INTEGER,
+            penalty_willing REAL,
+            others_willing REAL,
+            remark TEXT,
+            attachment_url TEXT,
+            status TEXT,
+            current_step TEXT,
+            created_by_email TEXT,
+            created_by_id INTEGER,
+            created_at TEXT,
+            updated_at TEXT
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER NOT NULL,
+            step_key TEXT NOT NULL,
+            step_label TEXT NOT NULL,
+            role TEXT,
+            result TEXT NOT NULL,
+            comment TEXT,
+            actor_email TEXT,
+            actor_id INTEGER,
+            actor_name TEXT,
+            acted_at TEXT,
+            attachments TEXT,
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER NOT NULL,
+            user_id INTEGER,
+            user_email TEXT,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            created_at TEXT,
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+    # databases created by older init_db.py runs lack the attachments column
+    if 'attachments' not in table_columns(cur, dialect, 'close_contract_actions'):
+        cur.execute('ALTER TABLE close_contract_actions ADD COLUMN attachments TEXT')
+
+
+def _m002_listing_indexes(cur, dialect: str):
+    """Indexes for the role inbox, "my requests", keyset paging and detail lookups."""
+    _create_index(cur, dialect, 'ix_ccf_step_status_created', 'close_contract_forms', 'current_step, status, created_at, id')
+    _create_index(cur, dialect, 'ix_ccf_creator_created', 'close_contract_forms', 'created_by_email, created_at, id')
+    _create_index(cur, dialect, 'ix_ccf_status_created', 'close_contract_forms', 'status, created_at, id')
+    _create_index(cur, dialect, 'ix_ccf_created', 'close_contract_forms', 'created_at, id')
+    _create_index(cur, dialect, 'ix_cca_request_acted', 'close_contract_actions', 'request_id, acted_at, id')
+    _create_index(cur, dialect, 'ix_ccc_request_created', 'close_contract_comments', 'request_id, created_at, id')
+
+
+def _m003_pending_work(cur, dialect: str):
+    """Denormalized approval queue: one row per open request, keyed by the step that owes work."""
+    if dialect == 'mysql':
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS pending_work (
+            request_id INT PRIMARY KEY,
+            step_key VARCHAR(64) NOT NULL,
+            queued_at VARCHAR(64) NOT NULL,
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+    else:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS pending_work (
+            request_id INTEGER PRIMARY KEY,
+            step_key TEXT NOT NULL,
+            queued_at TEXT NOT NULL,
+            FOREIGN KEY (request_id) REFERENCES close_contract_forms(id)
+        )
+        ''')
+    _create_index(cur, dialect, 'ix_pending_step_queued', 'pending_work', 'step_key, queued_at, request_id')
+    # backfill open requests; very old rows may carry the role label instead of the step key
+    cur.execute('''
+        INSERT INTO pending_work (request_id, step_key, queued_at)
+        SELECT id,
+               CASE current_step
+                   WHEN 'Submitter' THEN 'submit'
+                   WHEN 'Credit Approval' THEN 'credit'
+                   WHEN 'System Approval' THEN 'system'
+                   WHEN 'COO & Admin Approval' THEN 'coo'
+                   WHEN 'LMS Void Approval' THEN 'lms'
+                   ELSE current_step
+               END,
+               COALESCE(updated_at, created_at, '')
+        FROM close_contract_forms
+        WHERE current_step IS NOT NULL
+          AND (status IS NULL OR status NOT IN ('approved', 'rejected'))
+    ''')
+
+
+# (content table, full-text index name, indexed columns); app.py searches the same columns
+FULLTEXT_INDEXES = [
+    ('users', 'users_fts', ['email', 'first_name', 'last_name', 'staff_no']),
+    ('close_contract_forms', 'close_contract_forms_fts', ['contract_no', 'person_in_charge', 'manager_in_charge', 'remark']),
+    ('close_contract_comments', 'close_contract_comments_fts', ['text']),
+]
+
+
+def _create_sqlite_fts(cur, table: str, fts: str, columns: List[str]):
+    """External-content FTS5 table kept in sync with ``table`` by triggers."""
+    cols = ', '.join(columns)
+    new_vals = ', '.join(f'new.{c}' for c in columns)
+    old_vals = ', '.join(f'old.{c}' for c in columns)
+    cur.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id')")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+            INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+    ''')
+    # index the rows that already exist
+    cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _m004_fulltext(cur, dialect: str):
+    """Full-text search: FTS5 + triggers on SQLite, FULLTEXT indexes on MySQL."""
+    for table, fts, columns in FULLTEXT_INDEXES:
+        if dialect == 'mysql':
+            # InnoDB maintains FULLTEXT indexes on every insert/update by itself
+            cur.execute(f'ALTER TABLE {table} ADD FULLTEXT INDEX {fts} ({", ".join(columns)})')
+        else:
+            _create_sqlite_fts(cur, table, fts, columns)
+
+
+def _m005_event_log(cur, dialect: str):
+    """Durable log of approval state changes; its ids are the SSE event ids."""
+    if dialect == 'mysql':
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            request_id INT NOT NULL,
+            event_type VARCHAR(64) NOT NULL,
+            from_step VARCHAR(64),
+            to_step VARCHAR(64),
+            status VARCHAR(64),
+            actor_email VARCHAR(255),
+            created_at VARCHAR(64) NOT NULL
+        )
+        ''')
+    else:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS close_contract_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            from_step TEXT,
+            to_step TEXT,
+            status TEXT,
+            actor_email TEXT,
+            created_at TEXT NOT NULL
+        )
+        ''')
+    _create_index(cur, dialect, 'ix_cce_created', 'close_contract_events', 'created_at')
+
+
+def _backfill_step_seconds(cur, dialect: str, span: int = 5000):
+    """Time in step for past actions: the gap since the previous action on the same request."""
+    ph = '%s' if dialect == 'mysql' else '?'
+    cur.execute('SELECT MAX(request_id) FROM close_contract_actions')
+    top = cur.fetchall()[0][0] or 0
+    for low in range(0, int(top), span):
+        cur.execute(
+            f'SELECT id, request_id, acted_at FROM close_contract_actions '
+            f'WHERE request_id > {ph} AND request_id <= {ph} ORDER BY request_id, acted_at, id',
+            (low, low + span),
+        )
+        updates = []
+        prev_request, prev_at = None, None
+        for action_id, request_id, acted_at in cur.fetchall():
+            if request_id == prev_request:
+                seconds = seconds_between(prev_at, acted_at)
+                if seconds is not None:
+                    updates.append((seconds, action_id))
+            prev_request, prev_at = request_id, acted_at
+        if updates:
+            cur.executemany(f'UPDATE close_contract_actions SET step_seconds = {ph} WHERE id = {ph}', updates)
+
+
+def rebuild_analytics(cur):
+    """Recompute the analytics summary tables from the forms and actions (full scan)."""
+    for table in ('analytics_status_counts', 'analytics_collection_totals', 'analytics_step_time'):
+        cur.execute(f'DELETE FROM {table}')
+    cur.execute('''
+        INSERT INTO analytics_status_counts (status, current_step, n)
+        SELECT COALESCE(status, ''), COALESCE(current_step, ''), COUNT(*)
+        FROM close_contract_forms GROUP BY COALESCE(status, ''), COALESCE(current_step, '')
+    ''')
+    cur.execute('''
+        INSERT INTO analytics_collection_totals (collection_type, n, principal_remaining, principal_willing)
+        SELECT COALESCE(collection_type, ''), COUNT(*), COALESCE(SUM(principal_remaining), 0), COALESCE(SUM(principal_willing), 0)
+        FROM close_contract_forms GROUP BY COALESCE(collection_type, '')
+    ''')
+    cur.execute('''
+        INSERT INTO analytics_step_time (step_key, n, total_seconds)
+        SELECT step_key, COUNT(*), SUM(step_seconds)
+        FROM close_contract_actions WHERE step_seconds IS NOT NULL GROUP BY step_key
+    ''')
+
+
+def _m006_analytics(cur, dialect: str):
+    """Summary tables for the analytics endpoint, maintained by the write paths in app.py."""
+    if dialect == 'mysql':
+        key, num, big = 'VARCHAR(64)', 'DOUBLE', 'BIGINT'
+    else:
+        key, num, big = 'TEXT', 'REAL', 'INTEGER'
+    # NULL status/step/collection_type are stored as '' so they can be part of the primary key
+    cur.execute(f'''
+    CREATE TABLE IF NOT EXISTS analytics_status_counts (
+        status {key} NOT NULL,
+        current_step {key} NOT NULL,
+        n {big} NOT NULL DEFAULT 0,
+        PRIMARY KEY (status, current_step)
+    )
+    ''')
+    cur.execute(f'''
+    CREATE TABLE IF NOT EXISTS analytics_collection_totals (
+        collection_type {'VARCHAR(255)' if dialect == 'mysql' else 'TEXT'} NOT NULL PRIMARY KEY,
+        n {big} NOT NULL DEFAULT 0,
+        principal_remaining {num} NOT NULL DEFAULT 0,
+        principal_willing {num} NOT NULL DEFAULT 0
+    )
+    ''')
+    cur.execute(f'''
+    CREATE TABLE IF NOT EXISTS analytics_step_time (
+        step_key {key} NOT NULL PRIMARY KEY,
+        n {big} NOT NULL DEFAULT 0,
+        total_seconds {num} NOT NULL DEFAULT 0
+    )
+    ''')
+    cur.execute(f'''
+    CREATE TABLE IF NOT EXISTS analytics_step_percentiles (
+        step_key {key} NOT NULL PRIMARY KEY,
+        n {big} NOT NULL DEFAULT 0,
+        p50_seconds {num},
+        p90_seconds {num},
+        p95_seconds {num},
+        max_seconds {num},
+        computed_at {key} NOT NULL
+    )
+    ''')
+    if 'step_seconds' not in table_columns(cur, dialect, 'close_contract_actions'):
+        cur.execute(f'ALTER TABLE close_contract_actions ADD COLUMN step_seconds {num}')
+    _create_index(cur, dialect, 'ix_cca_step_seconds', 'close_contract_actions', 'step_key, step_seconds')
+    _backfill_step_seconds(cur, dialect)
+    rebuild_analytics(cur)
+
+
+def _m007_attachments(cur, dialect: str):
+    """Metadata and reference counts for content-addressed uploads (see attachments.py)."""
+    if dialect == 'mysql':
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            stored_name VARCHAR(96) PRIMARY KEY,
+            sha256 CHAR(64) NOT NULL,
+            size BIGINT NOT NULL,
+            content_type VARCHAR(255),
+            ref_count INT NOT NULL DEFAULT 0,
+            created_at VARCHAR(64) NOT NULL
+        )
+        ''')
+    else:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            stored_name TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        ''')
+    _create_index(cur, dialect, 'ix_attachments_refs', 'attachments', 'ref_count, created_at')
+
+
+def _m008_form_version(cur, dialect: str):
+    """Row version of each form, bumped by every write, for compare-and-swap updates."""
+    if 'version' not in table_columns(cur, dialect, 'close_contract_forms'):
+        cur.execute(f"ALTER TABLE close_contract_forms ADD COLUMN version {'INT' if dialect == 'mysql' else 'INTEGER'} NOT NULL DEFAULT 1")
+
+
+def _m009_fts_update_columns(cur, dialect: str):
+    """Re-index SQLite FTS rows only when an indexed column changes.
+
+    The ``_au`` triggers from 004 fire on every UPDATE, so status, step and
+    version bumps each rewrote the form's FTS entry. MySQL FULLTEXT is left alone.
+    """
+    if dialect == 'mysql':
+        return
+    for table, fts, columns in FULLTEXT_INDEXES:
+        cols = ', '.join(columns)
+        cur.execute(f'DROP TRIGGER IF EXISTS {fts}_au')
+        cur.execute(f'''
+            CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {', '.join(f'old.{c}' for c in columns)});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {', '.join(f'new.{c}' for c in columns)});
+            END
+        ''')
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Any, str], None]]] = [
+    (1, 'base tables', _m001_base_tables),
+    (2, 'listing indexes', _m002_listing_indexes),
+    (3, 'pending work queue', _m003_pending_work),
+    (4, 'full-text search', _m004_fulltext),
+    (5, 'event log', _m005_event_log),
+    (6, 'analytics summaries', _m006_analytics),
+    (7, 'attachment store', _m007_attachments),
+    (8, 'form versions', _m008_form_version),
+    (9, 'FTS update triggers on indexed columns', _m009_fts_update_columns),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(cur, dialect: str):
+    if dialect == 'mysql':
+        cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at VARCHAR(64) NOT NULL
+        )
+        ''')
+    else:
+        cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+
+
+def current_version(conn, dialect: str) -> int:
+    """Highest applied migration version, 0 for a database that was never migrated."""
+    cur = conn.cursor()
+    try:
+        cur.execute(f'SELECT MAX(version) FROM {MIGRATIONS_TABLE}')
+        rows = cur.fetchall()
+    except Exception:
+        # version table missing -> nothing applied yet
+        if dialect != 'mysql':
+            conn.rollback()
+        return 0
+    finally:
+        cur.close()
+    return int(rows[0][0] or 0) if rows else 0
+
+
+def upgrade(conn, dialect: str, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to ``target`` (default: latest); returns applied versions."""
+    target = LATEST_VERSION if target is None else target
+    ph = '%s' if dialect == 'mysql' else '?'
+    applied: List[int] = []
+    cur = conn.cursor()
+    locked = False
+    try:
+        if dialect == 'mysql':
+            # serialize concurrent upgraders (several workers booting at once)
+            cur.execute("SELECT GET_LOCK('schema_migrations', 60)")
+            locked = bool(cur.fetchall()[0][0])
+            if not locked:
+                raise RuntimeError('Timed out waiting for the schema migration lock')
+        else:
+            cur.execute('BEGIN IMMEDIATE')
+        _ensure_version_table(cur, dialect)
+        conn.commit()
+        for version, name, func in MIGRATIONS:
+            if version > target:
+                break
+            if dialect != 'mysql':
+                cur.execute('BEGIN IMMEDIATE')
+            # re-check under the lock: another process may have applied it meanwhile
+            cur.execute(f'SELECT 1 FROM {MIGRATIONS_TABLE} WHERE version = {ph}', (version,))
+            if cur.fetchall():
+                conn.rollback()
+                continue
+            logging.info('Applying schema migration %s: %s', version, name)
+            try:
+                func(cur, dialect)
+                cur.execute(f'INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES ({ph}, {ph}, {ph})', (version, name, _now_iso()))
+                conn.commit()
+            except Exception:
+                # note: MySQL DDL auto-commits, so a failed migration may be partially applied
+                conn.rollback()
+                logging.exception('Schema migration %s (%s) failed', version, name)
+                raise
+            applied.append(version)
+    finally:
+        if locked:
+            cur.execute("SELECT RELEASE_LOCK('schema_migrations')")
+            cur.fetchall()
+        cur.close()
+    return applied
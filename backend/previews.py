@@ -0,0 +1,143 @@
+"""Thumbnails and first-page previews of uploaded images and PDFs.
+
+Variants are JPEGs kept next to the uploads in ``UPLOAD_DIR/.variants/<name>/<size>.jpg``
+and rendered on a small thread pool, so an upload request never waits for
+them. Everything here is optional: without Pillow nothing is rendered and
+callers fall back to the original file. PDFs additionally need PyMuPDF or the
+``pdftoppm`` tool (poppler-utils).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None  # type: ignore[assignment]
+    ImageOps = None  # type: ignore[assignment]
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+VARIANTS_DIR = '.variants'
+# longest edge in pixels
+SIZES: Dict[str, int] = {'thumb': 160, 'small': 480, 'medium': 1024}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+JPEG_QUALITY = 80
+PDFTOPPM = shutil.which('pdftoppm')
+
+
+def enabled() -> bool:
+    return Image is not None
+
+
+def can_render(name: str) -> bool:
+    ext = os.path.splitext(name)[1].lower()
+    if not enabled():
+        return False
+    if ext == '.pdf':
+        return fitz is not None or PDFTOPPM is not None
+    return ext in IMAGE_EXTENSIONS
+
+
+def variant_path(upload_dir: str, name: str, size: str) -> str:
+    return os.path.join(upload_dir, VARIANTS_DIR, name, f'{size}.jpg')
+
+
+def discard(upload_dir: str, name: str):
+    shutil.rmtree(os.path.join(upload_dir, VARIANTS_DIR, name), ignore_errors=True)
+
+
+def _open_pdf_first_page(path: str, max_edge: int):
+    if fitz is not None:
+        with fitz.open(path) as doc:
+            page = doc[0]
+            zoom = max_edge / max(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'page')
+        subprocess.run([PDFTOPPM, '-jpeg', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(max_edge), path, out],
+                       check=True, capture_output=True, timeout=60)
+        with Image.open(out + '.jpg') as img:
+            img.load()
+            return img.copy()
+
+
+def render(upload_dir: str, name: str):
+    """Write every size of ``name``'s variants (largest first, each resized from the previous)."""
+    source = os.path.join(upload_dir, name)
+    largest = max(SIZES.values())
+    if name.lower().endswith('.pdf'):
+        img = _open_pdf_first_page(source, largest)
+    else:
+        with Image.open(source) as opened:
+            # draft() lets the JPEG decoder skip most of the pixels of a phone photo
+            opened.draft('RGB', (largest, largest))
+            img = ImageOps.exif_transpose(opened)
+            img.load()
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    out_dir = os.path.join(upload_dir, VARIANTS_DIR, name)
+    os.makedirs(out_dir, exist_ok=True)
+    for size, edge in sorted(SIZES.items(), key=lambda kv: -kv[1]):
+        img.thumbnail((edge, edge))
+        fd, tmp = tempfile.mkstemp(dir=out_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as fh:
+            img.save(fh, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp, variant_path(upload_dir, name, size))
+
+
+class PreviewPool:
+    """Bounded background renderer; one job per file no matter how often it is requested."""
+
+    def __init__(self, workers: int = 2, max_pending: int = 100):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # threads do not survive fork; each worker process gets its own pool
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='previews')
+            self._pending = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def schedule(self, upload_dir: str, name: str) -> Optional[Future]:
+        """Queue rendering of ``name`` unless it is done, queued already, or the queue is full."""
+        if not can_render(name) or os.path.exists(variant_path(upload_dir, name, 'thumb')):
+            return None
+        key = os.path.join(upload_dir, name)
+        with self._lock:
+            executor = self._get_executor()
+            running = self._pending.get(key)
+            if running is not None:
+                return running
+            if len(self._pending) >= self.max_pending:
+                logging.warning('Preview queue full (%d); %s will be rendered on first request', self.max_pending, name)
+                return None
+            future = executor.submit(self._run, upload_dir, name)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    def _done(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    @staticmethod
+    def _run(upload_dir: str, name: str):
+        try:
+            render(upload_dir, name)
+        except Exception as e:
+            logging.warning('Could not render preview of %s: %s', name, e)
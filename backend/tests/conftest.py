@@ -0,0 +1,73 @@
+"""Each test gets app.py on its own scratch SQLite database.
+
+backend/.env points at MySQL, so the settings below are put in the
+environment with DOTENV_OVERRIDE=0 before app.py is imported.
+"""
+import atexit
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_TMP = tempfile.mkdtemp(prefix='approval-tests-')
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ.update({
+    'DOTENV_OVERRIDE': '0',
+    'DB_TYPE': 'sqlite',
+    'SQLITE_PATH': os.path.join(_TMP, 'import.db'),
+    'SQLITE_PROFILE': 'default',
+    'UPLOAD_DIR': os.path.join(_TMP, 'uploads'),
+    'SECRET_KEY': 'test-secret',
+})
+
+import app as app_module  # noqa: E402
+
+
+def _dispose_pools():
+    for pool in app_module._pools.values():
+        pool.dispose()
+    app_module._pools.clear()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'test.db')
+    monkeypatch.setenv('SQLITE_PATH', db_path)
+    _dispose_pools()
+    for c in app_module._caches:
+        c.clear()
+    app_module.ensure_close_contract_tables()
+    app_module._schema_checked = True
+    app_module.app.config['TEST_DB_PATH'] = db_path
+    yield app_module
+    _dispose_pools()
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    """A separate connection to the test database, for setup behind the app's back and for checks."""
+    conn = sqlite3.connect(app.app.config['TEST_DB_PATH'])
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_form(client):
+    def make(**fields):
+        r = client.post('/api/close-contracts', json={'contract_no': 'T-1', **fields})
+        assert r.status_code == 201, r.get_data(as_text=True)
+        return r.get_json()['item']
+    return make
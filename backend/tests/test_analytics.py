@@ -0,0 +1,12 @@
+"""GET /api/analytics/close-contracts."""
+
+
+def test_status_totals_keys_are_strings(client, db, make_form):
+    make_form()
+    # forms without a status are summarized under an empty key
+    db.execute("INSERT INTO analytics_status_counts (status, current_step, n) VALUES ('', 'credit', 2)")
+    db.commit()
+
+    body = client.get('/api/analytics/close-contracts').get_json()
+
+    assert body['status_totals'] == {'under_review': 1, 'unknown': 2}
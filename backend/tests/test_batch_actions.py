@@ -0,0 +1,104 @@
+"""POST /api/close-contracts/actions:batch."""
+import pytest
+
+CONFLICT = 'The request was changed by someone else; reload it and try again'
+
+
+def _batch(client, *items):
+    r = client.post('/api/close-contracts/actions:batch', json={'items': list(items), 'actor_email': 'approver@example.com'})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return r.get_json()
+
+
+def _actions(db, request_id):
+    return [tuple(r) for r in db.execute(
+        "SELECT step_key, result FROM close_contract_actions WHERE request_id = ? AND result <> 'submitted' ORDER BY id",
+        (request_id,))]
+
+
+def _events(db, request_id):
+    return [tuple(r) for r in db.execute(
+        "SELECT event_type, from_step, to_step FROM close_contract_events "
+        "WHERE request_id = ? AND event_type IN ('approve', 'reject', 'send_back') ORDER BY id",
+        (request_id,))]
+
+
+def _pending(db, request_id):
+    return [r[0] for r in db.execute('SELECT step_key FROM pending_work WHERE request_id = ?', (request_id,))]
+
+
+def _form(db, request_id):
+    return dict(db.execute('SELECT status, current_step, version FROM close_contract_forms WHERE id = ?', (request_id,)).fetchone())
+
+
+def test_several_transitions_on_one_form(client, db, make_form):
+    form = make_form()
+    body = _batch(client, {'id': form['id'], 'result': 'approve'}, {'id': form['id'], 'result': 'approve'})
+
+    assert (body['applied'], body['failed']) == (2, 0)
+    assert [(r['current_step'], r['version']) for r in body['results']] == [('system', 2), ('coo', 3)]
+    assert _form(db, form['id']) == {'status': 'under_review', 'current_step': 'coo', 'version': 3}
+    assert _actions(db, form['id']) == [('credit', 'approve'), ('system', 'approve')]
+    assert _events(db, form['id']) == [('approve', 'credit', 'system'), ('approve', 'system', 'coo')]
+    assert _pending(db, form['id']) == ['coo']
+
+
+def test_final_state_ends_the_queue(client, db, make_form):
+    form = make_form()
+    body = _batch(client, {'id': form['id'], 'result': 'reject'}, {'id': form['id'], 'result': 'approve'})
+
+    assert [r['ok'] for r in body['results']] == [True, False]
+    assert body['results'][1]['error'] == 'Request already finalized'
+    assert _form(db, form['id'])['status'] == 'rejected'
+    assert _actions(db, form['id']) == [('credit', 'reject')]
+    assert _pending(db, form['id']) == []
+
+
+def test_lost_update_only_conflicts_that_form(app, client, db, make_form):
+    raced, other = make_form(), make_form(contract_no='T-2')
+    load_states = app._load_states
+
+    def racing_load_states(conn, request_ids):
+        states = load_states(conn, request_ids)
+        # another writer rejects the form after the batch has read it
+        db.execute("UPDATE close_contract_forms SET status = 'rejected', version = version + 1 WHERE id = ?", (raced['id'],))
+        db.commit()
+        return states
+
+    app._load_states = racing_load_states
+    try:
+        body = _batch(client,
+                      {'id': raced['id'], 'result': 'approve'},
+                      {'id': other['id'], 'result': 'approve'},
+                      {'id': raced['id'], 'result': 'approve'})
+    finally:
+        app._load_states = load_states
+
+    assert (body['applied'], body['failed']) == (1, 2)
+    first, second, third = body['results']
+    assert first == {'index': 0, 'id': raced['id'], 'ok': False, 'conflict': True, 'error': CONFLICT}
+    assert third == {'index': 2, 'id': raced['id'], 'ok': False, 'conflict': True, 'error': CONFLICT}
+    assert second['ok'] and second['current_step'] == 'system'
+
+    # nothing of the raced form's items was written; the other form's rows all were
+    assert _form(db, raced['id']) == {'status': 'rejected', 'current_step': 'credit', 'version': 2}
+    assert _actions(db, raced['id']) == []
+    assert _events(db, raced['id']) == []
+    assert _pending(db, raced['id']) == ['credit']
+    assert _actions(db, other['id']) == [('credit', 'approve')]
+    assert _events(db, other['id']) == [('approve', 'credit', 'system')]
+    assert _pending(db, other['id']) == ['system']
+
+
+@pytest.mark.parametrize('item, error', [
+    ({'id': 999999, 'result': 'approve'}, 'Not found'),
+    ({'id': 'x', 'result': 'approve'}, 'id must be an integer'),
+    ({'result': 'maybe'}, 'id must be an integer'),
+])
+def test_invalid_items_are_skipped(client, db, make_form, item, error):
+    form = make_form()
+    body = _batch(client, item, {'id': form['id'], 'result': 'approve'})
+
+    assert body['results'][0]['error'] == error
+    assert body['results'][1]['ok']
+    assert _actions(db, form['id']) == [('credit', 'approve')]
@@ -0,0 +1,44 @@
+"""metrics.py and the /metrics query series."""
+import threading
+
+import metrics
+
+
+def test_fingerprint_ignores_select_list_and_literals():
+    a = metrics.fingerprint("SELECT id, remark FROM close_contract_forms WHERE status = 'x' AND id IN (?, ?) LIMIT 51")
+    b = metrics.fingerprint("SELECT id, contract_no, status FROM close_contract_forms WHERE status = 'y' AND id IN (?, ?, ?) LIMIT 11")
+    c = metrics.fingerprint('SELECT id FROM close_contract_forms WHERE id = ?')
+
+    assert a == b != c
+    assert a.startswith('select close_contract_forms ')
+    assert metrics.fingerprint('CREATE INDEX idx ON users (email)') == 'create'
+
+
+def test_histogram_series_cap_holds_under_concurrent_first_observations():
+    hist = metrics.Histogram('h', 'test', ('query',), max_series=5)
+    start = threading.Barrier(20)
+
+    def observe(i):
+        start.wait()
+        hist.observe(0.1, query=f'q{i}')
+
+    threads = [threading.Thread(target=observe, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # five real series plus the "other" overflow series
+    assert len(hist._values) == 6
+    assert hist._values[('other',)][2] == 15
+
+
+def test_metrics_maps_query_labels_to_sql(client, make_form):
+    make_form()
+    client.get('/api/close-contracts?limit=5&fields=remark')
+
+    body = client.get('/metrics').get_data(as_text=True)
+
+    label = metrics.fingerprint('SELECT remark FROM close_contract_forms ORDER BY created_at DESC, id DESC LIMIT 6')
+    assert f'db_query_duration_seconds_count{{query="{label}"}}' in body
+    assert f'db_query_info{{query="{label}",sql="SELECT ... FROM close_contract_forms ORDER BY created_at DESC, id DESC LIMIT ?"}} 1' in body
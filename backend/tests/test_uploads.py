@@ -0,0 +1,23 @@
+"""`flask uploads dedupe`."""
+import json
+import os
+
+
+def test_dedupe_bumps_forms_whose_action_urls_changed(app, client, db, make_form):
+    form = make_form()
+    legacy = 'a1b2c3_scan.pdf'
+    with open(os.path.join(app.UPLOAD_DIR, legacy), 'wb') as f:
+        f.write(b'%PDF legacy scan')
+    db.execute("UPDATE close_contract_actions SET attachments = ? WHERE request_id = ?",
+               (json.dumps([f'/uploads/{legacy}']), form['id']))
+    db.commit()
+    etag = client.get(f"/api/close-contracts/{form['id']}").headers['ETag']
+
+    result = app.app.test_cli_runner().invoke(args=['uploads', 'dedupe'])
+
+    assert result.exit_code == 0, result.output
+    urls = json.loads(db.execute('SELECT attachments FROM close_contract_actions WHERE request_id = ?', (form['id'],)).fetchone()[0])
+    assert urls != [f'/uploads/{legacy}']
+    assert db.execute('SELECT version FROM close_contract_forms WHERE id = ?', (form['id'],)).fetchone()[0] == form['version'] + 1
+    r = client.get(f"/api/close-contracts/{form['id']}", headers={'If-None-Match': etag})
+    assert r.status_code == 200
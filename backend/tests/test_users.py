@@ -0,0 +1,40 @@
+"""Login and token checks against changed or deleted users."""
+import pytest
+
+
+@pytest.fixture
+def user(app, db):
+    from werkzeug.security import generate_password_hash
+    db.execute("INSERT INTO users (email, password_hash, role, first_name, last_name) VALUES (?, ?, 'staff', 'T', 'User')",
+               ('user@example.com', generate_password_hash('old-pass')))
+    db.commit()
+    return db.execute("SELECT id FROM users WHERE email = 'user@example.com'").fetchone()[0]
+
+
+def _login(client, **body):
+    return client.post('/api/login', json=body)
+
+
+def test_password_changed_elsewhere_takes_effect_at_once(client, db, user):
+    from werkzeug.security import generate_password_hash
+    r = _login(client, email='user@example.com', password='old-pass')
+    assert r.status_code == 200
+    token = r.get_json()['token']
+
+    # another worker changes the password: this process's cache is not told
+    db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (generate_password_hash('new-pass'), user))
+    db.commit()
+
+    assert _login(client, email='user@example.com', password='old-pass').status_code == 401
+    assert _login(client, token=token).status_code == 401
+    assert _login(client, email='user@example.com', password='new-pass').status_code == 200
+
+
+def test_user_deleted_elsewhere_cannot_log_in(client, db, user):
+    token = _login(client, email='user@example.com', password='old-pass').get_json()['token']
+
+    db.execute('DELETE FROM users WHERE id = ?', (user,))
+    db.commit()
+
+    assert _login(client, token=token).status_code == 401
+    assert _login(client, email='user@example.com', password='old-pass').status_code == 401
@@ -0,0 +1,106 @@
+"""Form versions: If-Match / expected_version on PATCH, action and batch."""
+CONFLICT = 'The request was changed by someone else; reload it and try again'
+
+
+def _version(db, request_id):
+    return db.execute('SELECT version FROM close_contract_forms WHERE id = ?', (request_id,)).fetchone()[0]
+
+
+def _action_count(db, request_id):
+    return db.execute("SELECT COUNT(*) FROM close_contract_actions WHERE request_id = ? AND result = 'approve'", (request_id,)).fetchone()[0]
+
+
+def test_patch_bumps_version(client, db, make_form):
+    form = make_form()
+    assert form['version'] == 1
+    etag = client.get(f"/api/close-contracts/{form['id']}").headers['ETag']
+
+    r = client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'first', 'skip_reset': True})
+    assert r.status_code == 200
+    assert r.get_json()['item']['version'] == 2
+    r = client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'second'}, headers={'If-Match': '"2"'})
+    assert r.status_code == 200
+    assert r.get_json()['item']['version'] == 3
+    assert client.get(f"/api/close-contracts/{form['id']}", headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_patch_with_stale_if_match_is_409(client, db, make_form):
+    form = make_form()
+    client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'someone else'})
+
+    r = client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'mine'}, headers={'If-Match': '"1"'})
+
+    assert r.status_code == 409
+    assert r.get_json() == {'error': CONFLICT, 'version': 2}
+    assert db.execute('SELECT remark FROM close_contract_forms WHERE id = ?', (form['id'],)).fetchone()[0] == 'someone else'
+
+
+def test_if_match_star_and_malformed(client, make_form):
+    form = make_form()
+    r = client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'x'}, headers={'If-Match': '*'})
+    assert r.status_code == 200
+    r = client.patch(f"/api/close-contracts/{form['id']}", json={'remark': 'y', 'expected_version': 'two'})
+    assert r.status_code == 400
+
+
+def test_second_action_on_the_same_version_is_409(client, db, make_form):
+    form = make_form()
+    url = f"/api/close-contracts/{form['id']}/action"
+
+    first = client.post(url, json={'result': 'approve'}, headers={'If-Match': '"1"'})
+    second = client.post(url, json={'result': 'approve'}, headers={'If-Match': '"1"'})
+
+    assert first.status_code == 200
+    assert first.get_json()['item']['version'] == 2
+    assert second.status_code == 409
+    assert second.get_json() == {'error': CONFLICT, 'version': 2}
+    assert _action_count(db, form['id']) == 1
+
+
+def test_concurrent_action_on_the_same_step_is_409(app, client, db, make_form):
+    form = make_form()
+    url = f"/api/close-contracts/{form['id']}/action"
+    load_states = app._load_states
+    conn = app.get_conn()
+    try:
+        stale_states = [load_states(conn, [form['id']])]
+    finally:
+        conn.close()
+
+    def stale_load_states(conn, request_ids):
+        # the second approver read the form before the first one's action committed
+        return stale_states.pop() if stale_states else load_states(conn, request_ids)
+
+    assert client.post(url, json={'result': 'approve'}).status_code == 200
+    app._load_states = stale_load_states
+    try:
+        r = client.post(url, json={'result': 'approve'})
+    finally:
+        app._load_states = load_states
+
+    assert r.status_code == 409
+    assert r.get_json()['version'] == 2
+    assert _action_count(db, form['id']) == 1
+    assert db.execute('SELECT current_step FROM close_contract_forms WHERE id = ?', (form['id'],)).fetchone()[0] == 'system'
+
+
+def test_batch_with_mixed_expected_versions(client, db, make_form):
+    current, stale, bad = make_form(), make_form(contract_no='T-2'), make_form(contract_no='T-3')
+    client.patch(f"/api/close-contracts/{stale['id']}", json={'remark': 'edited', 'skip_reset': True})
+
+    r = client.post('/api/close-contracts/actions:batch', json={'items': [
+        {'id': current['id'], 'result': 'approve', 'expected_version': 1},
+        {'id': current['id'], 'result': 'approve', 'expected_version': 2},
+        {'id': stale['id'], 'result': 'approve', 'expected_version': 1},
+        {'id': bad['id'], 'result': 'approve', 'expected_version': 'x'},
+        {'id': bad['id'], 'result': 'approve'},
+    ]})
+
+    assert r.status_code == 200
+    results = r.get_json()['results']
+    assert [x['ok'] for x in results] == [True, True, False, False, True]
+    assert [results[0]['version'], results[1]['version'], results[4]['version']] == [2, 3, 2]
+    assert results[2] == {'index': 2, 'id': stale['id'], 'ok': False, 'conflict': True, 'version': 2, 'error': CONFLICT}
+    assert 'expected_version' in results[3]['error']
+    assert (_version(db, current['id']), _version(db, stale['id']), _version(db, bad['id'])) == (3, 2, 2)
+    assert (_action_count(db, current['id']), _action_count(db, stale['id']), _action_count(db, bad['id'])) == (2, 0, 1)
@@ -712,6 +712,20 @@ class _ApprovalsPageState extends State<ApprovalsPage> {
                                     Padding(
                                       padding: const EdgeInsets.only(bottom: 6.0),
                                       child: Row(children: [
+                                        if (_isImageAttachment(u))
+                                          Padding(
+                                            padding: const EdgeInsets.only(right: 8.0),
+                                            child: ClipRRect(
+                                              borderRadius: BorderRadius.circular(4),
+                                              child: Image.network(
+                                                _attachmentVariantUrl(u, 'thumb'),
+                                                width: 48,
+                                                height: 48,
+                                                fit: BoxFit.cover,
+                                                errorBuilder: (c, e, s) => const Icon(Icons.image_not_supported, size: 24),
+                                              ),
+                                            ),
+                                          ),
                                         Expanded(child: SelectableText(_attachmentLabel(u), maxLines: 2, style: const TextStyle(color: Colors.blue))),
                                         const SizedBox(width: 8),
                                         IconButton(
@@ -1233,6 +1247,19 @@ class _ApprovalsPageState extends State<ApprovalsPage> {
     return [];
   }
 
+  bool _isImageAttachment(String url) {
+    final low = url.split('?').first.split('/').last.toLowerCase();
+    final ext = low.contains('.') ? low.split('.').last : '';
+    return ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'].contains(ext);
+  }
+
+  // Server-rendered JPEG of at most thumb=160px, small=480px, medium=1024px (falls back to the original).
+  String _attachmentVariantUrl(String raw, String size) {
+    final full = _normalizeAttachmentUrl(raw);
+    if (!full.contains('/uploads/')) return full;
+    return '$full${full.contains('?') ? '&' : '?'}size=$size';
+  }
+
   String _attachmentLabel(String url) {
     try {
       final u = Uri.tryParse(url);
@@ -1419,7 +1446,7 @@ class _ApprovalsPageState extends State<ApprovalsPage> {
           insetPadding: const EdgeInsets.all(16),
           child: InteractiveViewer(
             child: Image.network(
-              full,
+              _attachmentVariantUrl(rawUrl, 'medium'),
               fit: BoxFit.contain,
               errorBuilder: (c, e, s) => const Padding(padding: EdgeInsets.all(16), child: Text('Failed to load image')),
             ),
@@ -1578,6 +1605,8 @@ class _ApprovalsPageState extends State<ApprovalsPage> {
         try {
           final updatedItem = await CloseContractApi.updateRequest(reqId, payload: {'skip_reset': '1'}, attachment: file);
           uploadedUrls.addAll(_extractAttachmentUrls(updatedItem));
+          // the upload bumped the request's version; act on the fresh copy
+          if (mounted && _selectedCase?['id'] == updatedItem['id']) setState(() { _selectedCase = updatedItem; });
         } catch (e) {
           if (!mounted) return;
           ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text('Attachment upload failed: $e')));
@@ -1615,7 +1644,7 @@ class _ApprovalsPageState extends State<ApprovalsPage> {
       int? actorId;
       try { actorId = int.tryParse((user['id'] ?? user['actor_id'] ?? '').toString()); } catch (_) {}
 
-      final updated = await CloseContractApi.actOnRequest(reqId, result: result, comment: comment?.isEmpty ?? true ? null : comment, actorEmail: actorEmail.isEmpty ? null : actorEmail, actorId: actorId, actorName: actorName.isEmpty ? null : actorName, attachmentUrls: attachmentUrls);
+      final updated = await CloseContractApi.actOnRequest(reqId, result: result, comment: comment?.isEmpty ?? true ? null : comment, actorEmail: actorEmail.isEmpty ? null : actorEmail, actorId: actorId, actorName: actorName.isEmpty ? null : actorName, attachmentUrls: attachmentUrls, current: _selectedCase);
                         if (!mounted) {
                           return;
                         }
@@ -180,7 +180,8 @@ class _CloseContractApprovalPageState extends State<CloseContractApprovalPage> {
           reqId = int.tryParse(id);
         }
         if (reqId == null) throw Exception('Invalid request id for update');
-        final item = await CloseContractApi.updateRequest(reqId, payload: payload, attachment: _attachment);
+        final version = _currentRequest!['version'];
+        final item = await CloseContractApi.updateRequest(reqId, payload: payload, attachment: _attachment, expectedVersion: version is int ? version : null);
         setState(() => _currentRequest = item);
         if (!mounted) return;
         ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Resubmitted')));
@@ -236,6 +237,7 @@ class _CloseContractApprovalPageState extends State<CloseContractApprovalPage> {
         actorId: (_user?['id'] is int) ? (_user?['id'] as int) : int.tryParse(_user?['id']?.toString() ?? ''),
         actorName: "${_user?['first_name'] ?? ''} ${_user?['last_name'] ?? ''}".trim(),
         actorRole: _user?['role']?.toString(),
+        current: _currentRequest,
       );
       setState(() => _currentRequest = updated);
       await _refreshTodo();
@@ -1,4 +1,6 @@
 import 'dart:convert';
+import 'dart:io' show File, RandomAccessFile;
+import 'dart:math' show min;
 import 'package:file_picker/file_picker.dart';
 import 'package:flutter/foundation.dart' show kIsWeb, defaultTargetPlatform, TargetPlatform;
 import 'package:http/http.dart' as http;
@@ -9,31 +11,55 @@ String _apiHost() {
       : (defaultTargetPlatform == TargetPlatform.android ? 'http://10.0.2.2:5000' : 'http://localhost:5000');
 }
 
+class _CachedResponse {
+  final String etag;
+  final String body;
+  const _CachedResponse(this.etag, this.body);
+}
+
 class CloseContractApi {
+  // Last ETag + body per GET url; polling sends If-None-Match and reuses the body on 304.
+  static final Map<String, _CachedResponse> _etagCache = {};
+
+  // Attachments at least this large go through the resumable /api/uploads protocol.
+  static const int _chunkedUploadThreshold = 4 * 1024 * 1024;
+  static const int _uploadChunkSize = 1024 * 1024;
+
   static Uri _uri(String path, [Map<String, String>? query]) {
     return Uri.parse('${_apiHost()}$path').replace(queryParameters: query);
   }
 
+  static Future<String> _getWithEtag(Uri uri, String what) async {
+    final key = uri.toString();
+    final cached = _etagCache[key];
+    final resp = await http.get(uri, headers: {if (cached != null) 'If-None-Match': cached.etag});
+    if (resp.statusCode == 304 && cached != null) {
+      return cached.body;
+    }
+    if (resp.statusCode != 200) {
+      throw Exception('Failed to load $what: ${resp.body}');
+    }
+    final etag = resp.headers['etag'];
+    if (etag != null) {
+      _etagCache[key] = _CachedResponse(etag, resp.body);
+    }
+    return resp.body;
+  }
+
   static Future<List<Map<String, dynamic>>> listRequests({String? role, String? createdByEmail, bool includeActions = false}) async {
     final query = <String, String>{};
     if (role != null && role.isNotEmpty) query['role'] = role;
     if (createdByEmail != null && createdByEmail.isNotEmpty) query['created_by_email'] = createdByEmail;
     if (includeActions) query['include_actions'] = '1';
-    final resp = await http.get(_uri('/api/close-contracts', query));
-    if (resp.statusCode != 200) {
-      throw Exception('Failed to load requests: ${resp.body}');
-    }
-    final data = json.decode(resp.body) as Map<String, dynamic>;
+    final body = await _getWithEtag(_uri('/api/close-contracts', query), 'requests');
+    final data = json.decode(body) as Map<String, dynamic>;
     final items = (data['items'] as List<dynamic>? ?? []).cast<Map<String, dynamic>>();
     return items;
   }
 
   static Future<Map<String, dynamic>> getRequest(int id) async {
-    final resp = await http.get(_uri('/api/close-contracts/$id'));
-    if (resp.statusCode != 200) {
-      throw Exception('Failed to load request: ${resp.body}');
-    }
-    final data = json.decode(resp.body) as Map<String, dynamic>;
+    final body = await _getWithEtag(_uri('/api/close-contracts/$id'), 'request');
+    final data = json.decode(body) as Map<String, dynamic>;
     return (data['item'] as Map<String, dynamic>?) ?? {};
   }
 
@@ -62,7 +88,53 @@ class CloseContractApi {
     return (data['comment'] as Map<String, dynamic>?) ?? {};
   }
 
+  // Upload in chunks that a dropped connection does not invalidate: after a failure the
+  // server's offset is read back and sending resumes from there. Returns the attachment_url.
+  static Future<String> uploadAttachment(PlatformFile file, {int maxRetries = 5}) async {
+    final created = await http.post(_uri('/api/uploads'), headers: {'Content-Type': 'application/json'}, body: json.encode({'filename': file.name, 'length': file.size}));
+    if (created.statusCode != 201) {
+      throw Exception('Upload failed: ${created.body}');
+    }
+    final uploadId = (json.decode(created.body) as Map<String, dynamic>)['upload_id'];
+    final sessionUri = _uri('/api/uploads/$uploadId');
+    final RandomAccessFile? raf = file.bytes == null ? await File(file.path!).open() : null;
+    var offset = 0;
+    var failures = 0;
+    try {
+      while (offset < file.size) {
+        final end = min(offset + _uploadChunkSize, file.size);
+        final chunk = file.bytes != null ? file.bytes!.sublist(offset, end) : await (await raf!.setPosition(offset)).read(end - offset);
+        try {
+          final resp = await http.patch(sessionUri, headers: {'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': '$offset'}, body: chunk);
+          // 409: the server has a different offset (e.g. an earlier chunk did arrive); continue from there
+          if (resp.statusCode != 200 && resp.statusCode != 409) {
+            throw Exception('Upload failed: ${resp.body}');
+          }
+          offset = int.parse(resp.headers['upload-offset'] ?? '$end');
+          failures = 0;
+        } on http.ClientException {
+          if (++failures > maxRetries) rethrow;
+          await Future<void>.delayed(Duration(seconds: 1 << failures));
+          final head = await http.head(sessionUri);
+          if (head.statusCode != 200) rethrow;
+          offset = int.parse(head.headers['upload-offset'] ?? '$offset');
+        }
+      }
+    } finally {
+      await raf?.close();
+    }
+    final resp = await http.post(_uri('/api/uploads/$uploadId/commit'));
+    if (resp.statusCode != 200) {
+      throw Exception('Upload failed: ${resp.body}');
+    }
+    return (json.decode(resp.body) as Map<String, dynamic>)['attachment_url'] as String;
+  }
+
   static Future<Map<String, dynamic>> createRequest({required Map<String, dynamic> payload, PlatformFile? attachment}) async {
+    if (attachment != null && !kIsWeb && attachment.size >= _chunkedUploadThreshold) {
+      final url = await uploadAttachment(attachment);
+      return createRequest(payload: {...payload, 'attachment_url': url});
+    }
     http.BaseRequest request;
     if (attachment != null) {
       final req = http.MultipartRequest('POST', _uri('/api/close-contracts'));
@@ -88,7 +160,13 @@ class CloseContractApi {
     return (data['item'] as Map<String, dynamic>?) ?? {};
   }
 
-  static Future<Map<String, dynamic>> updateRequest(int id, {required Map<String, dynamic> payload, PlatformFile? attachment}) async {
+  // With [expectedVersion] (the request's `version` as last loaded) the server only applies the
+  // edit if nobody changed the request since, and answers 409 otherwise.
+  static Future<Map<String, dynamic>> updateRequest(int id, {required Map<String, dynamic> payload, PlatformFile? attachment, int? expectedVersion}) async {
+    if (attachment != null && !kIsWeb && attachment.size >= _chunkedUploadThreshold) {
+      final url = await uploadAttachment(attachment);
+      return updateRequest(id, payload: {...payload, 'attachment_url': url}, expectedVersion: expectedVersion);
+    }
     http.BaseRequest request;
     final uri = _uri('/api/close-contracts/$id');
     if (attachment != null) {
@@ -105,6 +183,9 @@ class CloseContractApi {
         ..headers['Content-Type'] = 'application/json'
         ..body = json.encode(payload);
     }
+    if (expectedVersion != null) {
+      request.headers['If-Match'] = '"$expectedVersion"';
+    }
 
     final streamed = await request.send();
     final resp = await http.Response.fromStream(streamed);
@@ -115,7 +196,11 @@ class CloseContractApi {
     return (data['item'] as Map<String, dynamic>?) ?? {};
   }
 
-  static Future<Map<String, dynamic>> actOnRequest(int id, {required String result, String? comment, String? actorEmail, int? actorId, String? actorName, String? actorRole, List<String>? attachmentUrls}) async {
+  // The server answers with only what changed (new status/step plus the recorded action). When
+  // [current] already holds the request with its actions, that delta is merged into it; otherwise
+  // the full request is asked for with ?full=1. The action is checked against the version of
+  // [current]; a 409 means someone else acted on or edited the request first.
+  static Future<Map<String, dynamic>> actOnRequest(int id, {required String result, String? comment, String? actorEmail, int? actorId, String? actorName, String? actorRole, List<String>? attachmentUrls, Map<String, dynamic>? current}) async {
     final body = {
       'result': result,
       if (comment != null) 'comment': comment,
@@ -125,11 +210,25 @@ class CloseContractApi {
       if (actorRole != null) 'actor_role': actorRole,
       if (attachmentUrls != null && attachmentUrls.isNotEmpty) 'attachment_urls': attachmentUrls,
     };
-    final resp = await http.post(_uri('/api/close-contracts/$id/action'), headers: {'Content-Type': 'application/json'}, body: json.encode(body));
+    final merge = current != null && current['id'] == id && current['actions'] is List;
+    final version = current != null && current['id'] == id ? current['version'] : null;
+    final resp = await http.post(
+      _uri('/api/close-contracts/$id/action', merge ? null : {'full': '1'}),
+      headers: {'Content-Type': 'application/json', if (version != null) 'If-Match': '"$version"'},
+      body: json.encode(body),
+    );
     if (resp.statusCode != 200) {
       throw Exception('Action failed: ${resp.body}');
     }
     final data = json.decode(resp.body) as Map<String, dynamic>;
-    return (data['item'] as Map<String, dynamic>?) ?? {};
+    final item = (data['item'] as Map<String, dynamic>?) ?? {};
+    if (!merge) {
+      return item;
+    }
+    return {
+      ...current!,
+      ...item,
+      'actions': [...(current['actions'] as List), if (data['action'] != null) data['action']],
+    };
   }
 }